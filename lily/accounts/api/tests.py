@@ -1,12 +1,12 @@
 from lily.tenant.factories import TenantFactory
-from lily.tests.utils import GenericAPITestCase
+from lily.tests.utils import EagerLoadingApiTestCase, GenericAPITestCase
 
 from ..factories import AccountFactory, AccountStatusFactory, WebsiteFactory
 from ..models import Account
 from .serializers import AccountSerializer
 
 
-class AccountTests(GenericAPITestCase):
+class AccountTests(EagerLoadingApiTestCase, GenericAPITestCase):
     """
     Class containing tests for the accounts API.
 
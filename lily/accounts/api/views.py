@@ -7,7 +7,7 @@ from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet
 
 from lily.api.filters import ElasticSearchFilter
-from lily.api.mixins import ModelChangesMixin, DataExistsMixin
+from lily.api.mixins import BulkMixin, ModelChangesMixin, DataExistsMixin, EagerLoadingMixin
 from lily.calls.api.serializers import CallRecordSerializer
 from lily.calls.models import CallRecord
 from lily.utils.models.models import PhoneNumber
@@ -42,7 +42,7 @@ class AccountFilter(filters.FilterSet):
         }
 
 
-class AccountViewSet(ModelChangesMixin, DataExistsMixin, ModelViewSet):
+class AccountViewSet(BulkMixin, ModelChangesMixin, DataExistsMixin, EagerLoadingMixin, ModelViewSet):
     """
     Accounts are companies you've had contact with and for which you wish to store information.
 
@@ -66,6 +66,9 @@ class AccountViewSet(ModelChangesMixin, DataExistsMixin, ModelViewSet):
 
     changes:
     Returns all the changes performed on the given account.
+
+    bulk:
+    Creates or updates a list of accounts at once.
     """
     # Set the queryset, without .all() this filters on the tenant and takes care of setting the `base_name`.
     queryset = Account.objects
@@ -10,6 +10,19 @@ from .models import Account
 
 
 class AccountMapping(BaseMapping):
+    batch_select_related = (
+        'assigned_to',
+        'status',
+    )
+    batch_prefetch_related = (
+        'addresses',
+        'email_addresses',
+        'phone_numbers',
+        'social_media',
+        'tags',
+        'websites',
+    )
+
     @classmethod
     def get_model(cls):
         return Account
@@ -141,6 +154,13 @@ class AccountMapping(BaseMapping):
         })
         return mapping
 
+    @classmethod
+    def get_indexed_fields(cls):
+        """
+        The fields of the model used in the documents, the modified date alone doesn't need a reindex.
+        """
+        return {'assigned_to', 'customer_id', 'description', 'is_deleted', 'name', 'status'}
+
     @classmethod
     def get_related_models(cls):
         """
@@ -158,22 +178,6 @@ class AccountMapping(BaseMapping):
             # LilyUser: lambda obj: obj.account_set.all(),
         }
 
-    @classmethod
-    def prepare_batch(cls, queryset):
-        """
-        Optimize a queryset for batch indexing.
-        """
-        return queryset.prefetch_related(
-            'tags',
-            'email_addresses',
-            'phone_numbers',
-            'social_media',
-            'websites',
-            'addresses',
-            'functions__contact',
-            'assigned_to',
-        )
-
     @classmethod
     def obj_to_doc(cls, obj):
         """
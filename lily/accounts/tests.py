@@ -2,6 +2,7 @@ import time
 from django.test import TestCase
 
 from lily.accounts.factories import AccountFactory
+from lily.accounts.models import Account
 from lily.tenant.factories import TenantFactory
 
 
@@ -21,3 +22,17 @@ class AccountTests(TestCase):
 
         account.save(update_modified=True)
         self.assertNotEqual(modified, account.modified)
+
+    def test_changed_fields(self):
+        """
+        Test that only the fields which differ from the database are changed.
+        """
+        tenant = TenantFactory.create()
+        account = Account.objects.get(pk=AccountFactory.create(tenant=tenant).pk)
+        self.assertEqual(account.get_changed_fields(), set())
+
+        account.name = 'Changed name'
+        self.assertEqual(account.get_changed_fields(), {'name'})
+
+        account.save()
+        self.assertEqual(account.get_changed_fields(), set())
@@ -1,15 +1,212 @@
+import base64
+import json
 from collections import OrderedDict
 
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections
+from django.db.models import Q
 from rest_framework import pagination
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class CustomPagination(pagination.PageNumberPagination):
+    """
+    Page number pagination with an opt-in keyset mode.
+
+    When the request contains the cursor parameter (an empty value for the first page) the list is paginated by
+    the first ordering field and the id instead of an offset. The pages are linked with opaque cursors and no count
+    is done, unless `total=estimate` is requested which returns the row estimate of the query planner.
+
+    Full text searches are ordered by relevance, which isn't a keyset, so they can't be combined with a cursor.
+    """
     page_size = 100  # The default page size.
     page_size_query_param = 'page_size'  # The query param used to custom define a page size per request.
     max_page_size = 200  # The hard limit for page size.
+    cursor_query_param = 'cursor'  # The query param used to request the keyset mode.
+    total_query_param = 'total'  # The query param used to request an estimated total in keyset mode.
+
+    keyset = False
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param not in request.query_params:
+            return super(CustomPagination, self).paginate_queryset(queryset, request, view=view)
+
+        if getattr(queryset, 'has_full_text_search', False):
+            raise ValidationError({
+                self.cursor_query_param: ['Cursor pagination is not supported in combination with a search.'],
+            })
+
+        self.keyset = True
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.order_field, self.descending = self.get_keyset_ordering(queryset)
+
+        cursor = self.decode_cursor(request.query_params[self.cursor_query_param])
+        reverse = cursor.get('reverse', False) if cursor else False
+
+        # Going back walks the list the other way around and flips the page afterwards.
+        descending = self.descending != reverse
+        queryset = self.order_keyset(queryset, descending)
+        if cursor:
+            queryset = queryset.filter(self.get_keyset_filter(cursor, descending))
+
+        if request.query_params.get(self.total_query_param) == 'estimate':
+            self.total = self.estimate_count(queryset)
+        else:
+            self.total = None
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+
+        self.page_results = results
+
+        return results
+
+    def get_keyset_ordering(self, queryset):
+        """
+        Return the name of the field the keyset is ordered by and if it's ordered descending.
+
+        Only the first ordering field is used, the id decides the order between objects with the same value.
+        Orderings which don't start with a field of the model itself are paginated by id.
+        """
+        ordering = queryset.query.order_by or queryset.model._meta.ordering
+        model_meta = queryset.model._meta
+
+        if ordering and isinstance(ordering[0], basestring):
+            descending = ordering[0].startswith('-')
+            name = ordering[0].lstrip('-')
+
+            if name == 'pk':
+                return model_meta.pk, descending
+
+            try:
+                field = model_meta.get_field(name)
+            except FieldDoesNotExist:
+                pass
+            else:
+                if field.concrete and not field.is_relation:
+                    return field, descending
+
+        return model_meta.pk, False
+
+    def order_keyset(self, queryset, descending):
+        prefix = '-' if descending else ''
+        order_by = [prefix + self.order_field.name]
+
+        if not self.order_field.primary_key:
+            order_by.append(prefix + 'pk')
+
+        return queryset.order_by(*order_by)
+
+    def get_keyset_filter(self, cursor, descending):
+        """
+        Return the filter for all objects after the cursor.
+
+        Postgres puts null values last when ordering ascending and first when ordering descending.
+        """
+        name = self.order_field.name
+        pk = cursor['pk']
+
+        if self.order_field.primary_key:
+            return Q(pk__lt=pk) if descending else Q(pk__gt=pk)
+
+        value = cursor['value']
+        if value is not None:
+            value = self.order_field.to_python(value)
+
+        if descending:
+            if value is None:
+                return Q(**{name + '__isnull': True, 'pk__lt': pk}) | Q(**{name + '__isnull': False})
+            return Q(**{name + '__lt': value}) | Q(**{name: value, 'pk__lt': pk})
+
+        if value is None:
+            return Q(**{name + '__isnull': True, 'pk__gt': pk})
+        return Q(**{name + '__gt': value}) | Q(**{name: value, 'pk__gt': pk}) | Q(**{name + '__isnull': True})
+
+    def estimate_count(self, queryset):
+        """
+        Return the number of rows the query planner expects, which comes from the table statistics.
+        """
+        sql, params = queryset.query.sql_with_params()
+
+        with connections[queryset.db].cursor() as cursor:
+            cursor.execute('EXPLAIN (FORMAT JSON) %s' % sql, params)
+            plan = cursor.fetchone()[0]
+
+        if isinstance(plan, basestring):
+            plan = json.loads(plan)
+
+        return plan[0]['Plan']['Plan Rows']
+
+    def encode_cursor(self, instance, reverse):
+        value = getattr(instance, self.order_field.attname)
+        if value is not None and not self.order_field.primary_key:
+            value = self.order_field.value_to_string(instance)
+
+        data = {
+            'pk': instance.pk,
+            'value': value,
+            'reverse': reverse,
+        }
+
+        return base64.urlsafe_b64encode(json.dumps(data))
+
+    def decode_cursor(self, encoded):
+        if not encoded:
+            return None
+
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(str(encoded)))
+            cursor['pk'] = int(cursor['pk'])
+        except (TypeError, ValueError, KeyError):
+            raise NotFound('Invalid cursor.')
+
+        return cursor
+
+    def get_next_cursor(self):
+        if not self.has_next or not self.page_results:
+            return None
+        return self.encode_cursor(self.page_results[-1], reverse=False)
+
+    def get_previous_cursor(self):
+        if not self.has_previous or not self.page_results:
+            return None
+        return self.encode_cursor(self.page_results[0], reverse=True)
+
+    def get_cursor_link(self, cursor):
+        if cursor is None:
+            return None
+        return replace_query_param(remove_query_param(self.base_url, 'page'), self.cursor_query_param, cursor)
 
     def get_paginated_response(self, data):
+        if self.keyset:
+            next_cursor = self.get_next_cursor()
+            previous_cursor = self.get_previous_cursor()
+
+            return Response(OrderedDict([
+                ('pagination', OrderedDict([
+                    ('total', self.total),  # Estimated number of objects, only when requested.
+                    ('page_size', self.page_size),  # The current page size used.
+                    ('number_of_pages', None),  # Unknown without a count.
+                    ('current_page', None),  # Unknown without a count.
+                    ('next_page', self.get_cursor_link(next_cursor)),  # The link to the next page.
+                    ('prev_page', self.get_cursor_link(previous_cursor)),  # The link to the previous page.
+                    ('next_cursor', next_cursor),  # The cursor of the next page.
+                    ('prev_cursor', previous_cursor),  # The cursor of the previous page.
+                ])),
+                ('results', data),  # Object list with all objects on the current page.
+            ]))
+
         return Response(OrderedDict([
             ('pagination', OrderedDict([
                 ('total', self.page.paginator.count),  # Total number of objects, not only current page.
@@ -1,8 +1,15 @@
+import copy
 import json
 
 from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import FieldDoesNotExist
+from django.db import transaction
+from rest_framework import status
 from rest_framework.decorators import detail_route, list_route
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.relations import PrimaryKeyRelatedField
 from rest_framework.response import Response
+from rest_framework.serializers import BaseSerializer, ListSerializer
 from django_elasticsearch_dsl.actions import ActionBuffer
 
 from lily.changes.models import Change
@@ -13,6 +20,108 @@ from lily.notes.api.serializers import NoteSerializer
 from lily.timelogs.api.serializers import TimeLogSerializer
 from lily.utils.functions import format_phone_number
 
+SOCIAL_MEDIA_NAMES = dict(SocialMedia.SOCIAL_NAME_CHOICES).keys()
+
+
+def get_change_data(old_data, new_data, request_data):
+    """
+    Compare the serialized data of an object before and after an update.
+
+    Returns:
+        dict: the old and new value of every changed field that was part of the request.
+    """
+    ignored_fields = ['modified', 'id', 'full_name']
+
+    # Social media fields are saved in a 'special' way.
+    # Since we want to show changes per social media type we split all the data.
+    if 'social_media' in request_data:
+        for item in old_data.get('social_media'):
+            social_type = item.get('name')
+
+            if social_type not in old_data:
+                old_data[social_type] = []
+
+            old_data[social_type].append(item)
+
+        del old_data['social_media']
+
+        for item in new_data.get('social_media'):
+            social_type = item.get('name')
+
+            if social_type not in new_data:
+                new_data[social_type] = []
+
+            new_data[social_type].append(item)
+
+        del new_data['social_media']
+
+        for key in SOCIAL_MEDIA_NAMES:
+            if key in old_data and key not in new_data:
+                new_data[key] = []
+            elif key in new_data and key not in old_data:
+                old_data[key] = []
+
+    data = {}
+    # Compare old and new data and store those keys.
+    diffkeys = [k for k in old_data if old_data.get(k) != new_data.get(k)]
+
+    for key in diffkeys:
+        is_social_media = (key in SOCIAL_MEDIA_NAMES)
+
+        if key in request_data or is_social_media:
+            # We don't want to display an ID in the change log,
+            # so fetch the display name if possible.
+            choice_field_name = key + '_display'
+
+            if choice_field_name in old_data:
+                old = old_data.get(choice_field_name)
+            else:
+                old = old_data.get(key)
+
+            if isinstance(old, dict):
+                if 'name' in old:
+                    old = old.get('name')
+                elif 'full_name' in old:
+                    old = old.get('full_name')
+
+            if choice_field_name in new_data:
+                new = new_data.get(choice_field_name)
+            else:
+                new = new_data.get(key)
+
+            if isinstance(new, dict):
+                if 'name' in new:
+                    new = new.get('name')
+                elif 'full_name' in new:
+                    new = new.get('full_name')
+
+            # Related fields (e.g. phone numbers) are always lists.
+            if is_social_media or isinstance(request_data[key], list):
+                if len(old) > len(new):
+                    for item in old:
+                        # If the item has been deleted we still want to register the change.
+                        if not any(x.get('id') == item.get('id') for x in new):
+                            new.append({
+                                'id': item.get('id'),
+                                'is_deleted': True,
+                            })
+
+            change = {
+                key: {
+                    'old': old,
+                    'new': new,
+                }
+            }
+
+            data.update(change)
+
+    # Remove keys we don't want to track.
+    for key in data.keys():
+        if key in ignored_fields:
+            del data[key]
+
+    return data
+
 
 class ModelChangesMixin(object):
     def create(self, request, *args, **kwargs):
@@ -35,7 +144,6 @@ class ModelChangesMixin(object):
     def update(self, request, *args, **kwargs):
         partial = kwargs.get('partial', False)
         action = 'patch' if partial else 'put'
-        ignored_fields = ['modified', 'id', 'full_name']
 
         # Store the old data so we can compare changes.
         serializer = self.get_serializer(instance=self.get_object())
@@ -43,101 +151,14 @@ class ModelChangesMixin(object):
 
         response = super(ModelChangesMixin, self).update(request, *args, **kwargs)
 
-        obj = self.get_object()
-        serializer = self.get_serializer(instance=obj)
-        new_data = serializer.data
-
-        # Social media fields are saved in a 'special' way.
-        # Since we want to show changes per social media type we split all the data.
-        if 'social_media' in request.data:
-            for item in old_data.get('social_media'):
-                social_type = item.get('name')
-
-                if social_type not in old_data:
-                    old_data[social_type] = []
-
-                old_data[social_type].append(item)
-
-            del old_data['social_media']
-
-            for item in new_data.get('social_media'):
-                social_type = item.get('name')
-
-                if social_type not in new_data:
-                    new_data[social_type] = []
-
-                new_data[social_type].append(item)
-
-            del new_data['social_media']
-
-            for key in dict(SocialMedia.SOCIAL_NAME_CHOICES).keys():
-                if key in old_data and key not in new_data:
-                    new_data[key] = []
-                elif key in new_data and key not in old_data:
-                    old_data[key] = []
-
-        data = {}
-        # Compare old and new data and store those keys.
-        diffkeys = [k for k in old_data if old_data.get(k) != new_data.get(k)]
-
-        for key in diffkeys:
-            is_social_media = (key in dict(SocialMedia.SOCIAL_NAME_CHOICES).keys())
-
-            if key in request.data or is_social_media:
-                # We don't want to display an ID in the change log,
-                # so fetch the display name if possible.
-                choice_field_name = key + '_display'
-
-                if choice_field_name in old_data:
-                    old = old_data.get(choice_field_name)
-                else:
-                    old = old_data.get(key)
-
-                if isinstance(old, dict):
-                    if 'name' in old:
-                        old = old.get('name')
-                    elif 'full_name' in old:
-                        old = old.get('full_name')
-
-                if choice_field_name in new_data:
-                    new = new_data.get(choice_field_name)
-                else:
-                    new = new_data.get(key)
-
-                if isinstance(new, dict):
-                    if 'name' in new:
-                        new = new.get('name')
-                    elif 'full_name' in new:
-                        new = new.get('full_name')
-
-                # Related fields (e.g. phone numbers) are always lists.
-                if is_social_media or isinstance(request.data[key], list):
-                    if len(old) > len(new):
-                        for item in old:
-                            # If the item has been deleted we still want to register the change.
-                            if not any(x.get('id') == item.get('id') for x in new):
-                                new.append({
-                                    'id': item.get('id'),
-                                    'is_deleted': True,
-                                })
-
-                change = {
-                    key: {
-                        'old': old,
-                        'new': new,
-                    }
-                }
-
-                data.update(change)
-
-        # Remove keys we don't want to track.
-        for key in data.keys():
-            if key in ignored_fields:
-                del data[key]
+        # The response already contains the serialized object after the update,
+        # copy it so splitting the social media doesn't change the response.
+        obj = response.data.serializer.instance
+        new_data = copy.deepcopy(response.data)
 
         Change.objects.create(
             action=action,
-            data=json.dumps(data),
+            data=json.dumps(get_change_data(old_data, new_data, request.data)),
             user=request.user,
             content_type=obj.content_type,
             object_id=obj.id,
@@ -175,6 +196,94 @@ class ModelChangesMixin(object):
         return Response({'objects': changes})
 
 
+class BulkMixin(object):
+    """
+    Create, update or upsert a list of objects with one request.
+
+    POST creates the items without an id and fully updates the items with an id, PATCH partially updates the items.
+    All items are validated before anything is saved, so either every item is saved or the errors of every item are
+    returned in the same order as the items. The changes are stored in bulk and the Elasticsearch updates are sent
+    as one bulk request once everything is saved.
+    """
+    bulk_max_size = 500
+
+    @list_route(methods=['POST', 'PATCH'])
+    def bulk(self, request):
+        partial = request.method == 'PATCH'
+        items = request.data
+
+        if not isinstance(items, list):
+            return Response({'detail': 'Expected a list of items.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if len(items) > self.bulk_max_size:
+            return Response(
+                {'detail': 'No more than %s items can be saved at once.' % self.bulk_max_size},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        ids = [item['id'] for item in items if isinstance(item, dict) and str(item.get('id')).isdigit()]
+        instances = {str(pk): instance for pk, instance in self.get_queryset().in_bulk(ids).items()}
+        elasticsearch_actions = ActionBuffer()
+
+        context = self.get_serializer_context()
+        context['elasticsearch_actions'] = elasticsearch_actions
+        serializer_class = self.get_serializer_class()
+
+        serializers = []
+        errors = []
+        for item in items:
+            if not isinstance(item, dict):
+                serializers.append(None)
+                errors.append({'detail': 'Expected an object.'})
+                continue
+
+            instance = None
+            if item.get('id'):
+                instance = instances.get(str(item['id']))
+                if instance is None:
+                    serializers.append(None)
+                    errors.append({'id': ['Not found.']})
+                    continue
+            elif partial:
+                serializers.append(None)
+                errors.append({'id': ['This field is required.']})
+                continue
+
+            serializer = serializer_class(instance, data=item, partial=partial, context=context)
+            serializers.append(serializer)
+            errors.append({} if serializer.is_valid() else serializer.errors)
+
+        if any(errors):
+            return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        changes = []
+        with transaction.atomic():
+            for item, serializer in zip(items, serializers):
+                if serializer.instance is None:
+                    obj = serializer.save()
+                    data = item
+                    action = 'post'
+                else:
+                    old_data = serializer_class(serializer.instance, context=context).data
+                    obj = serializer.save()
+                    data = get_change_data(old_data, copy.deepcopy(serializer.data), item)
+                    action = 'patch' if partial else 'put'
+
+                changes.append(Change(
+                    action=action,
+                    data=json.dumps(data),
+                    user=request.user,
+                    content_type=obj.content_type,
+                    object_id=obj.id,
+                ))
+
+            Change.objects.bulk_create(changes)
+
+        elasticsearch_actions.execute(raise_on_error=False)
+
+        return Response({'results': [serializer.data for serializer in serializers]})
+
+
 class TimeLogMixin(object):
     @detail_route(methods=['get'])
     def timelogs(self, request, pk=None):
@@ -284,3 +393,117 @@ class ElasticModelMixin(object):
             action_buffer = ActionBuffer()
             action_buffer.add_model_actions(serializer.instance)
             action_buffer.execute(raise_on_error=False)
+
+
+def get_related_lookups(serializer, model, prefix='', in_prefetch=False, select_related=None, prefetch_related=None):
+    """
+    Walk the fields of the serializer and collect the relations it will follow for an instance of the model.
+
+    Forward foreign keys are joined with select_related, all other relations and every relation below them are
+    fetched with prefetch_related. Relations used by method fields or properties can't be found this way, so a
+    serializer can list them as lookups in `eager_loading_fields` on its Meta.
+
+    Returns:
+        tuple: sets with the select_related and prefetch_related lookups.
+    """
+    if select_related is None:
+        select_related = set()
+    if prefetch_related is None:
+        prefetch_related = set()
+
+    for field in serializer.fields.values():
+        if field.write_only or field.source == '*':
+            continue
+
+        nested_serializer = None
+        if isinstance(field, ListSerializer):
+            nested_serializer = field.child
+        elif isinstance(field, BaseSerializer):
+            nested_serializer = field
+
+        # The primary key of a foreign key is stored on the instance itself, so no relation is followed.
+        pk_only = isinstance(field, PrimaryKeyRelatedField)
+
+        add_related_lookup(
+            model, field.source_attrs, nested_serializer, pk_only, prefix, in_prefetch, select_related,
+            prefetch_related
+        )
+
+    for lookup in getattr(getattr(serializer, 'Meta', None), 'eager_loading_fields', ()):
+        add_related_lookup(
+            model, lookup.split('__'), None, False, prefix, in_prefetch, select_related, prefetch_related
+        )
+
+    return select_related, prefetch_related
+
+
+def add_related_lookup(model, attrs, nested_serializer, pk_only, prefix, in_prefetch, select_related,
+                       prefetch_related):
+    """
+    Add the lookups for the relations in the attribute path and walk the serializer used for the last one.
+    """
+    for index, attr in enumerate(attrs):
+        try:
+            model_field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            # Properties and methods can't be loaded up front.
+            return
+
+        if not model_field.is_relation:
+            return
+
+        lookup = prefix + attr
+        is_forward_foreign_key = model_field.concrete and (model_field.many_to_one or model_field.one_to_one)
+
+        if is_forward_foreign_key and not in_prefetch:
+            if pk_only and index == len(attrs) - 1:
+                return
+            select_related.add(lookup)
+        else:
+            prefetch_related.add(lookup)
+            in_prefetch = True
+
+        model = model_field.related_model
+        prefix = lookup + '__'
+
+        if model is None:
+            # Generic foreign keys can point to any model, so nothing below them can be loaded.
+            return
+
+    if nested_serializer is not None:
+        get_related_lookups(nested_serializer, model, prefix, in_prefetch, select_related, prefetch_related)
+
+
+class EagerLoadingMixin(object):
+    """
+    Load the relations the serializer follows together with the queryset.
+
+    The serializer fields are walked once per serializer class, after which every read request loads the related
+    objects for the whole page with a fixed number of queries. Writes use the plain queryset, because the nested
+    serializers change the relations of the instance while saving.
+    """
+    eager_loading_lookups = {}
+
+    def get_queryset(self):
+        queryset = super(EagerLoadingMixin, self).get_queryset()
+
+        if self.request.method not in SAFE_METHODS:
+            return queryset
+
+        select_related, prefetch_related = self.get_eager_loading_lookups()
+
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+
+        return queryset
+
+    def get_eager_loading_lookups(self):
+        serializer_class = self.get_serializer_class()
+
+        if serializer_class not in self.eager_loading_lookups:
+            select_related, prefetch_related = get_related_lookups(serializer_class(), serializer_class.Meta.model)
+            self.eager_loading_lookups[serializer_class] = (sorted(select_related), sorted(prefetch_related))
+
+        return self.eager_loading_lookups[serializer_class]
@@ -8,9 +8,10 @@ from django.utils import six
 from rest_framework import serializers
 from rest_framework.fields import empty
 from rest_framework.serializers import SerializerMetaclass
-from requests_futures.sessions import FuturesSession
 from django_elasticsearch_dsl.actions import ActionBuffer
 
+from lily.utils.webhooks import queue_webhook_event
+
 
 def is_dirty(instance, data):
     """
@@ -393,12 +394,8 @@ class WritableNestedSerializer(serializers.ModelSerializer):
 
             data = json.dumps(data, sort_keys=True, default=lambda x: str(x))
 
-            headers = {
-                'Content-Type': 'application/json',
-            }
-
-            session = FuturesSession()
-            session.post(webhook.url, data=data, headers=headers)
+            # Delivered by a task after the commit, so the request doesn't wait for the endpoint.
+            queue_webhook_event(webhook, data)
 
 
 @six.add_metaclass(WritableNestedSerializerMetaclass)
@@ -426,7 +423,13 @@ class NewWritableNestedSerializer(serializers.ModelSerializer):
         self.m2m_reverse_data = {}
         self.m2m_through_data = {}
         self.m2m_through_reverse_data = {}
-        self.elasticsearch_actions = ActionBuffer()
+
+        # A buffer passed in the context is executed by the caller, e.g. to index a bulk save at once.
+        self.execute_elasticsearch_actions = 'elasticsearch_actions' not in self.context
+        if self.execute_elasticsearch_actions:
+            self.elasticsearch_actions = ActionBuffer()
+        else:
+            self.elasticsearch_actions = self.context['elasticsearch_actions']
 
     def split_data(self, data):
         for field_name, field_data in data.items():
@@ -501,7 +504,8 @@ class NewWritableNestedSerializer(serializers.ModelSerializer):
             # Save the reverse many to manys with a through model.
             self.save_many_to_many_through_reverse_fields()
 
-        self.elasticsearch_actions.execute(raise_on_error=False)
+        if self.execute_elasticsearch_actions:
+            self.elasticsearch_actions.execute(raise_on_error=False)
 
         self.call_webhook(validated_data, self.instance)
 
@@ -539,7 +543,8 @@ class NewWritableNestedSerializer(serializers.ModelSerializer):
             # Save the reverse many to manys with a through model.
             self.save_many_to_many_through_reverse_fields(cleanup=True)
 
-        self.elasticsearch_actions.execute(raise_on_error=False)
+        if self.execute_elasticsearch_actions:
+            self.elasticsearch_actions.execute(raise_on_error=False)
 
         self.call_webhook(validated_data, self.instance)
 
@@ -738,12 +743,8 @@ class NewWritableNestedSerializer(serializers.ModelSerializer):
 
             data = json.dumps(data, sort_keys=True, default=lambda x: str(x))
 
-            headers = {
-                'Content-Type': 'application/json',
-            }
-
-            session = FuturesSession()
-            session.post(webhook.url, data=data, headers=headers)
+            # Delivered by a task after the commit, so the request doesn't wait for the endpoint.
+            queue_webhook_event(webhook, data)
 
 
 class WritableNestedListSerializer(serializers.ListSerializer):
@@ -16,7 +16,7 @@ from lily.integrations.api.views import (DocumentDetails, EstimatesList, Integra
 from lily.messaging.email.api.views import (EmailLabelViewSet, EmailAccountViewSet, EmailMessageViewSet,
                                             EmailTemplateFolderViewSet, EmailTemplateViewSet, SharedEmailConfigViewSet,
                                             TemplateVariableViewSet, EmailDraftViewSet, EmailDraftAttachmentViewSet,
-                                            SearchView)
+                                            SearchView, GmailPushNotificationView, EmailThreadViewSet)
 from lily.notes.api.views import NoteViewSet
 from lily.provide.api.views import DataproviderViewSet
 from lily.tenant.api.views import TenantViewSet
@@ -53,6 +53,7 @@ router.register(r'deals', DealViewSet)
 router.register(r'messaging/email/labels', EmailLabelViewSet)
 router.register(r'messaging/email/accounts', EmailAccountViewSet)
 router.register(r'messaging/email/email', EmailMessageViewSet)
+router.register(r'messaging/email/threads', EmailThreadViewSet)
 router.register(r'messaging/email/drafts/(?P<draft_id>[\d-]+)/attachments', EmailDraftAttachmentViewSet)
 router.register(r'messaging/email/drafts', EmailDraftViewSet)
 router.register(r'messaging/email/folders', EmailTemplateFolderViewSet)
@@ -101,6 +102,7 @@ urlpatterns = [
     url(r'^utils/notifications/$', Notifications.as_view()),
 
     url(r'^messaging/email/search/$', SearchView.as_view()),
+    url(r'^messaging/email/push/$', GmailPushNotificationView.as_view()),
 
     url(r'^', include(router.urls)),
 ]
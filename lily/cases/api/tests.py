@@ -2,11 +2,11 @@ from lily.accounts.factories import AccountFactory
 from lily.cases.api.serializers import CaseSerializer
 from lily.cases.factories import CaseFactory, CaseStatusFactory, CaseTypeFactory
 from lily.cases.models import Case
-from lily.tests.utils import GenericAPITestCase
+from lily.tests.utils import EagerLoadingApiTestCase, GenericAPITestCase
 from lily.users.factories import LilyUserFactory
 
 
-class CaseTests(GenericAPITestCase):
+class CaseTests(EagerLoadingApiTestCase, GenericAPITestCase):
     """
     Class containing tests for the case API.
 
@@ -5,7 +5,7 @@ from rest_framework.filters import OrderingFilter
 from rest_framework.views import APIView
 
 from lily.api.filters import ElasticSearchFilter
-from lily.api.mixins import ModelChangesMixin, TimeLogMixin, DataExistsMixin
+from lily.api.mixins import BulkMixin, ModelChangesMixin, TimeLogMixin, DataExistsMixin, EagerLoadingMixin
 
 from .serializers import CaseSerializer, CaseStatusSerializer, CaseTypeSerializer
 from ..models import Case, CaseStatus, CaseType
@@ -44,7 +44,8 @@ class CaseFilter(filters.FilterSet):
         fields = ['type', 'status', 'not_type', 'not_status', ]
 
 
-class CaseViewSet(ModelChangesMixin, TimeLogMixin, DataExistsMixin, viewsets.ModelViewSet):
+class CaseViewSet(BulkMixin, ModelChangesMixin, TimeLogMixin, DataExistsMixin, EagerLoadingMixin,
+                  viewsets.ModelViewSet):
     """
     retrieve:
     Returns the given case.
@@ -77,6 +78,9 @@ class CaseViewSet(ModelChangesMixin, TimeLogMixin, DataExistsMixin, viewsets.Mod
 
     timelogs:
     Returns all timelogs for the given case.
+
+    bulk:
+    Creates or updates a list of cases at once.
     """
     # Set the queryset, without .all() this filters on the tenant and takes care of setting the `base_name`.
     queryset = Case.objects
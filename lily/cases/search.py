@@ -7,6 +7,20 @@ from .models import Case
 
 
 class CaseMapping(BaseMapping):
+    batch_select_related = (
+        'account',
+        'assigned_to',
+        'contact',
+        'created_by',
+        'parcel',
+        'status',
+        'type',
+    )
+    batch_prefetch_related = (
+        'assigned_to_teams',
+        'tags',
+    )
+
     @classmethod
     def get_model(cls):
         return Case
@@ -134,6 +148,16 @@ class CaseMapping(BaseMapping):
         })
         return mapping
 
+    @classmethod
+    def get_indexed_fields(cls):
+        """
+        The fields of the model used in the documents, the modified date alone doesn't need a reindex.
+        """
+        return {
+            'account', 'assigned_to', 'contact', 'created_by', 'description', 'expires', 'is_archived', 'is_deleted',
+            'newly_assigned', 'parcel', 'priority', 'status', 'subject', 'type',
+        }
+
     @classmethod
     def get_related_models(cls):
         """
@@ -146,18 +170,14 @@ class CaseMapping(BaseMapping):
         }
 
     @classmethod
-    def prepare_batch(cls, queryset):
+    def get_related_fields(cls):
         """
-        Optimize a queryset for batch indexing.
+        Maps related models to the fields used in the documents.
         """
-        return queryset.prefetch_related(
-            'status',
-            'type',
-            'account',
-            'contact',
-            'assigned_to',
-            'tags',
-        )
+        return {
+            Contact: {'first_name', 'last_name', 'is_deleted'},
+            Account: {'name', 'is_deleted'},
+        }
 
     @classmethod
     def obj_to_doc(cls, obj):
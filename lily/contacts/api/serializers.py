@@ -35,6 +35,8 @@ class FunctionSerializer(serializers.ModelSerializer):
             'account_name',
             'is_active',
         )
+        # The account name is looked up by a method field.
+        eager_loading_fields = ('account', )
 
 
 class RelatedFunctionSerializer(RelatedSerializerMixin, FunctionSerializer):
@@ -2,16 +2,18 @@ from rest_framework import status
 
 from lily.accounts.factories import AccountFactory, AccountStatusFactory
 from lily.accounts.models import Account
+from lily.changes.models import Change
 from lily.contacts.api.serializers import ContactSerializer
 from lily.contacts.factories import ContactFactory, FunctionFactory
 from lily.contacts.models import Contact
 from lily.socialmedia.factories import SocialMediaFactory
 from lily.tags.factories import TagFactory
-from lily.tests.utils import ElasticsearchApiTestCase, GenericAPITestCase
+from lily.tenant.middleware import set_current_user
+from lily.tests.utils import EagerLoadingApiTestCase, ElasticsearchApiTestCase, GenericAPITestCase
 from lily.utils.models.factories import AddressFactory, EmailAddressFactory, PhoneNumberFactory
 
 
-class ContactTests(ElasticsearchApiTestCase, GenericAPITestCase):
+class ContactTests(EagerLoadingApiTestCase, ElasticsearchApiTestCase, GenericAPITestCase):
     """
     Class containing tests for the contact API.
 
@@ -228,3 +230,62 @@ class ContactTests(ElasticsearchApiTestCase, GenericAPITestCase):
                 [item['id'] for item in request.data.get(field_name)],
                 '%s %s -was- deleted while it should have been.' % (field_name, object_list[1].pk)
             )
+
+    def test_bulk_upsert(self):
+        """
+        Test that a list of contacts can be created and updated with one request.
+        """
+        set_current_user(self.user_obj)
+        contact = self._create_object()
+        items = [{
+            'first_name': 'Bulk',
+            'last_name': 'Created',
+        }, {
+            'id': contact.pk,
+            'first_name': 'Bulk',
+            'last_name': 'Updated',
+        }]
+
+        request = self.user.post(self.get_url('contact-bulk'), items, format='json')
+        self.assertStatus(request, status.HTTP_200_OK, items)
+
+        results = request.data['results']
+        self.assertEqual(contact.pk, results[1]['id'])
+        self.assertEqual('Updated', self.model_cls.objects.get(pk=contact.pk).last_name)
+        self.assertEqual('Created', self.model_cls.objects.get(pk=results[0]['id']).last_name)
+        self.assertEqual(2, Change.objects.filter(object_id__in=[result['id'] for result in results]).count())
+
+    def test_bulk_validation(self):
+        """
+        Test that nothing is saved when an item is invalid and that the errors are returned per item.
+        """
+        set_current_user(self.user_obj)
+        other_tenant_contact = self._create_object(tenant=self.other_tenant_user_obj.tenant)
+        items = [{
+            'first_name': 'Bulk',
+            'last_name': 'Valid',
+        }, {
+            'id': other_tenant_contact.pk,
+            'first_name': 'Bulk',
+        }]
+
+        request = self.user.post(self.get_url('contact-bulk'), items, format='json')
+        self.assertStatus(request, status.HTTP_400_BAD_REQUEST, items)
+        self.assertEqual(request.data, {'errors': [{}, {'id': ['Not found.']}]})
+        self.assertFalse(self.model_cls.objects.filter(last_name='Valid').exists())
+
+    def test_get_list_keyset_pagination_search(self):
+        """
+        Test that a search, which is ordered by relevance, can't be paginated with a cursor.
+        """
+        set_current_user(self.user_obj)
+        self._create_object(size=3, first_name='Cursor')
+
+        request = self.user.get(self.get_url(self.list_url) + '&search=Cursor&cursor=')
+        self.assertStatus(request, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('cursor', request.data)
+
+        # Without a cursor the search is paginated by page number.
+        request = self.user.get(self.get_url(self.list_url) + '&search=Cursor')
+        self.assertStatus(request, status.HTTP_200_OK)
+        self.assertNotIn('next_cursor', request.data['pagination'])
@@ -7,14 +7,16 @@ from rest_framework.filters import OrderingFilter
 from rest_framework.response import Response
 
 from lily.api.filters import NewElasticSearchFilter
-from lily.api.mixins import ModelChangesMixin, DataExistsMixin, ElasticModelMixin, NoteMixin
+from lily.api.mixins import (BulkMixin, ModelChangesMixin, DataExistsMixin, EagerLoadingMixin, ElasticModelMixin,
+                             NoteMixin)
 from lily.calls.api.serializers import CallRecordSerializer
 from lily.calls.models import CallRecord
 from lily.contacts.api.serializers import ContactSerializer
 from lily.contacts.models import Contact
 
 
-class ContactViewSet(ElasticModelMixin, ModelChangesMixin, DataExistsMixin, NoteMixin, viewsets.ModelViewSet):
+class ContactViewSet(ElasticModelMixin, BulkMixin, ModelChangesMixin, DataExistsMixin, NoteMixin, EagerLoadingMixin,
+                     viewsets.ModelViewSet):
     """
     Contacts are people you want to store the information of.
 
@@ -42,6 +44,9 @@ class ContactViewSet(ElasticModelMixin, ModelChangesMixin, DataExistsMixin, Note
 
     changes:
     Returns all the changes performed on the given contact.
+
+    bulk:
+    Creates or updates a list of contacts at once.
     """
     # Set the queryset, without .all() this filters on the tenant and takes care of setting the `base_name`.
     queryset = Contact.elastic_objects
@@ -1,11 +1,12 @@
 from lily.accounts.models import Account
+from django.db.models import Prefetch
 from django_elasticsearch_dsl import DocType, Index, IntegerField, ObjectField
 
 from lily.search.fields import CharField, EmailAddressField, PhoneNumberField
 from lily.tags.models import Tag
 from lily.utils.models.models import EmailAddress, PhoneNumber
 
-from .models import Contact
+from .models import Contact, Function
 
 index = Index('contact')
 
@@ -25,12 +26,26 @@ class ContactDoc(DocType):
     tenant_id = IntegerField()
 
     def get_queryset(self):
-        return Contact.objects.prefetch_related('email_addresses', 'phone_numbers', 'tags')
+        return Contact.objects.order_by('pk').prefetch_related(
+            'email_addresses',
+            'phone_numbers',
+            'tags',
+            Prefetch(
+                'functions',
+                queryset=Function.objects.filter(
+                    account__is_deleted=False
+                ).select_related('account').prefetch_related('account__phone_numbers'),
+                to_attr='active_functions'
+            ),
+        )
 
     def prepare_accounts(self, obj):
-        functions = obj.functions.filter(
-            account__is_deleted=False
-        ).select_related('account').prefetch_related('account__phone_numbers')
+        # Contacts from get_queryset have their functions prefetched, single contacts from signals don't.
+        functions = getattr(obj, 'active_functions', None)
+        if functions is None:
+            functions = obj.functions.filter(
+                account__is_deleted=False
+            ).select_related('account').prefetch_related('account__phone_numbers')
 
         return [self._convert_function_to_account(func) for func in functions]
 
@@ -68,3 +83,5 @@ class ContactDoc(DocType):
 
     class Meta:
         model = Contact
+        # Index in pages, so the prefetches of get_queryset are done per page instead of for all contacts.
+        queryset_pagination = 500
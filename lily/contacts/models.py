@@ -66,7 +66,7 @@ class Contact(Common, TaggedObjectMixin):
         """
         Return the content type (Django model) for this model.
         """
-        return ContentType.objects.get(app_label='contacts', model='contact')
+        return ContentType.objects.get_for_model(self)
 
     @property
     def primary_email(self):
@@ -77,7 +77,12 @@ class Contact(Common, TaggedObjectMixin):
             EmailAddress or empty string.
         """
         if not hasattr(self, '_primary_email'):
-            self._primary_email = self.email_addresses.filter(status=EmailAddress.PRIMARY_STATUS).first()
+            self._primary_email = None
+            # Sort by id in Python, so prefetched email addresses are used and the same one is returned every time.
+            for email_address in sorted(self.email_addresses.all(), key=lambda email_address: email_address.pk):
+                if email_address.status == EmailAddress.PRIMARY_STATUS:
+                    self._primary_email = email_address
+                    break
 
         return self._primary_email
 
@@ -111,11 +116,18 @@ class Contact(Common, TaggedObjectMixin):
 
     @property
     def work_phone(self):
-        return self.phone_numbers.filter(type='work').first()
+        # Sort by id in Python, so prefetched phone numbers are used and the same one is returned every time.
+        for phone in sorted(self.phone_numbers.all(), key=lambda phone: phone.pk):
+            if phone.type == 'work':
+                return phone
+        return None
 
     @property
     def mobile_phone(self):
-        return self.phone_numbers.filter(type='mobile').first()
+        for phone in sorted(self.phone_numbers.all(), key=lambda phone: phone.pk):
+            if phone.type == 'mobile':
+                return phone
+        return None
 
     @property
     def phone_number(self):
@@ -133,7 +145,10 @@ class Contact(Common, TaggedObjectMixin):
         if mobile_phone:
             return mobile_phone
 
-        return self.phone_numbers.filter(type__in=['home', 'pager', 'other']).first()
+        for phone in sorted(self.phone_numbers.all(), key=lambda phone: phone.pk):
+            if phone.type in ['home', 'pager', 'other']:
+                return phone
+        return None
 
     @property
     def full_name(self):
@@ -10,6 +10,16 @@ from .models import Contact, Function
 
 
 class ContactMapping(BaseMapping):
+    batch_prefetch_related = (
+        'addresses',
+        'email_addresses',
+        'phone_numbers',
+        'social_media',
+        'tags',
+        'functions__account__phone_numbers',
+        'functions__account__websites',
+    )
+
     @classmethod
     def get_model(cls):
         return Contact
@@ -138,6 +148,13 @@ class ContactMapping(BaseMapping):
         })
         return mapping
 
+    @classmethod
+    def get_indexed_fields(cls):
+        """
+        The fields of the model used in the documents, the modified date alone doesn't need a reindex.
+        """
+        return {'description', 'first_name', 'gender', 'is_deleted', 'last_name', 'salutation', 'title'}
+
     @classmethod
     def get_related_models(cls):
         """
@@ -145,7 +162,7 @@ class ContactMapping(BaseMapping):
         """
         return {
             Function: lambda obj: [obj.contact],
-            Account: lambda obj: [f.contact for f in obj.functions.all()],
+            Account: lambda obj: Contact.objects.filter(functions__account=obj),
             Tag: lambda obj: [obj.subject],
             EmailAddress: lambda obj: obj.contact_set.all(),
             PhoneNumber: lambda obj: obj.contact_set.all(),
@@ -154,25 +171,21 @@ class ContactMapping(BaseMapping):
         }
 
     @classmethod
-    def prepare_batch(cls, queryset):
+    def get_related_fields(cls):
         """
-        Optimize a queryset for batch indexing.
+        Maps related models to the fields used in the documents.
         """
-        return queryset.prefetch_related(
-            'tags',
-            'email_addresses',
-            'phone_numbers',
-            'social_media',
-            'addresses',
-            'functions__account',
-        )
+        return {
+            Account: {'name', 'customer_id', 'is_deleted'},
+        }
 
     @classmethod
     def obj_to_doc(cls, obj):
         """
         Translate an object to an index document.
         """
-        functions = obj.functions.filter(account__is_deleted=False)
+        # Filter in Python, so the prefetched functions are used.
+        functions = [function for function in obj.functions.all() if not function.account.is_deleted]
 
         doc = {
             'addresses': [{
@@ -2,7 +2,9 @@ import time
 from django.test import TestCase
 
 from lily.contacts.factories import ContactFactory
+from lily.contacts.models import Contact
 from lily.tenant.factories import TenantFactory
+from lily.utils.models.factories import EmailAddressFactory, PhoneNumberFactory
 
 
 class ContactTests(TestCase):
@@ -21,3 +23,23 @@ class ContactTests(TestCase):
 
         contact.save(update_modified=True)
         self.assertNotEqual(modified, contact.modified)
+
+    def test_first_email_address_and_phone_number(self):
+        """
+        Test that the primary email address and phone numbers are the first ones by id, also when prefetched.
+        """
+        tenant = TenantFactory.create()
+        contact = ContactFactory.create(tenant=tenant)
+        email_addresses = EmailAddressFactory.create_batch(2, tenant=tenant)
+        work_phones = PhoneNumberFactory.create_batch(2, tenant=tenant, type='work')
+        contact.email_addresses.add(*reversed(email_addresses))
+        contact.phone_numbers.add(*reversed(work_phones))
+
+        contacts = [
+            Contact.objects.get(pk=contact.pk),
+            Contact.objects.prefetch_related('email_addresses', 'phone_numbers').get(pk=contact.pk),
+        ]
+        for loaded_contact in contacts:
+            self.assertEqual(loaded_contact.primary_email, email_addresses[0])
+            self.assertEqual(loaded_contact.work_phone, work_phones[0])
+            self.assertEqual(loaded_contact.phone_number, work_phones[0])
@@ -1,3 +1,5 @@
+from rest_framework import status
+
 from lily.accounts.factories import AccountFactory
 from lily.deals.api.serializers import DealSerializer
 from lily.deals.factories import DealFactory, DealWhyCustomerFactory, DealNextStepFactory, DealFoundThroughFactory, \
@@ -5,11 +7,12 @@ from lily.deals.factories import DealFactory, DealWhyCustomerFactory, DealNextSt
 from lily.deals.models import Deal
 from lily.notes.factories import NoteFactory
 from lily.tags.factories import TagFactory
-from lily.tests.utils import GenericAPITestCase
+from lily.tenant.middleware import set_current_user
+from lily.tests.utils import EagerLoadingApiTestCase, GenericAPITestCase
 from lily.users.factories import LilyUserFactory
 
 
-class DealTests(GenericAPITestCase):
+class DealTests(EagerLoadingApiTestCase, GenericAPITestCase):
     """
     Class containing tests for the deal API.
 
@@ -115,3 +118,36 @@ class DealTests(GenericAPITestCase):
         # Partial updates should still validate the related objects.
         # Partial updates should amend to the relations.
         pass
+
+    def test_get_list_keyset_pagination(self):
+        """
+        Test that the list can be walked both ways with cursors.
+        """
+        set_current_user(self.user_obj)
+        obj_list = self._create_object(size=5)
+        desired_ids = [obj.id for obj in reversed(obj_list)]
+
+        request = self.user.get(self.get_url(self.list_url) + '&cursor=&page_size=2')
+        self.assertStatus(request, status.HTTP_200_OK)
+        self.assertIsNone(request.data['pagination']['total'])
+        self.assertIsNone(request.data['pagination']['prev_page'])
+
+        ids = [obj['id'] for obj in request.data['results']]
+        while request.data['pagination']['next_page']:
+            request = self.user.get(request.data['pagination']['next_page'])
+            self.assertStatus(request, status.HTTP_200_OK)
+            ids += [obj['id'] for obj in request.data['results']]
+
+        self.assertEqual(desired_ids, ids)
+        self.assertEqual(desired_ids[4:], [obj['id'] for obj in request.data['results']])
+
+        request = self.user.get(request.data['pagination']['prev_page'])
+        self.assertStatus(request, status.HTTP_200_OK)
+        self.assertEqual(desired_ids[2:4], [obj['id'] for obj in request.data['results']])
+
+    def test_get_list_keyset_pagination_invalid_cursor(self):
+        """
+        Test that an invalid cursor isn't accepted.
+        """
+        request = self.user.get(self.get_url(self.list_url) + '&cursor=invalid')
+        self.assertStatus(request, status.HTTP_404_NOT_FOUND)
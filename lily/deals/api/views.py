@@ -5,7 +5,7 @@ from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
 
 from lily.api.filters import ElasticSearchFilter
-from lily.api.mixins import ModelChangesMixin, TimeLogMixin, DataExistsMixin
+from lily.api.mixins import BulkMixin, ModelChangesMixin, TimeLogMixin, DataExistsMixin, EagerLoadingMixin
 
 from .serializers import (DealSerializer, DealNextStepSerializer, DealWhyCustomerSerializer, DealWhyLostSerializer,
                           DealFoundThroughSerializer, DealContactedBySerializer, DealStatusSerializer)
@@ -141,7 +141,7 @@ class DealFilter(filters.FilterSet):
         }
 
 
-class DealViewSet(ModelChangesMixin, TimeLogMixin, DataExistsMixin, ModelViewSet):
+class DealViewSet(BulkMixin, ModelChangesMixin, TimeLogMixin, DataExistsMixin, EagerLoadingMixin, ModelViewSet):
     """
     retrieve:
     Returns the given deal.
@@ -170,6 +170,9 @@ class DealViewSet(ModelChangesMixin, TimeLogMixin, DataExistsMixin, ModelViewSet
 
     timelogs:
     Returns all timelogs for the given deal.
+
+    bulk:
+    Creates or updates a list of deals at once.
     """
     # Set the queryset, without .all() this filters on the tenant and takes care of setting the `base_name`.
     queryset = Deal.objects
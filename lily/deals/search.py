@@ -6,6 +6,23 @@ from .models import Deal
 
 
 class DealMapping(BaseMapping):
+    batch_select_related = (
+        'account',
+        'assigned_to',
+        'contact',
+        'contacted_by',
+        'created_by',
+        'found_through',
+        'next_step',
+        'status',
+        'why_customer',
+        'why_lost',
+    )
+    batch_prefetch_related = (
+        'assigned_to_teams',
+        'tags',
+    )
+
     @classmethod
     def get_model(cls):
         return Deal
@@ -197,6 +214,18 @@ class DealMapping(BaseMapping):
         })
         return mapping
 
+    @classmethod
+    def get_indexed_fields(cls):
+        """
+        The fields of the model used in the documents, the modified date alone doesn't need a reindex.
+        """
+        return {
+            'account', 'amount_once', 'amount_recurring', 'assigned_to', 'card_sent', 'closed_date', 'contact',
+            'contacted_by', 'created_by', 'currency', 'description', 'found_through', 'is_archived', 'is_checked',
+            'is_deleted', 'name', 'new_business', 'newly_assigned', 'next_step', 'next_step_date', 'quote_id',
+            'status', 'twitter_checked', 'why_customer', 'why_lost',
+        }
+
     @classmethod
     def get_related_models(cls):
         """
@@ -208,15 +237,13 @@ class DealMapping(BaseMapping):
         }
 
     @classmethod
-    def prepare_batch(cls, queryset):
+    def get_related_fields(cls):
         """
-        Optimize a queryset for batch indexing.
+        Maps related models to the fields used in the documents.
         """
-        return queryset.prefetch_related(
-            'account',
-            'assigned_to',
-            'tags',
-        )
+        return {
+            Account: {'name', 'customer_id', 'is_deleted'},
+        }
 
     @classmethod
     def obj_to_doc(cls, obj):
@@ -1,16 +1,21 @@
+from datetime import timedelta
 import os
 import traceback
 import time
 
 from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
 from django.core.management.base import BaseCommand
 from django.db import connection
+from django.db.models import Max
+from django.utils import timezone
 
 from slacker import Slacker
 
 from lily.search.analyzers import get_analyzers
 from lily.search.connections_utils import get_es_client, get_index_name
-from lily.search.indexing import index_objects
+from lily.search.indexing import (finish_rebuild, index_batch, index_objects, parallel_index_objects,
+                                  pop_rebuild_deletions, start_rebuild)
 from lily.search.scan_search import ModelMappings
 
 
@@ -33,7 +38,20 @@ The second way is to target a specific model:
     index -t contacts_contact
     index -t lily.contacts
 
-It is possible to specify multiple models, using comma separation."""
+It is possible to specify multiple models, using comma separation.
+
+Objects changed or deleted while the new index is filled are indexed again or
+removed before and after the aliases are switched, so indexing doesn't need a
+maintenance mode.
+
+Use --workers to extract the documents of ranges of ids in multiple processes:
+
+    index -t contact --workers 4"""
+
+    # Changes are replayed from a bit before the start, for transactions which committed during the start.
+    catch_up_margin = timedelta(minutes=1)
+    # Deletions are no longer recorded for a rebuild which didn't finish within this number of seconds.
+    rebuild_timeout = 24 * 60 * 60
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -61,10 +79,32 @@ It is possible to specify multiple models, using comma separation."""
             dest='force',
             help='Force the creation of the new index, removing the old one (leftovers).'
         )
+        parser.add_argument(
+            '-w', '--workers',
+            action='store',
+            dest='workers',
+            type=int,
+            default=1,
+            help='Number of processes extracting and indexing documents at the same time.'
+        )
+        parser.add_argument(
+            '-c', '--chunk-size',
+            action='store',
+            dest='chunk_size',
+            type=int,
+            default=500,
+            help='Number of ids in a range handled by one process at a time.'
+        )
+        parser.add_argument(
+            '-b', '--batch-bytes',
+            action='store',
+            dest='batch_bytes',
+            type=int,
+            default=settings.ES_OLD_BULK_MAX_BYTES,
+            help='Maximum size in bytes of a bulk request.'
+        )
 
     def handle(self, *args, **kwargs):
-        self.stdout.write('Please remember that Lily needs to be in maintenance mode. \n\n')
-
         try:
             self.handle_args(*args)
             self.handle_kwargs(**kwargs)
@@ -119,6 +159,13 @@ It is possible to specify multiple models, using comma separation."""
         # Validate the force kwarg.
         self.force = kwargs['force'] is True
 
+        # Validate the parallel indexing kwargs.
+        if kwargs['workers'] < 1 or kwargs['chunk_size'] < 1 or kwargs['batch_bytes'] < 1:
+            raise Exception('The number of workers, the chunk size and the batch bytes should be positive.')
+        self.workers = kwargs['workers']
+        self.chunk_size = kwargs['chunk_size']
+        self.batch_bytes = kwargs['batch_bytes']
+
     def validate_targets(self, targets_to_check):
         """
         Validate every target that is passed to the command.
@@ -209,12 +256,31 @@ It is possible to specify multiple models, using comma separation."""
             temp_index_base = 'index_%s' % (int(time.time()))
             temp_index = get_index_name(temp_index_base, mapping)
 
+            # Objects deleted from now on are recorded, the signals only remove them from the old index.
+            start_rebuild(mapping, self.rebuild_timeout)
+
             self.stdout.write('Creating new index "%s"' % temp_index)
             self.es.indices.create(temp_index, body=index_settings)
 
+            # Refreshes and replicas only slow down loading the new index, they're restored before the swap.
+            load_settings = {
+                'refresh_interval': '-1',
+                'number_of_replicas': 0,
+            }
+            live_settings = self.get_live_settings(temp_index, load_settings.keys())
+            self.es.indices.put_settings(index=temp_index, body={'index': load_settings})
+
             # Index documents.
+            high_water_mark = self.get_high_water_mark(mapping)
             self.index_documents(mapping, temp_index_base)
 
+            # Restore the refresh interval and replicas, so the index is searchable after the swap.
+            self.es.indices.put_settings(index=temp_index, body={'index': live_settings})
+
+            # Index the objects changed during the indexing, the old index received those changes instead.
+            high_water_mark = self.catch_up(mapping, temp_index_base, high_water_mark)
+            self.es.indices.refresh(temp_index)
+
             # Switch aliases.
             if old_index:
                 self.es.indices.update_aliases({
@@ -240,10 +306,25 @@ It is possible to specify multiple models, using comma separation."""
                         {'add': {'index': temp_index, 'alias': main_index_base}},
                     ]
                 })
+
+            # Index the objects changed between the catch up and the switch of the aliases.
+            self.catch_up(mapping, main_index_base, high_water_mark)
+            finish_rebuild(mapping)
             self.stdout.write('')
 
         self.stdout.write('Indexing finished.')
 
+    def get_live_settings(self, index, names):
+        """
+        Return the current value of the index settings, which are the cluster defaults for a new index.
+        """
+        index_settings = self.es.indices.get_settings(index=index)[index]['settings']['index']
+
+        # Elasticsearch only returns settings which were set explicitly, refreshes default to every second.
+        defaults = {'refresh_interval': '1s'}
+
+        return {name: index_settings.get(name, defaults.get(name)) for name in names}
+
     def index_documents(self, mapping, temp_index_base):
         """
         Index all non deleted objects.
@@ -251,9 +332,57 @@ It is possible to specify multiple models, using comma separation."""
         model = mapping.get_model()
         self.stdout.write('Indexing {0}.{1}'.format(model.__module__, model.__name__).lower())
 
-        if mapping.has_deleted():
-            model_objs = model.objects.filter(is_deleted=False)
+        filters = {'is_deleted': False} if mapping.has_deleted() else {}
+
+        if self.workers > 1 or hasattr(mapping, 'extract_documents'):
+            parallel_index_objects(
+                mapping,
+                temp_index_base,
+                filters=filters,
+                workers=self.workers,
+                chunk_size=self.chunk_size,
+                max_chunk_bytes=self.batch_bytes,
+                print_progress=True,
+            )
+        else:
+            index_objects(mapping, model.objects.filter(**filters), temp_index_base, print_progress=True)
+
+    def get_high_water_mark(self, mapping):
+        """
+        Return the point from which changes of the objects have to be indexed again.
+
+        Models with a modified date are caught up by that date, other models only by the ids of new objects.
+        """
+        model = mapping.get_model()
+
+        try:
+            model._meta.get_field('modified')
+        except FieldDoesNotExist:
+            return ('pk', model.objects.aggregate(max_pk=Max('pk'))['max_pk'] or 0)
         else:
-            model_objs = model.objects.all()
+            return ('modified', timezone.now() - self.catch_up_margin)
+
+    def catch_up(self, mapping, index_base, high_water_mark):
+        """
+        Index the objects changed since the high water mark into the index and remove the objects deleted since the
+        last catch up.
+
+        Returns:
+            tuple: the high water mark for the next catch up
+        """
+        field, value = high_water_mark
+        next_high_water_mark = self.get_high_water_mark(mapping)
+
+        pks = set(mapping.get_model().objects.filter(**{
+            '%s__%s' % (field, 'gte' if field == 'modified' else 'gt'): value,
+        }).values_list('pk', flat=True))
+        # Objects which no longer exist are removed from the index by index_batch.
+        pks.update(pop_rebuild_deletions(mapping))
+        pks = sorted(pks)
+
+        for i in range(0, len(pks), self.chunk_size):
+            index_batch(mapping, pks[i:i + self.chunk_size], index_base)
+
+        self.stdout.write('Caught up with %s changed objects' % len(pks))
 
-        index_objects(mapping, model_objs, temp_index_base, print_progress=True)
+        return next_high_water_mark
@@ -5,7 +5,7 @@ from django.utils.six.moves import input
 from django.core.management import BaseCommand, CommandError
 from django_elasticsearch_dsl.registries import registry
 from elasticsearch_dsl.connections import connections
-from lily.settings.settings import ELASTICSEARCH_DSL
+from lily.search.connections_utils import get_es_dsl_connections
 
 
 class Command(BaseCommand):
@@ -49,7 +49,7 @@ class Command(BaseCommand):
         """
         action = options['action']
         models = self._get_models(options['models'])
-        connections.configure(**ELASTICSEARCH_DSL)
+        connections.configure(**get_es_dsl_connections())
         connection = connections.get_connection(options['using'])
 
         try:
@@ -0,0 +1,145 @@
+from datetime import timedelta
+from unittest import TestCase
+
+from django.core.management import call_command
+from django.db.models import Max
+from django.test import TestCase as DjangoTestCase
+from django.utils import timezone
+from django.utils.six import StringIO
+from mock import MagicMock, call, patch
+
+from lily.contacts.factories import ContactFactory
+from lily.contacts.models import Contact
+from lily.contacts.search import ContactMapping
+from lily.management.commands.index import Command
+from lily.messaging.email.models.models import EmailMessage
+from lily.messaging.email.search import EmailMessageMapping
+from lily.search.indexing import start_rebuild
+from lily.tenant.factories import TenantFactory
+from lily.tests.utils import FakeRedis
+
+
+class IndexCommandTestCase(TestCase):
+    def setUp(self):
+        self.es = MagicMock()
+        self.es.indices.get_aliases.return_value = {}
+        self.es.indices.exists.return_value = False
+        self.es.indices.get_settings.side_effect = lambda index: {
+            index: {
+                'settings': {
+                    'index': {
+                        'number_of_shards': '1',
+                        'number_of_replicas': '2',
+                        'refresh_interval': '30s',
+                    }
+                }
+            }
+        }
+
+        patchers = [
+            patch('lily.management.commands.index.get_es_client', return_value=self.es),
+            patch('lily.search.indexing.get_redis_client', return_value=FakeRedis()),
+            patch.object(Command, 'index_documents'),
+            patch.object(Command, 'get_high_water_mark', return_value=('pk', 0)),
+            patch.object(Command, 'catch_up', return_value=('pk', 0)),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_restores_index_settings(self):
+        """
+        Test that refreshes and replicas are disabled while indexing and restored to their previous values after.
+        """
+        call_command('index', target='contact', stdout=StringIO(), stderr=StringIO())
+
+        temp_index = self.es.indices.create.call_args[0][0]
+        create_settings = self.es.indices.create.call_args[1]['body']['settings']
+        self.assertNotIn('refresh_interval', create_settings)
+        self.assertNotIn('number_of_replicas', create_settings)
+
+        self.assertEqual(self.es.indices.put_settings.call_args_list, [
+            call(index=temp_index, body={'index': {'refresh_interval': '-1', 'number_of_replicas': 0}}),
+            call(index=temp_index, body={'index': {'refresh_interval': '30s', 'number_of_replicas': '2'}}),
+        ])
+        self.assertEqual(Command.index_documents.call_count, 1)
+
+    def test_default_refresh_interval(self):
+        """
+        Test that the default refresh interval is restored when the index doesn't set one.
+        """
+        self.es.indices.get_settings.side_effect = lambda index: {
+            index: {'settings': {'index': {'number_of_replicas': '1'}}}
+        }
+
+        call_command('index', target='contact', stdout=StringIO(), stderr=StringIO())
+
+        self.assertEqual(
+            self.es.indices.put_settings.call_args_list[-1][1]['body'],
+            {'index': {'refresh_interval': '1s', 'number_of_replicas': '1'}}
+        )
+
+
+class IndexCatchUpTestCase(DjangoTestCase):
+    def setUp(self):
+        self.redis = FakeRedis()
+
+        patchers = [
+            patch('lily.search.indexing.get_redis_client', return_value=self.redis),
+            patch('lily.management.commands.index.index_batch'),
+        ]
+        self.mocks = [patcher.start() for patcher in patchers]
+        for patcher in patchers:
+            self.addCleanup(patcher.stop)
+
+        self.index_batch_mock = self.mocks[1]
+
+        self.command = Command(stdout=StringIO())
+        self.command.chunk_size = 2
+        self.tenant = TenantFactory.create()
+
+    def test_get_high_water_mark(self):
+        """
+        Test that models with a modified date are caught up by date and other models by id.
+        """
+        field, value = self.command.get_high_water_mark(ContactMapping)
+        self.assertEqual(field, 'modified')
+        self.assertLessEqual(value, timezone.now() - self.command.catch_up_margin)
+
+        max_pk = EmailMessage.objects.aggregate(max_pk=Max('pk'))['max_pk'] or 0
+        self.assertEqual(self.command.get_high_water_mark(EmailMessageMapping), ('pk', max_pk))
+
+    def test_catch_up(self):
+        """
+        Test that the objects changed and deleted since the high water mark are indexed again or removed.
+        """
+        unchanged = ContactFactory.create(tenant=self.tenant)
+        Contact.objects.filter(pk=unchanged.pk).update(modified=timezone.now() - timedelta(hours=1))
+
+        start_rebuild(ContactMapping, 60)
+        high_water_mark = self.command.get_high_water_mark(ContactMapping)
+
+        changed = ContactFactory.create_batch(2, tenant=self.tenant)
+        deleted = ContactFactory.create(tenant=self.tenant)
+        deleted_pk = deleted.pk
+        deleted.delete(hard=True)
+
+        next_high_water_mark = self.command.catch_up(ContactMapping, 'index_base', high_water_mark)
+
+        pks = []
+        for args, kwargs in self.index_batch_mock.call_args_list:
+            self.assertEqual(args[0], ContactMapping)
+            self.assertEqual(args[2], 'index_base')
+            self.assertLessEqual(len(args[1]), self.command.chunk_size)
+            pks.extend(args[1])
+
+        self.assertEqual(sorted(pks), sorted([contact.pk for contact in changed] + [deleted_pk]))
+        self.assertEqual(next_high_water_mark[0], 'modified')
+
+        # The deletion is only replayed once.
+        self.index_batch_mock.reset_mock()
+        Contact.objects.filter(pk__in=[contact.pk for contact in changed]).update(
+            modified=timezone.now() - timedelta(hours=1)
+        )
+        self.command.catch_up(ContactMapping, 'index_base', high_water_mark)
+        self.assertFalse(self.index_batch_mock.called)
@@ -0,0 +1,25 @@
+import logging
+
+from django.core.management import BaseCommand
+
+from lily.search.functions import update_phone_number_lookup
+from lily.utils.models.models import PhoneNumber
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = """
+    Update_phone_number_lookup builds the caller ID lookup rows of all phone numbers.
+    """
+
+    batch_size = 1000
+
+    def handle(self, **options):
+        phone_number_ids = list(PhoneNumber.objects.order_by('pk').values_list('pk', flat=True))
+
+        for i in range(0, len(phone_number_ids), self.batch_size):
+            update_phone_number_lookup(phone_number_ids[i:i + self.batch_size])
+
+        logger.info('updated the lookup of %s phone numbers' % len(phone_number_ids))
@@ -35,9 +35,15 @@ class EmailAccountAdmin(TenantFilteredChoicesMixin, admin.ModelAdmin):
                 'is_active',
                 'history_id',
                 'temp_history_id',
+                'full_sync_page_token',
                 'is_syncing',
                 'sync_failure_count',
                 'only_new',
+                'is_dirty',
+                'last_activity',
+                'idle_sync_count',
+                'next_sync',
+                'watch_expiration',
                 'owner',
                 'privacy',
                 'previous_privacy',
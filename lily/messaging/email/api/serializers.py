@@ -23,7 +23,7 @@ from lily.messaging.email.utils import (
 
 from ..models.models import (EmailLabel, EmailAccount, EmailMessage, Recipient, EmailAttachment, EmailTemplateFolder,
                              EmailTemplate, SharedEmailConfig, TemplateVariable, DefaultEmailTemplate, EmailDraft,
-                             EmailDraftAttachment)
+                             EmailDraftAttachment, EmailThread)
 from ..services import GmailService
 
 
@@ -160,6 +160,45 @@ class EmailMessageListSerializer(EmailMessageSerializer):
         )
 
 
+class EmailThreadMessageSerializer(serializers.ModelSerializer):
+    sender = RecipientSerializer(many=False, read_only=True)
+
+    class Meta:
+        model = EmailMessage
+        fields = (
+            'id',
+            'sender',
+            'subject',
+            'snippet',
+            'sent_date',
+            'has_attachment',
+        )
+
+
+class EmailThreadSerializer(serializers.ModelSerializer):
+    account = SimpleEmailAccountSerializer(read_only=True)
+    last_message = EmailThreadMessageSerializer(read_only=True)
+
+    class Meta:
+        model = EmailThread
+        fields = (
+            'id',
+            'account',
+            'thread_id',
+            'last_message',
+            'last_sent_date',
+            'participants',
+            'message_count',
+            'unread_count',
+            'is_inbox',
+            'is_trashed',
+            'is_spam',
+            'is_sent',
+            'is_draft',
+            'is_starred',
+        )
+
+
 class EmailAccountSerializer(WritableNestedSerializer):
     labels = EmailLabelSerializer(many=True, read_only=True)
     is_public = serializers.BooleanField()
@@ -1,13 +1,20 @@
+import base64
 import json
 
-from lily.tests.utils import GenericAPITestCase
+from django.test import override_settings
+from rest_framework.test import APITestCase
+
+from lily.tests.utils import GenericAPITestCase, UserBasedTest
 from lily.messaging.email.factories import (EmailDraftFactory, EmailAccountFactory, EmailMessageFactory,
                                             EmailDraftAttachmentFactory)
 from lily.messaging.email.models.models import EmailDraft, EmailAccount, EmailDraftAttachment
+from lily.messaging.email.utils import update_email_threads
+from lily.users.factories import LilyUserFactory
 from lily.messaging.email.api.serializers import EmailDraftCreateSerializer, EmailDraftAttachmentCreateSerializer
 from lily.tenant.middleware import set_current_user, get_current_user
 
 from rest_framework import status
+from rest_framework.reverse import reverse
 from mock import patch
 
 
@@ -269,3 +276,149 @@ class DraftEmailAttachmentTests(GenericAPITestCase):
 
         # The requested page is not found, because the draft belongs to someone else.
         self.assertStatus(request, status.HTTP_404_NOT_FOUND)
+
+
+@override_settings(GMAIL_PUSH_TOKEN='secret')
+class GmailPushNotificationTests(UserBasedTest, APITestCase):
+    """
+    Class containing tests for the Gmail push notification webhook.
+    """
+
+    url = '/api/messaging/email/push/'
+
+    def _post_notification(self, email_address, history_id, token='secret'):
+        notification = json.dumps({'emailAddress': email_address, 'historyId': history_id})
+
+        return self.anonymous_user.post(
+            '{0}?token={1}'.format(self.url, token),
+            {'message': {'data': base64.b64encode(notification), 'messageId': '1'}, 'subscription': 'lily'},
+            format='json'
+        )
+
+    def test_push_notification(self):
+        """
+        Test that a push notification marks the email account as dirty.
+        """
+        email_account = EmailAccountFactory.create(
+            owner=self.user_obj,
+            tenant=self.user_obj.tenant,
+            is_authorized=True,
+            history_id=100
+        )
+
+        response = self._post_notification(email_account.email_address, 101)
+
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        email_account.refresh_from_db()
+        self.assertTrue(email_account.is_dirty)
+
+    def test_push_notification_already_synchronized(self):
+        """
+        Test that a push notification for changes that are already synchronized is ignored.
+        """
+        email_account = EmailAccountFactory.create(
+            owner=self.user_obj,
+            tenant=self.user_obj.tenant,
+            is_authorized=True,
+            history_id=100
+        )
+
+        response = self._post_notification(email_account.email_address, 100)
+
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        email_account.refresh_from_db()
+        self.assertFalse(email_account.is_dirty)
+
+    def test_push_notification_invalid_token(self):
+        """
+        Test that a push notification without the correct token is refused.
+        """
+        email_account = EmailAccountFactory.create(
+            owner=self.user_obj,
+            tenant=self.user_obj.tenant,
+            is_authorized=True,
+            history_id=100
+        )
+
+        response = self._post_notification(email_account.email_address, 101, token='wrong')
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        email_account.refresh_from_db()
+        self.assertFalse(email_account.is_dirty)
+
+
+class EmailThreadTests(UserBasedTest, APITestCase):
+    """
+    Class containing tests for the email thread API.
+    """
+
+    def _create_thread(self, email_account, thread_id, **kwargs):
+        message = EmailMessageFactory.create(account=email_account, thread_id=thread_id, **kwargs)
+        update_email_threads(email_account, [thread_id])
+
+        return message
+
+    def _get_threads(self, **params):
+        request = self.user.get(reverse('emailthread-list'), params)
+        self.assertEqual(request.status_code, status.HTTP_200_OK)
+
+        return request.data['results']
+
+    def test_get_list(self):
+        """
+        Test that the threads of the email accounts of the user are listed with the summary of their messages.
+        """
+        email_account = EmailAccountFactory.create(owner=self.user_obj, tenant=self.user_obj.tenant)
+        message = self._create_thread(
+            email_account, 'thread', read=False, is_inbox_message=True, is_starred_message=True
+        )
+        self._create_thread(email_account, 'thread', read=True, is_inbox_message=False, is_sent_message=True)
+
+        threads = self._get_threads()
+
+        self.assertEqual(len(threads), 1)
+        thread = threads[0]
+        self.assertEqual(thread['thread_id'], 'thread')
+        self.assertEqual(thread['account']['id'], email_account.id)
+        self.assertEqual(thread['message_count'], 2)
+        self.assertEqual(thread['unread_count'], 1)
+        self.assertTrue(thread['is_inbox'])
+        self.assertTrue(thread['is_sent'])
+        self.assertTrue(thread['is_starred'])
+        self.assertFalse(thread['is_trashed'])
+        self.assertFalse(thread['is_spam'])
+        self.assertFalse(thread['is_draft'])
+        self.assertIn(message.sender.email_address, thread['participants'])
+
+    def test_get_list_account_filter(self):
+        """
+        Test that only the threads of active email accounts the user has access to are listed.
+        """
+        email_account = EmailAccountFactory.create(owner=self.user_obj, tenant=self.user_obj.tenant)
+        other_email_account = EmailAccountFactory.create(owner=self.user_obj, tenant=self.user_obj.tenant)
+        inactive_email_account = EmailAccountFactory.create(
+            owner=self.user_obj, tenant=self.user_obj.tenant, is_active=False
+        )
+        private_email_account = EmailAccountFactory.create(
+            owner=LilyUserFactory.create(tenant=self.user_obj.tenant),
+            tenant=self.user_obj.tenant,
+            privacy=EmailAccount.PRIVATE,
+        )
+        other_tenant_email_account = EmailAccountFactory.create(
+            owner=self.other_tenant_user_obj, tenant=self.other_tenant_user_obj.tenant
+        )
+
+        self._create_thread(email_account, 'inbox', is_inbox_message=True)
+        self._create_thread(other_email_account, 'trash', is_trashed_message=True)
+        self._create_thread(inactive_email_account, 'inactive', is_inbox_message=True)
+        self._create_thread(private_email_account, 'private', is_inbox_message=True)
+        self._create_thread(other_tenant_email_account, 'other_tenant', is_inbox_message=True)
+
+        threads = self._get_threads()
+        self.assertEqual(set(thread['thread_id'] for thread in threads), {'inbox', 'trash'})
+
+        threads = self._get_threads(account__id=other_email_account.id)
+        self.assertEqual([thread['thread_id'] for thread in threads], ['trash'])
+
+        threads = self._get_threads(is_inbox=True)
+        self.assertEqual([thread['thread_id'] for thread in threads], ['inbox'])
@@ -1,7 +1,10 @@
+import base64
 import logging
 
+import anyjson
 from django.conf import settings
 from django.db.models import Q
+from django.utils.crypto import constant_time_compare
 from django_filters import rest_framework as filters
 import phonenumbers
 from oauth2client.client import HttpAccessTokenRefreshError
@@ -27,9 +30,9 @@ from .serializers import (EmailLabelSerializer, EmailAccountSerializer, EmailMes
                           TemplateVariableSerializer, EmailAttachmentSerializer, EmailDraftCreateSerializer,
                           EmailDraftReadSerializer, EmailDraftUpdateSerializer, EmailDraftAttachmentReadSerializer,
                           SimpleEmailAccountSerializer, EmailMessageListSerializer,
-                          EmailDraftAttachmentCreateSerializer)
+                          EmailDraftAttachmentCreateSerializer, EmailThreadSerializer)
 from ..models.models import (EmailLabel, EmailAccount, EmailMessage, EmailTemplateFolder, EmailTemplate,
-                             SharedEmailConfig, TemplateVariable, EmailDraft, EmailDraftAttachment)
+                             SharedEmailConfig, TemplateVariable, EmailDraft, EmailDraftAttachment, EmailThread)
 from ..tasks import (trash_email_message, toggle_read_email_message, add_and_remove_labels_for_message,
                      toggle_star_email_message, toggle_spam_email_message)
 from ..utils import get_filtered_message
@@ -423,6 +426,31 @@ class EmailMessageViewSet(mixins.RetrieveModelMixin,
         return Response({'attachments': serializer.data})
 
 
+class EmailThreadViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    List the threads of the email accounts the user has access to, most recent first.
+
+    Every thread is read from a single summary row instead of paging through all messages of the threads.
+    """
+    queryset = EmailThread.objects.all()
+    serializer_class = EmailThreadSerializer
+
+    # Set all filter backends that this viewset uses.
+    filter_backends = (filters.DjangoFilterBackend,)
+    filter_fields = ('account__id', 'is_inbox', 'is_trashed', 'is_spam', 'is_sent', 'is_draft', 'is_starred')
+    swagger_schema = None
+
+    def get_queryset(self):
+        email_accounts = get_shared_email_accounts(self.request.user, True).exclude(
+            Q(is_active=False) | Q(is_authorized=False)
+        )
+
+        return EmailThread.objects.filter(
+            account__in=email_accounts,
+            message_count__gt=0,
+        ).select_related('account', 'last_message', 'last_message__sender').order_by('-last_sent_date')
+
+
 class EmailTemplateFolderViewSet(viewsets.ModelViewSet):
     """
     EmailTemplateFolder API.
@@ -669,6 +697,7 @@ class SearchView(APIView):
 
                     q = u"{0} {1}:{2}".format(q, 'label', label_name)
 
+                connector = None
                 try:
                     connector = GmailConnector(email_account)
                     messages = connector.search(query=q, size=max_results)
@@ -680,6 +709,9 @@ class SearchView(APIView):
                     )
                     # Failing search within one account should not halt the complete search.
                     continue
+                finally:
+                    if connector:
+                        connector.cleanup()
 
                 # Retrieve messages from the database.
                 message_list = message_list.filter(
@@ -764,3 +796,37 @@ class EmailDraftAttachmentViewSet(viewsets.ModelViewSet):
         context['draft'] = self.draft
 
         return context
+
+
+class GmailPushNotificationView(APIView):
+    """
+    Receive the push notifications Gmail publishes through Cloud Pub/Sub and mark the email account as dirty, so the
+    scheduler synchronizes it right away instead of waiting for its next sync.
+    """
+    authentication_classes = []
+    permission_classes = []
+    swagger_schema = None
+
+    def post(self, request, format=None):
+        token = request.query_params.get('token', '')
+        if not settings.GMAIL_PUSH_TOKEN or not constant_time_compare(token, settings.GMAIL_PUSH_TOKEN):
+            return Response(status=status.HTTP_403_FORBIDDEN)
+
+        try:
+            notification = anyjson.loads(base64.b64decode(request.data['message']['data']))
+            email_address = notification['emailAddress']
+            history_id = int(notification['historyId'])
+        except (KeyError, TypeError, ValueError):
+            # Acknowledge the notification anyway, otherwise Pub/Sub keeps delivering it.
+            logger.warning('Invalid Gmail push notification: %s' % request.data)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        # Notifications for changes that are already synchronized can be ignored.
+        EmailAccount.objects.filter(
+            Q(history_id__isnull=True) | Q(history_id__lt=history_id),
+            email_address__iexact=email_address,
+            is_authorized=True,
+            is_deleted=False,
+        ).update(is_dirty=True)
+
+        return Response(status=status.HTTP_204_NO_CONTENT)
@@ -1,18 +1,21 @@
+from collections import defaultdict
 import datetime
 import email
 import gc
 import logging
+import operator
 import re
 
 from dateutil.parser import parse
 from django.conf import settings
-from django.db import transaction
+from django.db import IntegrityError, transaction
+from django.db.models import Q
 import pytz
 
 from lily.messaging.email.connector import LabelNotFoundError
-from lily.messaging.email.utils import determine_message_type
+from lily.messaging.email.utils import determine_message_type, reindex_email_messages, update_email_threads
 
-from ..models.models import EmailMessage, EmailHeader, Recipient, NoEmailMessageId
+from ..models.models import EmailMessage, EmailHeader, EmailThread, Recipient, NoEmailMessageId
 from .utils import get_attachments_from_payload, get_body_html_from_payload, get_body_text_from_payload
 
 logger = logging.getLogger(__name__)
@@ -35,10 +38,25 @@ class MessageBuilder(object):
         self.message = None
         self.labels = []
         self.headers = []
+        self.sender = None
         self.received_by = None
         self.received_by_cc = None
         self.attachments = []
         self.created = False
+        # When True, recipients are collected as (name, email_address) tuples to be resolved for a batch at once.
+        self.bulk = False
+
+    def _reset(self):
+        """
+        Reset current builder info.
+        """
+        self.message = None
+        self.labels = []
+        self.headers = []
+        self.sender = None
+        self.received_by = set()
+        self.received_by_cc = set()
+        self.attachments = []
 
     def get_or_create_message(self, message_dict):
         """
@@ -51,13 +69,7 @@ class MessageBuilder(object):
             message (instance): unsaved message
             created (boolean): True if label is created
         """
-        # Reset current builder info.
-        self.message = None
-        self.labels = []
-        self.headers = []
-        self.received_by = set()
-        self.received_by_cc = set()
-        self.attachments = []
+        self._reset()
 
         # Prevent memory leaks.
         gc.collect()
@@ -103,6 +115,19 @@ class MessageBuilder(object):
             message_id (string): message_id of email
         """
         _, self.created = self.get_or_create_message({'id': message_id})
+
+        # Get the available Label objects for the message from the database and the missing ones by the API.
+        db_label_dict = {label.label_id: label for label in self.manager.email_account.labels.all()}
+        self._store_labels_and_thread(message_info, db_label_dict)
+
+    def _store_labels_and_thread(self, message_info, db_label_dict):
+        """
+        Set the labels and thread_id for current EmailMessage.
+
+        Args:
+            message_info (dict): message info dict
+            db_label_dict (dict): EmailLabels of the email account by label_id, labels retrieved by the API are added
+        """
         self.message.thread_id = message_info['threadId']
 
         # Set boolean identifier for some labels for faster filtering.
@@ -115,16 +140,12 @@ class MessageBuilder(object):
         self.message.is_spam_message = settings.GMAIL_LABEL_SPAM in labels
         self.message.is_starred_message = settings.GMAIL_LABEL_STAR in labels
 
-        # Get the available Label objects for the message from the database and the missing ones by the API.
-        # First, get all labels from the database.
-        db_labels = self.manager.email_account.labels.all()
-
         message_label_set = set(label for label in labels)
         # Remove labels the we won't use in Lily.
         remove = {'CATEGORY_PROMOTIONS', 'IMPORTANT', 'CATEGORY_FORUMS', 'CHAT', 'CATEGORY_SOCIAL', 'CATEGORY_UPDATES',
                   'CATEGORY_PERSONAL'}
         message_label_set = message_label_set - remove
-        db_label_set = set(label.label_id for label in db_labels)
+        db_label_set = set(db_label_dict.keys())
 
         # Use set operations to get the available and missing labels.
         # Labels that exist in Gmail for this message but are not in our db.
@@ -135,6 +156,7 @@ class MessageBuilder(object):
                 try:
                     db_label = self.manager.get_label(label_id, use_db=False)
                     self.labels.append(db_label)
+                    db_label_dict[label_id] = db_label
                 except LabelNotFoundError:
                     logger.error(
                         'Label {} missing in db also not found via API for {}'.format(
@@ -146,8 +168,6 @@ class MessageBuilder(object):
         # Labels that exist both in Gmail and in our db. Those labels are already retrieved from the db above.
         available_label_ids = message_label_set & db_label_set
         if available_label_ids:
-            # Use dict comprehension to get a dictionary with the label_id as the keys and the label as the value.
-            db_label_dict = {label.label_id: label for label in db_labels}
             for label_id in available_label_ids:
                 self.labels.append(db_label_dict[label_id])
 
@@ -228,14 +248,20 @@ class MessageBuilder(object):
             email_address = email.utils.parseaddr(recipient)
 
             if email_address[1] != '':
-                recipient = Recipient.objects.get_or_create(
-                    name=email_address[0],
-                    email_address=email_address[1],
-                )[0]
+                if self.bulk:
+                    # Recipients are resolved for the whole batch in store_message_infos.
+                    recipient = (email_address[0], email_address[1])
+                else:
+                    recipient = Recipient.objects.get_or_create(
+                        name=email_address[0],
+                        email_address=email_address[1],
+                    )[0]
 
                 # Set recipient to correct field
                 if header_name == 'from':
-                    self.message.sender = recipient
+                    self.sender = recipient
+                    if not self.bulk:
+                        self.message.sender = recipient
                 elif header_name in ['to', 'delivered-to']:
                     self.received_by.add(recipient)
                 elif header_name == 'cc':
@@ -246,10 +272,15 @@ class MessageBuilder(object):
             # Only determine message_type at creation, no need to update the message type at label changes.
             if self.message.sent_date and self.message.sender_id:
                 # Message is an email, not a chat.
+                email_thread = EmailThread.objects.filter(
+                    account=self.message.account,
+                    thread_id=self.message.thread_id
+                ).first()
                 message_type, message_type_to_id = determine_message_type(
                     self.message.thread_id,
                     self.message.sent_date,
-                    self.message.account.email_address
+                    self.message.account.email_address,
+                    email_thread
                 )
                 self.message.message_type = message_type
                 if message_type_to_id:
@@ -294,6 +325,8 @@ class MessageBuilder(object):
 
             self.message.skip_signal = False  # Re-enable indexing of the email on the last save.
             self.message.save()
+
+            update_email_threads(self.message.account, [self.message.thread_id])
         else:
             logger.warning('Downloaded a message other than an email.')
 
@@ -302,6 +335,278 @@ class MessageBuilder(object):
                 account=self.manager.email_account
             )
 
+    def store_message_infos(self, message_infos):
+        """
+        Store a batch of messages with bulk inserts instead of a get and save per message.
+
+        Existing messages are resolved with a single query and updated through store_message_info. The new messages,
+        their headers, recipients and labels are written with bulk_create in one transaction.
+
+        Args:
+            message_infos (dict): with the message_id as key and the message info as value
+        """
+        email_account = self.manager.email_account
+        message_ids = list(message_infos.keys())
+
+        existing_message_ids = set(
+            EmailMessage.objects.filter(
+                account=email_account,
+                message_id__in=message_ids
+            ).order_by().values_list('message_id', flat=True)
+        )
+        for message_id in existing_message_ids:
+            self.store_message_info(message_infos[message_id], message_id)
+            self.save()
+
+        no_email_message_ids = set(
+            NoEmailMessageId.objects.filter(
+                account=email_account,
+                message_id__in=message_ids
+            ).values_list('message_id', flat=True)
+        )
+
+        db_label_dict = {label.label_id: label for label in email_account.labels.all()}
+        email_threads = {
+            email_thread.thread_id: email_thread for email_thread in EmailThread.objects.filter(
+                account=email_account,
+                thread_id__in=set(message_info.get('threadId') for message_info in message_infos.values())
+            )
+        }
+        parsed_messages = []
+        new_no_email_message_ids = []
+
+        self.bulk = True
+        try:
+            for message_id, message_info in message_infos.items():
+                if message_id in existing_message_ids:
+                    continue
+
+                self._reset()
+                self.message = EmailMessage(message_id=message_id, account=email_account)
+                self.created = True
+                self._store_labels_and_thread(message_info, db_label_dict)
+                self.message.snippet = message_info['snippet']
+                self._save_message_payload(message_info['payload'])
+
+                # Only store if there is a sent date, otherwise it's a chat message.
+                if not (self.message.sent_date and self.sender):
+                    logger.warning('Downloaded a message other than an email.')
+                    if message_id not in no_email_message_ids:
+                        new_no_email_message_ids.append(message_id)
+                    continue
+
+                # Only determine message_type at creation, no need to update the message type at label changes.
+                message_type, message_type_to_id = determine_message_type(
+                    self.message.thread_id,
+                    self.message.sent_date,
+                    email_account.email_address,
+                    email_threads.get(self.message.thread_id)
+                )
+                self.message.message_type = message_type
+                if message_type_to_id:
+                    self.message.message_type_to_id = message_type_to_id
+
+                self.message.has_attachment = bool(self.attachments)
+
+                parsed_messages.append({
+                    'message': self.message,
+                    'labels': self.labels,
+                    'headers': self.headers,
+                    'sender': self.sender,
+                    'received_by': self.received_by,
+                    'received_by_cc': self.received_by_cc,
+                    'attachments': self.attachments,
+                })
+        finally:
+            self.bulk = False
+            self._reset()
+
+        if new_no_email_message_ids:
+            NoEmailMessageId.objects.bulk_create([
+                NoEmailMessageId(message_id=message_id, account=email_account)
+                for message_id in new_no_email_message_ids
+            ])
+
+        if not parsed_messages:
+            return
+
+        recipient_keys = set()
+        for parsed in parsed_messages:
+            recipient_keys.add(parsed['sender'])
+            recipient_keys.update(parsed['received_by'])
+            recipient_keys.update(parsed['received_by_cc'])
+        recipients = self._get_or_create_recipients(recipient_keys)
+
+        LabelThrough = EmailMessage.labels.through
+        ReceivedByThrough = EmailMessage.received_by.through
+        ReceivedByCcThrough = EmailMessage.received_by_cc.through
+
+        # A message created by another worker in the meantime makes the whole batch fail on the unique constraint.
+        # The retried task stores those messages through the regular update path.
+        with transaction.atomic():
+            for parsed in parsed_messages:
+                parsed['message'].sender = recipients[parsed['sender']]
+
+            # The database returns the primary keys, so they can be used for the related rows.
+            EmailMessage.objects.bulk_create([parsed['message'] for parsed in parsed_messages])
+
+            headers = []
+            label_rows = []
+            received_by_rows = []
+            received_by_cc_rows = []
+            for parsed in parsed_messages:
+                message = parsed['message']
+
+                for header in parsed['headers']:
+                    header.message = message
+                    headers.append(header)
+
+                for label in set(parsed['labels']):
+                    label_rows.append(LabelThrough(emailmessage_id=message.pk, emaillabel_id=label.pk))
+
+                for key in parsed['received_by']:
+                    received_by_rows.append(
+                        ReceivedByThrough(emailmessage_id=message.pk, recipient_id=recipients[key].pk)
+                    )
+
+                for key in parsed['received_by_cc']:
+                    received_by_cc_rows.append(
+                        ReceivedByCcThrough(emailmessage_id=message.pk, recipient_id=recipients[key].pk)
+                    )
+
+            EmailHeader.objects.bulk_create(headers)
+            LabelThrough.objects.bulk_create(label_rows)
+            ReceivedByThrough.objects.bulk_create(received_by_rows)
+            ReceivedByCcThrough.objects.bulk_create(received_by_cc_rows)
+
+        # Attachments are written to the storage, so save them outside of the transaction. When this fails the retried
+        # task replaces the attachments through the regular update path.
+        for parsed in parsed_messages:
+            for attachment in parsed['attachments']:
+                attachment.message = parsed['message']
+                attachment.save()
+
+        update_email_threads(email_account, set(parsed['message'].thread_id for parsed in parsed_messages))
+        reindex_email_messages([parsed['message'].pk for parsed in parsed_messages])
+
+    def store_labels_and_threads(self, label_infos):
+        """
+        Store the labels and thread_id of a batch of existing messages.
+
+        The labels are compared with the stored labels for the whole batch at once, changed boolean identifiers are
+        written with one update per distinct combination of values.
+
+        Args:
+            label_infos (dict): with the message_id as key and a dict with the labelIds and threadId as value
+
+        Returns:
+            set with the message_ids that aren't stored in the database
+        """
+        email_account = self.manager.email_account
+        LabelThrough = EmailMessage.labels.through
+        fields = ('thread_id', 'read', 'is_inbox_message', 'is_sent_message', 'is_draft_message', 'is_trashed_message',
+                  'is_spam_message', 'is_starred_message')
+
+        messages = list(EmailMessage.objects.filter(
+            account=email_account,
+            message_id__in=label_infos.keys()
+        ).order_by().only('message_id', *fields))
+        missing_message_ids = set(label_infos.keys()) - set(message.message_id for message in messages)
+
+        stored_label_ids = defaultdict(set)
+        stored_labels = LabelThrough.objects.filter(
+            emailmessage_id__in=[message.pk for message in messages]
+        ).values_list('emailmessage_id', 'emaillabel_id')
+        for message_pk, label_pk in stored_labels:
+            stored_label_ids[message_pk].add(label_pk)
+
+        db_label_dict = {label.label_id: label for label in email_account.labels.all()}
+
+        remove_filters = []
+        label_rows = []
+        updates = defaultdict(list)
+        changed_pks = []
+        changed_thread_ids = set()
+        try:
+            for message in messages:
+                old_values = tuple(getattr(message, field) for field in fields)
+
+                self.message = message
+                self.labels = []
+                self._store_labels_and_thread(label_infos[message.message_id], db_label_dict)
+
+                new_values = tuple(getattr(message, field) for field in fields)
+                label_ids = set(label.pk for label in self.labels)
+                removed_label_ids = stored_label_ids[message.pk] - label_ids
+                added_label_ids = label_ids - stored_label_ids[message.pk]
+
+                if removed_label_ids:
+                    remove_filters.append(Q(emailmessage_id=message.pk, emaillabel_id__in=removed_label_ids))
+
+                for label_pk in added_label_ids:
+                    label_rows.append(LabelThrough(emailmessage_id=message.pk, emaillabel_id=label_pk))
+
+                if old_values != new_values:
+                    updates[new_values].append(message.pk)
+
+                if removed_label_ids or added_label_ids or old_values != new_values:
+                    changed_pks.append(message.pk)
+                    # The message could be moved to another thread, so both threads change.
+                    changed_thread_ids.update([old_values[0], new_values[0]])
+        finally:
+            self._reset()
+
+        if changed_pks:
+            with transaction.atomic():
+                if remove_filters:
+                    LabelThrough.objects.filter(reduce(operator.or_, remove_filters)).delete()
+
+                LabelThrough.objects.bulk_create(label_rows)
+
+                for values, message_pks in updates.items():
+                    EmailMessage.objects.filter(pk__in=message_pks).update(**dict(zip(fields, values)))
+
+            update_email_threads(email_account, changed_thread_ids)
+            reindex_email_messages(changed_pks)
+
+        return missing_message_ids
+
+    def _get_or_create_recipients(self, recipient_keys):
+        """
+        Get or create the Recipients for the given keys with a single query and a bulk insert.
+
+        Args:
+            recipient_keys (set): of (name, email_address) tuples
+
+        Returns:
+            dict with the (name, email_address) tuple as key and the Recipient as value
+        """
+        recipients = {}
+        email_addresses = set(email_address for name, email_address in recipient_keys)
+        for recipient in Recipient.objects.filter(email_address__in=email_addresses):
+            key = (recipient.name, recipient.email_address)
+            if key in recipient_keys:
+                recipients[key] = recipient
+
+        missing_keys = recipient_keys - set(recipients.keys())
+        if missing_keys:
+            try:
+                with transaction.atomic():
+                    created_recipients = Recipient.objects.bulk_create([
+                        Recipient(name=name, email_address=email_address) for name, email_address in missing_keys
+                    ])
+            except IntegrityError:
+                # Some recipients were created by another worker in the meantime.
+                created_recipients = [
+                    Recipient.objects.get_or_create(name=name, email_address=email_address)[0]
+                    for name, email_address in missing_keys
+                ]
+
+            for recipient in created_recipients:
+                recipients[(recipient.name, recipient.email_address)] = recipient
+
+        return recipients
+
     def cleanup(self):
         """
         Cleanup references, to prevent reference cycle
@@ -310,6 +615,7 @@ class MessageBuilder(object):
         self.message = None
         self.labels = []
         self.headers = []
+        self.sender = None
         self.received_by = None
         self.received_by_cc = None
         self.attachments = []
@@ -3,8 +3,10 @@ import re
 import logging
 import StringIO
 
+from django.conf import settings
 from django.core.files import File
 from bs4 import BeautifulSoup, UnicodeDammit
+from lily.messaging.email.connector import NotFoundError
 from lily.messaging.email.utils import get_extensions_for_type
 
 from ..models.models import EmailAttachment
@@ -105,10 +107,46 @@ def create_attachment(part, body_html, message_id, attachments, connector):
             # Look if the cid is in the body html.
             inline = re.search("cid:{0}".format(cid), body) is not None
 
-    # Get file data from part or from remote.
+    if headers and 'content-type' in headers:
+        content_type = headers['content-type'].split(';')[0]
+    else:
+        content_type = 'application/octet-stream'
+
+    filename = part.get('filename', '').rsplit('\\')[-1]
+    if len(filename) > 200:
+        filename = None
+
+    # No filename in part, create a name.
+    if not filename:
+        extensions = get_extensions_for_type(content_type)
+        if part.get('partId'):
+            filename = 'attachment-%s%s' % (part.get('partId'), extensions.next())
+        else:
+            logger.warning('No part id, no filename')
+            filename = 'attachment-{}-0'.format(len(attachments), extensions.next())
+
+    # Create a EmailAttachment object.
+    attachment = EmailAttachment()
+    attachment.filename = filename
+    attachment.content_type = content_type
+    attachment.size = part['body'].get('size', 0)
+    attachment.inline = inline
+    attachment.part_id = part.get('partId', '')
+    attachment.gmail_attachment_id = part['body'].get('attachmentId', '')
+    attachment.tenant_id = connector.email_account.tenant_id
+
+    # Check if inline attachment.
+    if inline:
+        attachment.cid = headers.get('content-id')
+
+    # Get file data from part or from remote. Most attachments are never opened, so unless the eager policy applies
+    # the file is downloaded when it's accessed for the first time.
     if 'data' in part['body']:
         file_data = part['body']['data']
     elif 'attachmentId' in part['body']:
+        if settings.GMAIL_LAZY_ATTACHMENTS and not (inline and settings.GMAIL_EAGER_INLINE_ATTACHMENTS):
+            return attachment
+
         file_data = connector.get_attachment(message_id, part['body']['attachmentId'])
         if file_data:
             file_data = file_data.get('data')
@@ -119,41 +157,93 @@ def create_attachment(part, body_html, message_id, attachments, connector):
         logger.warning('No attachment, not storing anything')
         return
 
+    set_attachment_file(attachment, file_data)
+
+    return attachment
+
+
+def set_attachment_file(attachment, file_data):
+    """
+    Set the file of the attachment from the file data of Gmail.
+
+    Args:
+        attachment (EmailAttachment): attachment to set the file of
+        file_data (string): base64 encoded file data
+    """
     file_data = base64.urlsafe_b64decode(file_data.encode('UTF-8'))
 
     # Create as string file.
     file = StringIO.StringIO(file_data)
-    if headers and 'content-type' in headers:
-        file.content_type = headers['content-type'].split(';')[0]
-    else:
-        file.content_type = 'application/octet-stream'
-
+    file.content_type = attachment.content_type or 'application/octet-stream'
     file.size = len(file_data)
-    file.name = part.get('filename', '').rsplit('\\')[-1]
-    if len(file.name) > 200:
-        file.name = None
-
-    # No filename in part, create a name.
-    if not file.name:
-        extensions = get_extensions_for_type(file.content_type)
-        if part.get('partId'):
-            file.name = 'attachment-%s%s' % (part.get('partId'), extensions.next())
-        else:
-            logger.warning('No part id, no filename')
-            file.name = 'attachment-{}-0'.format(len(attachments), extensions.next())
+    file.name = attachment.filename
 
-    # Create a EmailAttachment object.
-    attachment = EmailAttachment()
     attachment.attachment = File(file, file.name)
     attachment.size = file.size
-    attachment.inline = inline
-    attachment.tenant_id = connector.email_account.tenant_id
 
-    # Check if inline attachment.
-    if inline:
-        attachment.cid = headers.get('content-id')
 
-    return attachment
+def download_attachment(attachment, connector):
+    """
+    Download the file of a lazily synchronized attachment from Gmail and store it.
+
+    Args:
+        attachment (EmailAttachment): attachment without a file
+        connector (GmailConnector): active connector to communicate with Gmail
+
+    Returns:
+        bool: True if the file is stored
+    """
+    message_id = attachment.message.message_id
+
+    try:
+        file_data = connector.get_attachment(message_id, attachment.gmail_attachment_id)
+    except NotFoundError:
+        # The attachment id isn't valid anymore, look up the current one by the part of the message.
+        try:
+            message_info = connector.get_message_info(message_id)
+        except NotFoundError:
+            logger.warning('Message %s of attachment %s is removed from Gmail' % (message_id, attachment.pk))
+            return False
+
+        part = get_part_from_payload(message_info.get('payload', {}), attachment.part_id)
+        if not part or 'attachmentId' not in part['body']:
+            logger.warning('Attachment %s is removed from message %s' % (attachment.pk, message_id))
+            return False
+
+        attachment.gmail_attachment_id = part['body']['attachmentId']
+        file_data = connector.get_attachment(message_id, attachment.gmail_attachment_id)
+
+    if not file_data or 'data' not in file_data:
+        logger.warning('No attachment could be downloaded for attachment %s' % attachment.pk)
+        return False
+
+    attachment.tenant_id = attachment.message.account.tenant_id
+    set_attachment_file(attachment, file_data['data'])
+    attachment.save()
+
+    return True
+
+
+def get_part_from_payload(payload, part_id):
+    """
+    Return the part with the given part id from the payload.
+
+    Args:
+        payload (dict): message payload
+        part_id (string): id of the part
+
+    Returns:
+        part (dict) or None if the payload doesn't contain the part
+    """
+    if payload.get('partId', '') == part_id:
+        return payload
+
+    for part in payload.get('parts', []):
+        found = get_part_from_payload(part, part_id)
+        if found:
+            return found
+
+    return None
 
 
 def get_headers_from_payload(part):
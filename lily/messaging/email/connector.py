@@ -11,7 +11,8 @@ from googleapiclient.http import MediaIoBaseUpload
 from oauth2client.client import HttpAccessTokenRefreshError
 
 from .credentials import get_credentials, InvalidCredentialsError
-from .services import GmailService
+from .quota import GmailQuota, get_quota_units, DEFAULT_QUOTA_UNITS
+from .services import GmailService, gmail_service_cache
 
 logger = logging.getLogger(__name__)
 
@@ -20,6 +21,15 @@ class FailedServiceCallException(Exception):
     pass
 
 
+class RateLimitExceededError(FailedServiceCallException):
+    """
+    The quota of the email account is exhausted, the call can be done again after countdown seconds.
+    """
+    def __init__(self, countdown):
+        super(RateLimitExceededError, self).__init__('Rate limit exceeded, retry in %s seconds' % countdown)
+        self.countdown = int(countdown) + 1
+
+
 class ConnectorError(Exception):
     pass
 
@@ -44,20 +54,34 @@ class MailNotEnabledError(ConnectorError):
     pass
 
 
+class InvalidPageTokenError(ConnectorError):
+    pass
+
+
 class GmailConnector(object):
     gmail_service = None
+    quota = None
 
-    def __init__(self, email_account):
+    def __init__(self, email_account, max_quota_wait=None):
         self.email_account = email_account
+        # Requests can't wait as long for the quota as tasks, so they pass a shorter maximum.
+        self.max_quota_wait = settings.GMAIL_QUOTA_MAX_WAIT if max_quota_wait is None else max_quota_wait
         self.history_id = self.email_account.history_id
 
-        try:
-            credentials = get_credentials(self.email_account)
-        except InvalidCredentialsError:
-            logger.exception('cannot sync account, no valid credentials')
-            raise
-        else:
-            self.gmail_service = GmailService(credentials)
+        # Building the service and refreshing the access token is expensive, so reuse the service of earlier tasks.
+        # The service is returned to the cache by cleanup.
+        self.gmail_service = gmail_service_cache.checkout(self.email_account.pk)
+        if self.gmail_service is None:
+            try:
+                credentials = get_credentials(self.email_account)
+            except InvalidCredentialsError:
+                logger.exception('cannot sync account, no valid credentials')
+                raise
+            else:
+                self.gmail_service = GmailService(credentials)
+
+        if settings.GMAIL_QUOTA_ENABLED:
+            self.quota = GmailQuota(self.email_account.pk)
 
     def backoff(self, msg, attempt):
         if not settings.TESTING:  # Disable sleeping while running tests.
@@ -67,11 +91,38 @@ class GmailConnector(object):
 
             time.sleep(sleep_time)
 
+    def draw_quota(self, units):
+        """
+        Take the quota units for an api call, short waits for the quota to become available are slept.
+
+        Args:
+            units (int): number of quota units of the api call
+
+        Raises:
+            RateLimitExceededError: when the quota isn't available soon enough, so the task can be rescheduled
+        """
+        if not self.quota:
+            return
+
+        for n in range(0, 3):
+            wait = self.quota.acquire(units)
+            if not wait:
+                return
+
+            if wait > self.max_quota_wait:
+                break
+
+            time.sleep(wait)
+
+        raise RateLimitExceededError(wait)
+
     def execute_service_call(self, service):
         """
         Try to execute a service call.
 
-        If the call fails because the rate limit is exceeded, sleep x seconds to try again.
+        The call draws from the quota of the email account first. If the call fails because the rate limit is
+        exceeded, the email account is throttled and the call is tried again when the quota allows it. Without a
+        shared quota, sleep x seconds to try again.
 
         Args:
             service (instance): service instance
@@ -79,6 +130,8 @@ class GmailConnector(object):
             response from service instance
         """
         for n in range(0, 6):
+            self.draw_quota(get_quota_units(service))
+
             try:
                 return self.gmail_service.execute_service(service)
             except HttpError as error:
@@ -103,11 +156,19 @@ class GmailConnector(object):
 
                     if error.get('code') == 403 and error.get('errors')[0].get('reason') in ['rateLimitExceeded',
                                                                                              'userRateLimitExceeded']:
-                        # Apply exponential backoff.
-                        self.backoff(msg='Limit overrated, sleeping for %s seconds', attempt=n)
+                        if self.quota:
+                            # The next attempt waits for the penalty or reschedules when the penalty is too long.
+                            self.quota.throttle()
+                        else:
+                            # Apply exponential backoff.
+                            self.backoff(msg='Limit overrated, sleeping for %s seconds', attempt=n)
                     elif error.get('code') == 429:
-                        # Apply exponential backoff.
-                        self.backoff(msg='Too many concurrent requests for user, sleeping for %d seconds', attempt=n)
+                        if self.quota:
+                            self.quota.throttle()
+                        else:
+                            # Apply exponential backoff.
+                            self.backoff(msg='Too many concurrent requests for user, sleeping for %d seconds',
+                                         attempt=n)
                     elif error.get('code') == 503 or error.get('code') == 500:
                         # Apply exponential backoff.
                         self.backoff(msg='Backend error, sleeping for %d seconds', attempt=n)
@@ -148,6 +209,7 @@ class GmailConnector(object):
                 self.email_account.is_authorized = False
                 self.email_account.is_syncing = False
                 self.email_account.save()
+                gmail_service_cache.invalidate(self.email_account.pk)
                 logger.error('Invalid access token for account %s' % self.email_account)
                 raise
 
@@ -191,42 +253,35 @@ class GmailConnector(object):
 
         return history
 
-    def get_all_message_id_list(self):
+    def get_message_id_page(self, page_token=None):
         """
-        Fetch all messageIds from the gmail api. Chat messages are filtered out.
+        Fetch a single page of messageIds from the gmail api. Chat messages are filtered out.
+
+        Args:
+            page_token (string, optional): token of the page to fetch, the first page if omitted
 
         Returns:
             list with messageIds and threadIds
-        """
-        # First retrieve user profile including the latest history id.
-        response = self.get_history_id()
-        history_id = response.get('historyId', 0)
-
-        response = self.execute_service_call(
-            self.gmail_service.service.users().messages().list(
-                userId='me',
-                quotaUser=self.email_account.id,
-                q='!in:chats',
-            ))
+            string with the token of the next page, None if this is the last page
 
-        messages = response['messages'] if 'messages' in response else []
-
-        # Check if there are more pages.
-        while 'nextPageToken' in response:
-            page_token = response['nextPageToken']
-            response = self.execute_service_call(self.gmail_service.service.users().messages().list(
-                userId='me',
-                quotaUser=self.email_account.id,
-                pageToken=page_token,
-                q='!in:chats',
-            ))
-            messages.extend(response.get('messages', []))
-
-        if history_id > self.history_id:
-            # Store if it's past the current history id.
-            self.history_id = history_id
+        Raises:
+            InvalidPageTokenError: when Gmail rejects the page token, page tokens expire after a while
+        """
+        try:
+            response = self.execute_service_call(
+                self.gmail_service.service.users().messages().list(
+                    userId='me',
+                    quotaUser=self.email_account.id,
+                    pageToken=page_token,
+                    maxResults=settings.GMAIL_FULL_MESSAGE_BATCH_SIZE,
+                    q='!in:chats',
+                ))
+        except HttpError as error:
+            if page_token and error.resp.status == 400:
+                raise InvalidPageTokenError
+            raise
 
-        return messages
+        return response.get('messages', []), response.get('nextPageToken')
 
     def get_message_info(self, message_id):
         """
@@ -246,6 +301,132 @@ class GmailConnector(object):
 
         return response
 
+    def get_message_info_batch(self, message_ids):
+        """
+        Fetch message information for multiple messages with a single batch request.
+
+        Requests within the batch that fail because of rate limiting or a backend error are retried with exponential
+        backoff. Messages that no longer exist on the remote are left out of the result.
+
+        Args:
+            message_ids (list): ids of the messages, at most GMAIL_BATCH_REQUEST_SIZE
+
+        Returns:
+            dict with the message_id as key and the message info as value
+        """
+        message_infos = {}
+        # Request ids within a batch have to be unique.
+        pending_ids = list(set(message_ids))
+
+        for n in range(0, 6):
+            # Every request in the batch counts on its own for the quota.
+            self.draw_quota(len(pending_ids) * DEFAULT_QUOTA_UNITS)
+
+            retry_ids = []
+            rate_limited = []
+            errors = []
+
+            def callback(request_id, response, exception):
+                if exception is None:
+                    message_infos[request_id] = response
+                elif isinstance(exception, HttpError) and self.is_retryable_error(exception):
+                    retry_ids.append(request_id)
+                    if self.is_rate_limit_error(exception):
+                        rate_limited.append(request_id)
+                elif isinstance(exception, HttpError) and exception.resp.status == 404:
+                    logger.debug('Message %s already deleted from remote' % request_id)
+                else:
+                    errors.append(exception)
+
+            batch = self.gmail_service.new_batch_http_request(callback=callback)
+            for message_id in pending_ids:
+                batch.add(
+                    self.gmail_service.service.users().messages().get(
+                        userId='me',
+                        id=message_id,
+                        quotaUser=self.email_account.id,
+                    ),
+                    request_id=message_id
+                )
+
+            try:
+                self.gmail_service.execute_service(batch)
+            except HttpError as error:
+                if not self.is_retryable_error(error):
+                    logger.exception('Batch request failed for account %s' % self.email_account)
+                    raise
+
+                # The batch request as a whole failed, so retry every message in it.
+                retry_ids = pending_ids
+                if self.is_rate_limit_error(error):
+                    rate_limited = pending_ids
+            except HttpAccessTokenRefreshError:
+                # Thrown when a user removes Lily from the connected apps or
+                # changes the credentials of the Google account.
+                self.email_account.is_authorized = False
+                self.email_account.is_syncing = False
+                self.email_account.save()
+                gmail_service_cache.invalidate(self.email_account.pk)
+                logger.error('Invalid access token for account %s' % self.email_account)
+                raise
+
+            if errors:
+                logger.error('Error occurred for account {} in batch request: {}'.format(self.email_account, errors))
+                raise errors[0]
+
+            if not retry_ids:
+                return message_infos
+
+            pending_ids = retry_ids
+            if rate_limited and self.quota:
+                # The next attempt waits for the penalty or reschedules when the penalty is too long.
+                self.quota.throttle()
+            else:
+                # Apply exponential backoff.
+                self.backoff(msg='Batch request partially failed, sleeping for {} seconds', attempt=n)
+
+        logger.exception('Batch request failed after all retries')
+        raise FailedServiceCallException('Batch request failed after all retries')
+
+    def is_retryable_error(self, error):
+        """
+        Check if the HttpError is caused by rate limiting or a temporary backend failure.
+
+        Args:
+            error (instance): HttpError instance
+
+        Returns:
+            True if the request can be retried after a backoff
+        """
+        return error.resp.status in (500, 502, 503) or self.is_rate_limit_error(error)
+
+    def is_rate_limit_error(self, error):
+        """
+        Check if the HttpError is caused by exceeding the rate limit of the email account.
+
+        Args:
+            error (instance): HttpError instance
+
+        Returns:
+            True if Google refused the request because of too many requests
+        """
+        if error.resp.status == 429:
+            return True
+
+        if error.resp.status == 403:
+            try:
+                content = anyjson.loads(error.content)
+            except ValueError:
+                return False
+
+            # Error could be nested, so unwrap if necessary.
+            content = content.get('error', content)
+            reasons = set(item.get('reason') for item in content.get('errors', []))
+
+            return bool(reasons & {'rateLimitExceeded', 'userRateLimitExceeded'})
+
+        return False
+
     def get_label_list(self):
         """
         Fetch all labels from the email account.
@@ -431,6 +612,24 @@ class GmailConnector(object):
             ))
         return response
 
+    def watch(self, topic_name):
+        """
+        Let Gmail publish a push notification to the Cloud Pub/Sub topic for every change of the mailbox.
+
+        Args:
+            topic_name (string): full name of the Cloud Pub/Sub topic
+
+        Returns:
+            dict with the historyId and the expiration of the watch in milliseconds since epoch
+        """
+        response = self.execute_service_call(
+            self.gmail_service.service.users().watch(
+                userId='me',
+                quotaUser=self.email_account.id,
+                body={'topicName': topic_name},
+            ))
+        return response
+
     def search(self, query, size=100):
         # The maxResults parameter on the API service call is used for the number of results per page and not for the
         # total search results.
@@ -460,8 +659,12 @@ class GmailConnector(object):
 
     def cleanup(self):
         """
-        Cleanup references, to prevent reference cycle.
+        Return the Gmail service to the cache and cleanup references, to prevent reference cycle.
         """
+        if self.gmail_service and self.email_account and self.email_account.is_authorized:
+            gmail_service_cache.checkin(self.email_account.pk, self.gmail_service)
+
         self.gmail_service = None
+        self.quota = None
         self.email_account = None
         self.history_id = None
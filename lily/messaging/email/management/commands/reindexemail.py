@@ -0,0 +1,86 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import BaseCommand
+
+from lily.search.indexing import parallel_index_objects
+from lily.search.scan_search import ModelMappings
+
+from ...models.models import EmailMessage
+
+
+class Command(BaseCommand):
+    help = """
+    Reindexemail indexes the email messages into the current index, without creating a new index.
+
+    The messages are sharded by ranges of ids over a pool of processes and every range is indexed with one bulk
+    request. The id up to which all messages are indexed is stored, so an interrupted run continues with --resume.
+    """
+
+    checkpoint_key = 'reindexemail_checkpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-w', '--workers',
+            action='store',
+            dest='workers',
+            type=int,
+            default=4,
+            help='Number of processes indexing at the same time.'
+        )
+        parser.add_argument(
+            '-c', '--chunk-size',
+            action='store',
+            dest='chunk_size',
+            type=int,
+            default=500,
+            help='Number of message ids indexed with one bulk request.'
+        )
+        parser.add_argument(
+            '--tenant',
+            action='store',
+            dest='tenant',
+            type=int,
+            help='Only index the messages of this tenant.'
+        )
+        parser.add_argument(
+            '--from-id',
+            action='store',
+            dest='from_id',
+            type=int,
+            help='Only index the messages from this id.'
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            dest='resume',
+            help='Continue from the id stored by the previous run.'
+        )
+
+    def handle(self, **options):
+        mapping = ModelMappings.model_to_mappings[EmailMessage]
+        checkpoint_key = self.checkpoint_key
+        if options['tenant']:
+            checkpoint_key = '%s:%s' % (checkpoint_key, options['tenant'])
+
+        filters = {}
+        if options['tenant']:
+            filters['account__tenant_id'] = options['tenant']
+
+        start_id = options['from_id']
+        if options['resume']:
+            start_id = cache.get(checkpoint_key)
+            self.stdout.write('Resuming from id %s' % start_id)
+
+        indexed = parallel_index_objects(
+            mapping,
+            settings.ES_OLD_INDEXES['default'],
+            filters=filters,
+            workers=options['workers'],
+            chunk_size=options['chunk_size'],
+            start_id=start_id,
+            checkpoint_key=checkpoint_key,
+            print_progress=True,
+        )
+
+        cache.delete(checkpoint_key)
+        self.stdout.write('\nIndexed %s email messages.' % indexed)
@@ -0,0 +1,36 @@
+import logging
+
+from django.core.management import BaseCommand
+
+from ...models.models import EmailAccount, EmailMessage
+from ...utils import update_email_threads
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = """
+    Updateemailthreads calculates the thread summaries of all email accounts from their stored messages.
+    """
+
+    batch_size = 500
+
+    def handle(self, **options):
+        email_accounts = EmailAccount.objects.filter(is_deleted=False)
+
+        number_of_accounts = email_accounts.count()
+        for index, email_account in enumerate(email_accounts):
+            thread_ids = list(EmailMessage.objects.filter(
+                account=email_account
+            ).order_by().values_list('thread_id', flat=True).distinct())
+
+            for i in range(0, len(thread_ids), self.batch_size):
+                update_email_threads(email_account, thread_ids[i:i + self.batch_size])
+
+            logger.info('updated %s threads for %s (%s/%s)' % (
+                len(thread_ids),
+                email_account,
+                index + 1,
+                number_of_accounts,
+            ))
@@ -1,15 +1,20 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
 import logging
 import gc
 
 from django.conf import settings
+from django.utils import timezone
 from googleapiclient.errors import HttpError
 
 from lily.celery import app
 from .builders.label import LabelBuilder
 from .builders.message import MessageBuilder
-from .connector import GmailConnector, NotFoundError, LabelNotFoundError, MailNotEnabledError
+from .connector import (GmailConnector, InvalidPageTokenError, NotFoundError, LabelNotFoundError,
+                        MailNotEnabledError)
 from .credentials import InvalidCredentialsError
-from .models.models import EmailLabel, EmailMessage, NoEmailMessageId
+from .models.models import EmailAccount, EmailLabel, EmailMessage, NoEmailMessageId
+from .utils import update_email_threads
 
 logger = logging.getLogger(__name__)
 
@@ -40,51 +45,114 @@ class GmailManager(object):
             self.label_builder = LabelBuilder(self)
 
     def full_synchronize(self):
-        message_ids = self.connector.get_all_message_id_list()
+        """
+        Synchronize one page of the message list of the EmailAccount.
+
+        Every page is diffed against the database and followed up by a task for the next page. The token of the next
+        page is stored on the EmailAccount, so a crashed full sync resumes from there instead of starting over. A
+        full sync with a page token which Gmail no longer accepts starts over.
+        """
+        stored_page_token = page_token = self.email_account.full_sync_page_token
+
+        # The scheduler resumes the full sync when the next page isn't reached before this deadline.
+        self.email_account.next_sync = timezone.now() + timedelta(seconds=settings.GMAIL_FULL_SYNC_PAGE_TIMEOUT)
+        self.email_account.save(update_fields=['next_sync'])
+
+        if page_token:
+            try:
+                messages, next_page_token = self.connector.get_message_id_page(page_token)
+            except InvalidPageTokenError:
+                logger.warning('Page token rejected, starting the full sync over for %s' % self.email_account)
+                page_token = ''
+
+        if not page_token:
+            # Starting a new full sync, so first retrieve the latest history id to continue from when it's finished.
+            response = self.connector.get_history_id()
+            self.email_account.temp_history_id = int(response.get('historyId', 0))
+            self.email_account.save(update_fields=['temp_history_id'])
+
+            messages, next_page_token = self.connector.get_message_id_page(None)
+
+        page_message_ids = [message_dict['id'] for message_dict in messages]
 
         # Check for message_ids that are saved as non email messages.
         no_message_ids_in_db = set(
             NoEmailMessageId.objects.filter(
-                account=self.email_account
-            ).values_list('message_id', flat='true')
+                account=self.email_account,
+                message_id__in=page_message_ids
+            ).values_list('message_id', flat=True)
         )
 
         # Check for message_ids that are saved as email messages.
         message_ids_in_db = set(
             EmailMessage.objects.filter(
-                account=self.email_account
-            ).values_list('message_id', flat='true')
+                account=self.email_account,
+                message_id__in=page_message_ids
+            ).order_by().values_list('message_id', flat=True)
         )
 
+        new_message_ids = []
+
         # What do we need to do with every email message?
-        for i, message_dict in enumerate(message_ids):
-            logger.debug('Check for existing messages, %s/%s' % (i, len(message_ids)))
-            if message_dict['id'] in no_message_ids_in_db:
+        for message_id in page_message_ids:
+            if message_id in no_message_ids_in_db:
                 # Not an email, but chatmessage, skip.
                 pass
-            elif message_dict['id'] not in message_ids_in_db:
-                # Message is new.
-                app.send_task(
-                    'download_email_message',
-                    args=[self.email_account.id, message_dict['id']],
-                    queue='email_first_sync'
-                )
+            elif message_id not in message_ids_in_db:
+                # Message is new, download it together with the other new messages of this page.
+                new_message_ids.append(message_id)
             else:
                 # We only need to update the labels for this message.
                 app.send_task(
                     'update_labels_for_message',
-                    args=[self.email_account.id, message_dict['id']],
+                    args=[self.email_account.id, message_id],
                     queue='email_first_sync'
                 )
 
+        if new_message_ids:
+            # Download the new messages in a batch to reduce the number of tasks and requests.
+            app.send_task(
+                'download_email_messages',
+                args=[self.email_account.id, new_message_ids],
+                queue='email_first_sync'
+            )
+
+        logger.debug('Queued tasks for %s messages of full sync page for %s' % (
+            len(page_message_ids),
+            self.email_account
+        ))
+
+        # Store the checkpoint before continuing with the next page. Only one task continues when the scheduler
+        # resumed a full sync which was still running.
+        updated = EmailAccount.objects.filter(
+            pk=self.email_account.pk,
+            full_sync_page_token=stored_page_token,
+        ).update(full_sync_page_token=next_page_token or '')
+        self.email_account.full_sync_page_token = next_page_token or ''
+
+        if not updated:
+            logger.info('Full sync page already processed by another task for %s' % self.email_account)
+            return
+
+        if next_page_token:
+            app.send_task('full_synchronize_email_account', args=[self.email_account.id])
+            return
+
         # Finally, add a task to keep track when the sync queue is finished.
         app.send_task(
             'full_sync_finished',
             args=[self.email_account.id],
             queue='email_first_sync'
         )
-        # Only if transaction was successful, we update the history ID.
+
+        # All pages are processed, so we update the history ID to the one from the start of the full sync.
+        if self.email_account.temp_history_id > self.connector.history_id:
+            self.connector.history_id = self.email_account.temp_history_id
         self.connector.save_history_id()
+
+        self.email_account.temp_history_id = None
+        self.email_account.next_sync = None
+        self.email_account.save(update_fields=['temp_history_id', 'next_sync'])
         logger.debug('Finished queuing up tasks for email sync, storing history id for %s' % self.email_account)
 
     def download_message(self, message_id):
@@ -109,15 +177,46 @@ class GmailManager(object):
             self.message_builder.store_message_info(message_info, message_id)
             self.message_builder.save()
 
+    def download_messages(self, message_ids):
+        """
+        Download multiple messages from Google with batch requests and parse them into EmailMessages.
+
+        Arguments:
+            message_ids (list): message_ids of the messages
+        """
+        # Messages that are already downloaded only need their labels updated.
+        existing_message_ids = set(
+            EmailMessage.objects.filter(
+                account=self.email_account,
+                message_id__in=message_ids
+            ).order_by().values_list('message_id', flat=True)
+        )
+        for message_id in existing_message_ids:
+            self.update_labels_for_message(message_id)
+
+        new_message_ids = [message_id for message_id in message_ids if message_id not in existing_message_ids]
+        batch_size = settings.GMAIL_BATCH_REQUEST_SIZE
+
+        for i in range(0, len(new_message_ids), batch_size):
+            # Messages that are deleted from the remote in the meantime aren't part of the result.
+            message_infos = self.connector.get_message_info_batch(new_message_ids[i:i + batch_size])
+            self.message_builder.store_message_infos(message_infos)
+
     def sync_by_history(self):
         """
         Synchronize EmailAccount by history.
 
-        Fetches the changes from the GMail api and creates tasks for the mutations.
+        Fetches the changes from the GMail api. Label changes are stored in bulk, tasks are created to download new
+        messages.
         """
         logger.info('updating history for %s with history_id %s' % (self.email_account, self.email_account.history_id))
         old_history_id = self.email_account.history_id
 
+        # Clear the push notification before fetching the history, so a notification during the sync isn't lost.
+        if self.email_account.is_dirty:
+            EmailAccount.objects.filter(pk=self.email_account.pk).update(is_dirty=False)
+            self.email_account.is_dirty = False
+
         try:
             history = self.connector.get_history()
         except MailNotEnabledError:
@@ -143,10 +242,15 @@ class GmailManager(object):
             return
 
         self.connector.save_history_id()
+        self.administer_sync_activity(bool(history))
         if not len(history):
             return
 
-        new_messages = set()
+        new_messages = OrderedDict()
+        deleted_messages = set()
+        # The history items contain the complete set of labels of a message, so only the last state of every message
+        # in the history has to be stored.
+        label_infos = OrderedDict()
         edit_labels = set()
 
         # Collect message ids for new, removed email messages and email messages with label changes.
@@ -159,42 +263,58 @@ class GmailManager(object):
                     # Skip chat messages.
                     if 'labelIds' in item['message'] and settings.GMAIL_LABEL_CHAT not in item['message']['labelIds']:
                         logger.debug('Message added %s' % item['message']['id'])
-                        new_messages.add(item['message']['id'])
+                        new_messages[item['message']['id']] = True
 
-            # Email messages with labels added.
-            for message in history_item.get('labelsAdded', []):
-                if settings.GMAIL_LABEL_CHAT in message['message']['labelIds']:
+            # Email messages with labels added or removed.
+            for message in history_item.get('labelsAdded', []) + history_item.get('labelsRemoved', []):
+                message_id = message['message']['id']
+                if 'labelIds' in message['message'] and settings.GMAIL_LABEL_CHAT in message['message']['labelIds']:
                     continue
 
-                if message['message']['id'] not in new_messages:
-                    logger.debug('message updated %s', message['message']['id'])
-                    edit_labels.add(message['message']['id'])
-
-            # Email messages with labels removed.
-            for message in history_item.get('labelsRemoved', []):
-                if 'labelIds' in message['message'] and settings.GMAIL_LABEL_CHAT in message['message']['labelIds']:
+                if message_id in new_messages:
                     continue
 
-                if message['message']['id'] not in new_messages:
-                    logger.debug('message updated %s', message['message']['id'])
-                    edit_labels.add(message['message']['id'])
+                logger.debug('message updated %s', message_id)
+                if 'labelIds' in message['message'] and 'threadId' in message['message']:
+                    label_infos.pop(message_id, None)
+                    label_infos[message_id] = {
+                        'labelIds': message['message']['labelIds'],
+                        'threadId': message['message']['threadId'],
+                    }
+                    edit_labels.discard(message_id)
+                else:
+                    # Without the labels in the history the labels have to be fetched for this message.
+                    label_infos.pop(message_id, None)
+                    edit_labels.add(message_id)
 
             # Removed email messages.
             for message in history_item.get('messagesDeleted', []):
                 logger.debug('deleting message %s' % message['message']['id'])
+                deleted_messages.add(message['message']['id'])
 
-                # When deleting the message, there is no need anymore to create a download it or update its labels.
-                new_messages.discard(message['message']['id'])
-                edit_labels.discard(message['message']['id'])
+        # When deleting the message, there is no need anymore to download it or update its labels.
+        if deleted_messages:
+            edit_labels -= deleted_messages
+            for message_id in deleted_messages:
+                new_messages.pop(message_id, None)
+                label_infos.pop(message_id, None)
 
-                EmailMessage.objects.filter(
-                    message_id=message['message']['id'], account=self.email_account
-                ).order_by().delete()
+            deleted = EmailMessage.objects.filter(
+                account=self.email_account,
+                message_id__in=deleted_messages
+            ).order_by()
+            deleted_thread_ids = set(deleted.values_list('thread_id', flat=True))
+            deleted.delete()
+            update_email_threads(self.email_account, deleted_thread_ids)
+
+        # Store the label changes in batches, messages that aren't in the database yet need to be downloaded.
+        new_messages = list(new_messages) + self.update_labels_for_messages(label_infos)
 
         # Create tasks to download email messages.
-        for message_id in new_messages:
-            logger.info('creating download_email_message for %s', message_id)
-            app.send_task('download_email_message', args=[self.email_account.id, message_id])
+        batch_size = settings.GMAIL_FULL_MESSAGE_BATCH_SIZE
+        for i in range(0, len(new_messages), batch_size):
+            logger.info('creating download_email_messages for %s messages', len(new_messages[i:i + batch_size]))
+            app.send_task('download_email_messages', args=[self.email_account.id, new_messages[i:i + batch_size]])
 
         # Creates tasks to update labeling for email messages.
         for message_id in edit_labels:
@@ -283,6 +403,45 @@ class GmailManager(object):
         self.email_account.sync_failure_count = 0
         self.email_account.save(update_fields=["is_syncing", "sync_failure_count"])
 
+    def administer_sync_activity(self, has_changes):
+        """
+        Keep track of the activity of the email account and determine when the next incremental sync is due. Every
+        sync without changes doubles the interval, with push notifications the interval is only a safety net.
+
+        Args:
+            has_changes (boolean): True if the history contained changes
+        """
+        now = timezone.now()
+
+        if has_changes:
+            self.email_account.last_activity = now
+            self.email_account.idle_sync_count = 0
+        else:
+            self.email_account.idle_sync_count = min(self.email_account.idle_sync_count + 1, 16)
+
+        if self.email_account.watch_expiration and self.email_account.watch_expiration > now:
+            interval = settings.GMAIL_PUSH_SYNC_INTERVAL
+        elif self.email_account.idle_sync_count:
+            interval = min(
+                settings.GMAIL_IDLE_SYNC_INTERVAL * 2 ** (self.email_account.idle_sync_count - 1),
+                settings.GMAIL_IDLE_SYNC_MAX_INTERVAL
+            )
+        else:
+            interval = 0
+
+        self.email_account.next_sync = now + timedelta(seconds=interval)
+        self.email_account.save(update_fields=['last_activity', 'idle_sync_count', 'next_sync'])
+
+    def watch(self):
+        """
+        Start or renew the push notifications of Gmail for the email account.
+        """
+        response = self.connector.watch(settings.GMAIL_PUSH_TOPIC)
+
+        expiration = datetime.utcfromtimestamp(int(response['expiration']) / 1000.0)
+        self.email_account.watch_expiration = expiration.replace(tzinfo=timezone.utc)
+        self.email_account.save(update_fields=['watch_expiration'])
+
     def get_label(self, label_id, use_db=True):
         """
         Returns the label given the label_id.
@@ -369,6 +528,28 @@ class GmailManager(object):
                 logger.exception(
                     'Couldn\'t save message %s for account %s' % (message_id, self.email_account))
 
+    def update_labels_for_messages(self, label_infos):
+        """
+        Store the labels and thread_id for multiple EmailMessages in batches.
+
+        Args:
+            label_infos (OrderedDict): with the message_id as key and a dict with labelIds and threadId as value
+
+        Returns:
+            list with the message_ids of the messages that aren't in the database
+        """
+        message_ids = list(label_infos.keys())
+        batch_size = settings.GMAIL_LABEL_UPDATE_BATCH_SIZE
+        missing_message_ids = []
+
+        for i in range(0, len(message_ids), batch_size):
+            batch = OrderedDict((message_id, label_infos[message_id]) for message_id in message_ids[i:i + batch_size])
+            logger.debug('Storing label info for %s messages, account %s' % (len(batch), self.email_account))
+            missing = self.message_builder.store_labels_and_threads(batch)
+            missing_message_ids += [message_id for message_id in batch if message_id in missing]
+
+        return missing_message_ids
+
     def add_and_remove_labels_for_message(self, email_message, add_labels=[], remove_labels=[]):
         """
         Add and/or removes labels from the EmailMessage.
@@ -385,6 +566,7 @@ class GmailManager(object):
             except NotFoundError:
                 logger.debug('Message not available on remote.')
                 EmailMessage.objects.get(pk=email_message.id).delete()
+                update_email_threads(self.email_account, [email_message.thread_id])
                 return
 
             # Initialize a label update object.
@@ -590,6 +772,7 @@ class GmailManager(object):
             # Draft exists in Lily but not anymore on remote, so remove it from the database.
             logger.debug('Draft already deleted from remote.')
             EmailMessage.objects.filter(message_id=email_message.message_id, account=self.email_account).delete()
+            update_email_threads(self.email_account, [email_message.thread_id])
         else:
             self.update_unread_count()
 
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import lily.messaging.email.models.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('email', '0047_emailaccount_sync_activity'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='emailattachment',
+            name='attachment',
+            field=models.FileField(blank=True, max_length=255, upload_to=lily.messaging.email.models.models.get_attachment_upload_path),
+        ),
+        migrations.AddField(
+            model_name='emailattachment',
+            name='content_type',
+            field=models.CharField(default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='emailattachment',
+            name='filename',
+            field=models.CharField(default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='emailattachment',
+            name='gmail_attachment_id',
+            field=models.TextField(default=''),
+        ),
+        migrations.AddField(
+            model_name='emailattachment',
+            name='part_id',
+            field=models.CharField(default='', max_length=50),
+        ),
+    ]
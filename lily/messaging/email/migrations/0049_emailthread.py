@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('email', '0048_emailattachment_lazy_download'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailThread',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('thread_id', models.CharField(max_length=50)),
+                ('last_sent_date', models.DateTimeField(null=True)),
+                ('last_outgoing_date', models.DateTimeField(null=True)),
+                ('participants', django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=255), default=list, size=None)),
+                ('message_count', models.PositiveIntegerField(default=0)),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+                ('is_inbox', models.BooleanField(default=False)),
+                ('is_trashed', models.BooleanField(default=False)),
+                ('is_spam', models.BooleanField(default=False)),
+                ('is_sent', models.BooleanField(default=False)),
+                ('is_draft', models.BooleanField(default=False)),
+                ('is_starred', models.BooleanField(default=False)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='threads', to='email.EmailAccount')),
+                ('last_message', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='email.EmailMessage')),
+            ],
+            options={
+                'ordering': ['-last_sent_date'],
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='emailthread',
+            unique_together=set([('account', 'thread_id')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='emailthread',
+            index_together=set([('account', 'last_sent_date')]),
+        ),
+    ]
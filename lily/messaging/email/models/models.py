@@ -161,10 +161,20 @@ class EmailAccount(TenantMixin, DeletedMixin):
     # History id is a field to keep track of the sync status of a gmail box.
     history_id = models.BigIntegerField(null=True)
     temp_history_id = models.BigIntegerField(null=True)
+    # Page token of the next page to process during a full sync, so a crashed full sync resumes from there.
+    full_sync_page_token = models.CharField(max_length=255, blank=True, default='')
     is_syncing = models.BooleanField(default=False)
     sync_failure_count = models.PositiveSmallIntegerField(default=0)
     only_new = models.NullBooleanField(default=False)
 
+    # Idle email accounts are synchronized less often, is_dirty is set by a push notification from Gmail.
+    is_dirty = models.BooleanField(default=False)
+    last_activity = models.DateTimeField(null=True, blank=True)
+    idle_sync_count = models.PositiveSmallIntegerField(default=0)
+    next_sync = models.DateTimeField(null=True, blank=True)
+    # Gmail stops sending push notifications after the expiration, unless the watch is renewed.
+    watch_expiration = models.DateTimeField(null=True, blank=True)
+
     owner = models.ForeignKey(LilyUser, related_name='email_accounts_owned')
     shared_with_users = models.ManyToManyField(
         LilyUser,
@@ -444,6 +454,37 @@ class EmailMessage(models.Model):
         ordering = ['-sent_date']
 
 
+class EmailThread(models.Model):
+    """
+    Summary of the messages of a Gmail thread, maintained by the message builder so the thread can be listed or
+    classified by reading a single row.
+    """
+    account = models.ForeignKey(EmailAccount, related_name='threads')
+    thread_id = models.CharField(max_length=50)
+    last_message = models.ForeignKey(EmailMessage, related_name='+', null=True, on_delete=models.SET_NULL)
+    last_sent_date = models.DateTimeField(null=True)
+    # Sent date of the last message the email account sent in the thread.
+    last_outgoing_date = models.DateTimeField(null=True)
+    participants = ArrayField(models.CharField(max_length=255), default=list)
+    message_count = models.PositiveIntegerField(default=0)
+    unread_count = models.PositiveIntegerField(default=0)
+    is_inbox = models.BooleanField(default=False)
+    is_trashed = models.BooleanField(default=False)
+    is_spam = models.BooleanField(default=False)
+    is_sent = models.BooleanField(default=False)
+    is_draft = models.BooleanField(default=False)
+    is_starred = models.BooleanField(default=False)
+
+    def __unicode__(self):
+        return u'%s: %s' % (self.account, self.thread_id)
+
+    class Meta:
+        app_label = 'email'
+        unique_together = ('account', 'thread_id')
+        index_together = ('account', 'last_sent_date')
+        ordering = ['-last_sent_date']
+
+
 class EmailHeader(models.Model):
     """
     Headers for an EmailMessage.
@@ -463,18 +504,65 @@ class EmailAttachment(models.Model):
     """
     Email attachment for an EmailMessage.
     """
-    attachment = models.FileField(upload_to=get_attachment_upload_path, max_length=255)
+    # The file is empty for an attachment that isn't downloaded from Gmail yet.
+    attachment = models.FileField(upload_to=get_attachment_upload_path, max_length=255, blank=True)
     cid = models.TextField(default='')
     inline = models.BooleanField(default=False)
     message = models.ForeignKey(EmailMessage, related_name='attachments')
     size = models.PositiveIntegerField(default=0)
+    filename = models.CharField(max_length=255, default='')
+    content_type = models.CharField(max_length=255, default='')
+    # Reference to the attachment in Gmail, to download the file when it's accessed for the first time.
+    gmail_attachment_id = models.TextField(default='')
+    part_id = models.CharField(max_length=50, default='')
 
     def __unicode__(self):
-        return self.attachment.name.split('/')[-1]
+        return self.name
 
     @property
     def name(self):
-        return self.attachment.name.split('/')[-1]
+        if self.attachment:
+            return self.attachment.name.split('/')[-1]
+
+        return self.filename
+
+    @property
+    def is_downloaded(self):
+        return bool(self.attachment)
+
+    def fetch(self, wait_for_quota=False):
+        """
+        Download the file of the attachment from Gmail if it isn't downloaded yet.
+
+        Args:
+            wait_for_quota (bool, optional): sleep for the quota like tasks do, requests give up right away
+
+        Returns:
+            bool: True if the file of the attachment is available
+        """
+        if self.attachment:
+            return True
+
+        from googleapiclient.errors import HttpError
+        from oauth2client.client import HttpAccessTokenRefreshError
+
+        from ..builders.utils import download_attachment
+        from ..connector import ConnectorError, FailedServiceCallException, GmailConnector
+        from ..credentials import InvalidCredentialsError
+
+        try:
+            connector = GmailConnector(self.message.account, max_quota_wait=None if wait_for_quota else 0)
+        except InvalidCredentialsError:
+            return False
+
+        try:
+            return download_attachment(self, connector)
+        except (HttpAccessTokenRefreshError, FailedServiceCallException, ConnectorError, HttpError) as e:
+            # Rate limits and revoked or failing accounts shouldn't turn into server errors.
+            logger.warning('Attachment %s could not be downloaded: %r' % (self.pk, e))
+            return False
+        finally:
+            connector.cleanup()
 
     def download_url(self):
         return reverse('download', kwargs={
@@ -688,7 +776,8 @@ class EmailOutboxAttachment(TenantMixin):
 def post_delete_mail_attachment_handler(sender, **kwargs):
     attachment = kwargs['instance']
     storage, filename = attachment.attachment.storage, attachment.attachment.name
-    storage.delete(filename)
+    if filename:
+        storage.delete(filename)
 
 
 class EmailDraft(TenantMixin, models.Model):
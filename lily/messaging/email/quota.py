@@ -0,0 +1,130 @@
+import logging
+import random
+import time
+
+from django.conf import settings
+
+from lily.utils.functions import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+# Quota units of the Gmail api methods, see https://developers.google.com/gmail/api/v1/reference/quota.
+QUOTA_UNITS = {
+    'gmail.users.drafts.create': 10,
+    'gmail.users.drafts.delete': 10,
+    'gmail.users.drafts.send': 100,
+    'gmail.users.drafts.update': 15,
+    'gmail.users.getProfile': 1,
+    'gmail.users.history.list': 2,
+    'gmail.users.labels.get': 1,
+    'gmail.users.labels.list': 1,
+    'gmail.users.messages.delete': 10,
+    'gmail.users.messages.send': 100,
+    'gmail.users.watch': 100,
+}
+DEFAULT_QUOTA_UNITS = 5
+
+# Take tokens from the bucket of the email account and the bucket of the project at once, or from neither of them.
+# Returns the number of seconds to wait as a string, because Lua numbers are truncated to integers by Redis.
+ACQUIRE_SCRIPT = """
+local penalty = redis.call('PTTL', KEYS[3])
+if penalty > 0 then
+    return tostring(penalty / 1000)
+end
+
+local now = tonumber(ARGV[1])
+local wait = 0
+local tokens = {}
+for i = 1, 2 do
+    local rate = tonumber(ARGV[i * 2])
+    local units = tonumber(ARGV[i * 2 + 1])
+    local bucket = redis.call('HMGET', KEYS[i], 'tokens', 'timestamp')
+    local available = tonumber(bucket[1]) or rate
+    local timestamp = tonumber(bucket[2]) or now
+
+    available = math.min(rate, available + math.max(0, now - timestamp) * rate)
+    if available < units then
+        wait = math.max(wait, (units - available) / rate)
+    end
+    tokens[i] = available - units
+end
+
+if wait > 0 then
+    return tostring(wait)
+end
+
+for i = 1, 2 do
+    redis.call('HMSET', KEYS[i], 'tokens', tokens[i], 'timestamp', now)
+    redis.call('EXPIRE', KEYS[i], 60)
+end
+return '0'
+"""
+
+
+def get_quota_units(service):
+    """
+    Return the number of quota units the service call costs.
+
+    Args:
+        service (instance): service instance
+    """
+    return QUOTA_UNITS.get(getattr(service, 'methodId', None), DEFAULT_QUOTA_UNITS)
+
+
+class GmailQuota(object):
+    """
+    Token buckets for the Gmail api quota, shared by all workers through Redis.
+
+    Every email account has a bucket for the per user quota, all email accounts share a bucket for the per project
+    quota. Rate limit errors from Google put a penalty on the email account that grows with every successive error.
+    """
+    def __init__(self, email_account_id, client=None):
+        self.client = client or get_redis_client()
+        self.account_key = 'gmail_quota:account:%s' % email_account_id
+        self.project_key = 'gmail_quota:project'
+        self.penalty_key = 'gmail_quota:penalty:%s' % email_account_id
+        self.strikes_key = 'gmail_quota:strikes:%s' % email_account_id
+        self.acquire_script = self.client.register_script(ACQUIRE_SCRIPT)
+
+    def acquire(self, units):
+        """
+        Take the quota units for an api call from the buckets.
+
+        Args:
+            units (int): number of quota units of the api call
+
+        Returns:
+            float: seconds to wait before the units are available, 0 if they are taken
+        """
+        user_rate = settings.GMAIL_QUOTA_USER_RATE
+        project_rate = settings.GMAIL_QUOTA_PROJECT_RATE
+
+        wait = self.acquire_script(
+            keys=[self.account_key, self.project_key, self.penalty_key],
+            # A call that costs more than the bucket holds can never be made, so cap the units on the bucket size.
+            args=[time.time(), user_rate, min(units, user_rate), project_rate, min(units, project_rate)],
+        )
+
+        return float(wait)
+
+    def throttle(self):
+        """
+        Put a penalty on the email account after a rate limit error from Google. The penalty doubles with every error
+        as long as the previous errors aren't forgotten.
+
+        Returns:
+            float: seconds the email account can't make api calls
+        """
+        max_penalty = settings.GMAIL_QUOTA_MAX_PENALTY
+
+        pipe = self.client.pipeline()
+        pipe.incr(self.strikes_key)
+        pipe.expire(self.strikes_key, max_penalty * 2)
+        strikes = pipe.execute()[0]
+
+        penalty = min(2 ** (strikes - 1) + random.randint(0, 1000) / 1000.0, max_penalty)
+        self.client.set(self.penalty_key, 1, px=int(penalty * 1000))
+
+        logger.warning('Rate limit exceeded for %s, no api calls for %s seconds' % (self.account_key, penalty))
+
+        return penalty
@@ -1,11 +1,25 @@
+from collections import defaultdict
+
 from bs4 import BeautifulSoup
+from django.conf import settings
 from lily.search.base_mapping import BaseMapping
+from lily.search.indexing import prepare_dict
 
-from .models.models import EmailMessage
+from .models.models import EmailAccount, EmailMessage
 from lily.messaging.email.utils import convert_br_to_newline
 
 
 class EmailMessageMapping(BaseMapping):
+    batch_select_related = (
+        'sender',
+    )
+    batch_prefetch_related = (
+        'account',
+        'labels',
+        'received_by',
+        'received_by_cc',
+    )
+
     @classmethod
     def get_model(cls):
         return EmailMessage
@@ -118,65 +132,168 @@ class EmailMessageMapping(BaseMapping):
             # Tag: lambda obj: [obj.subject],
         }
 
-    @classmethod
-    def prepare_batch(cls, queryset):
-        """
-        Optimize a queryset for batch indexing.
-        """
-        return queryset.prefetch_related(
-            'received_by',
-            'received_by_cc',
-            'labels',
-            'account',
-        ).select_related(
-            'sender',
-        )
-
     @classmethod
     def obj_to_doc(cls, obj):
         """
         Translate an object to an index document.
         """
-        labels = obj.labels.all()
-        received_by = obj.received_by.all()
-        received_by_cc = obj.received_by_cc.all()
-
-        return {
-            'account': {
-                'id': obj.account.id,
-                'name': obj.account.label,
-                'email': obj.account.email_address,
-                'privacy': obj.account.privacy,
-            },
+        message = {
             'subject': obj.subject,
             'sent_date': obj.sent_date,
             'read': obj.read,
             'snippet': obj.snippet,
             'has_attachment': obj.has_attachment,
-            'label_id': [label.label_id for label in labels if label.label_id],
-            'label_name': [label.name for label in labels if label.name],
-            'sender_email': obj.sender.email_address,
-            'sender_name': obj.sender.name,
-            'received_by_email': [receiver.email_address for receiver in received_by if receiver.email_address],
-            'received_by_name': [receiver.name for receiver in received_by if receiver.name],
-            'received_by_cc_email': [receiver.email_address for receiver in received_by_cc if receiver.email_address],
-            'received_by_cc_name': [receiver.name for receiver in received_by_cc if receiver.name],
             'message_id': obj.message_id,
             'thread_id': obj.thread_id,
-            'body': obj.body_text or cls.body_html_parsed(obj),
+            'body_text': obj.body_text,
+            'body_html': obj.body_html,
+            'sender__email_address': obj.sender.email_address,
+            'sender__name': obj.sender.name,
+        }
+        account = {
+            'id': obj.account.id,
+            'label': obj.account.label,
+            'email_address': obj.account.email_address,
+            'privacy': obj.account.privacy,
+        }
+        labels = [(label.label_id, label.name) for label in obj.labels.all()]
+        received_by = [(receiver.email_address, receiver.name) for receiver in obj.received_by.all()]
+        received_by_cc = [(receiver.email_address, receiver.name) for receiver in obj.received_by_cc.all()]
+
+        doc = cls.values_to_doc(message, account, labels, received_by, received_by_cc)
+
+        # The actions set the flags on the instance before Gmail returns the new labels, so use the properties.
+        doc.update({
             'is_trashed': obj.is_trashed,
             'is_starred': obj.is_starred,
             'is_spam': obj.is_spam,
-            'is_draft': obj.is_draft,
             'is_archived': obj.is_archived,
+        })
+
+        return doc
+
+    @classmethod
+    def values_to_doc(cls, message, account, labels, received_by, received_by_cc):
+        """
+        Translate the values of a message to an index document.
+
+        Args:
+            message (dict): field values of the message
+            account (dict): field values of the email account
+            labels (list): (label_id, name) tuples of the labels of the message
+            received_by (list): (email_address, name) tuples of the receivers
+            received_by_cc (list): (email_address, name) tuples of the cc receivers
+        """
+        label_ids = [label_id for label_id, name in labels]
+
+        return {
+            'account': {
+                'id': account['id'],
+                'name': account['label'],
+                'email': account['email_address'],
+                'privacy': account['privacy'],
+            },
+            'subject': message['subject'],
+            'sent_date': message['sent_date'],
+            'read': message['read'],
+            'snippet': message['snippet'],
+            'has_attachment': message['has_attachment'],
+            'label_id': [label_id for label_id in label_ids if label_id],
+            'label_name': [name for label_id, name in labels if name],
+            'sender_email': message['sender__email_address'],
+            'sender_name': message['sender__name'],
+            'received_by_email': [email_address for email_address, name in received_by if email_address],
+            'received_by_name': [name for email_address, name in received_by if name],
+            'received_by_cc_email': [email_address for email_address, name in received_by_cc if email_address],
+            'received_by_cc_name': [name for email_address, name in received_by_cc if name],
+            'message_id': message['message_id'],
+            'thread_id': message['thread_id'],
+            'body': message['body_text'] or cls.parse_body_html(message['body_html']),
+            'is_trashed': settings.GMAIL_LABEL_TRASH in label_ids,
+            'is_starred': settings.GMAIL_LABEL_STAR in label_ids,
+            'is_spam': settings.GMAIL_LABEL_SPAM in label_ids,
+            'is_draft': settings.GMAIL_LABEL_DRAFT in label_ids,
+            'is_archived': settings.GMAIL_LABEL_INBOX not in label_ids,
+        }
+
+    @classmethod
+    def extract_documents(cls, queryset):
+        """
+        Convert the messages of the queryset to index documents, like extract_document does for a single instance.
+
+        The values of the messages and their related rows are read with a few values queries for the whole batch,
+        instead of creating model instances.
+        """
+        messages = list(queryset.order_by('pk').values(
+            'id',
+            'account_id',
+            'subject',
+            'sent_date',
+            'read',
+            'snippet',
+            'has_attachment',
+            'message_id',
+            'thread_id',
+            'body_text',
+            'body_html',
+            'sender__email_address',
+            'sender__name',
+        ))
+        if not messages:
+            return []
+
+        message_ids = [message['id'] for message in messages]
+
+        accounts = {
+            account['id']: account for account in EmailAccount.objects.filter(
+                pk__in=set(message['account_id'] for message in messages)
+            ).values('id', 'tenant_id', 'label', 'email_address', 'privacy')
         }
 
+        label_rows = EmailMessage.labels.through.objects.filter(emailmessage_id__in=message_ids)
+        labels = defaultdict(list)
+        for message_id, label_id, name in label_rows.values_list(
+                'emailmessage_id', 'emaillabel__label_id', 'emaillabel__name'):
+            labels[message_id].append((label_id, name))
+
+        received_by_rows = EmailMessage.received_by.through.objects.filter(emailmessage_id__in=message_ids)
+        received_by = defaultdict(list)
+        for message_id, email_address, name in received_by_rows.values_list(
+                'emailmessage_id', 'recipient__email_address', 'recipient__name'):
+            received_by[message_id].append((email_address, name))
+
+        received_by_cc_rows = EmailMessage.received_by_cc.through.objects.filter(emailmessage_id__in=message_ids)
+        received_by_cc = defaultdict(list)
+        for message_id, email_address, name in received_by_cc_rows.values_list(
+                'emailmessage_id', 'recipient__email_address', 'recipient__name'):
+            received_by_cc[message_id].append((email_address, name))
+
+        documents = []
+        for message in messages:
+            account = accounts[message['account_id']]
+            doc = cls.values_to_doc(
+                message,
+                account,
+                labels[message['id']],
+                received_by[message['id']],
+                received_by_cc[message['id']]
+            )
+            doc['tenant'] = account['tenant_id']
+            doc['id'] = message['id']
+            documents.append(prepare_dict(doc))
+
+        return documents
+
     @classmethod
     def has_deleted(cls):
         return False
 
     @classmethod
     def body_html_parsed(cls, obj):
-        soup = BeautifulSoup(obj.body_html, 'lxml')
+        return cls.parse_body_html(obj.body_html)
+
+    @classmethod
+    def parse_body_html(cls, body_html):
+        soup = BeautifulSoup(body_html, 'lxml')
         soup = convert_br_to_newline(soup)
         return soup.get_text()
@@ -1,13 +1,21 @@
+import threading
+import time
+from collections import OrderedDict
+
 import httplib2
 
+from django.conf import settings
 from googleapiclient.discovery import build
 
 
 class GmailService(object):
     http = None
     service = None
+    credentials = None
 
     def __init__(self, credentials):
+        self.created = time.time()
+        self.credentials = credentials
         self.http = self.authorize(credentials)
         self.service = self.build_service()
 
@@ -20,6 +28,9 @@ class GmailService(object):
     def execute_service(self, service):
         return service.execute(http=self._get_http())
 
+    def new_batch_http_request(self, callback=None):
+        return self.service.new_batch_http_request(callback=callback)
+
     def _get_http(self):
         """
         Return the current http instance. Method added to enable mocking.
@@ -27,3 +38,82 @@ class GmailService(object):
         :return: current http instance
         """
         return self.http
+
+
+class GmailServiceCache(object):
+    """
+    Least recently used cache of authorized Gmail services per email account, kept for the lifetime of a worker.
+
+    The http of a service isn't safe to use by concurrent tasks, so a service is checked out of the cache by a single
+    connector and only returned to the cache when the connector is cleaned up. Concurrent tasks of the same email
+    account build their own service.
+
+    Expired access tokens are refreshed by the authorized http of the service itself, the refreshed credentials are
+    stored in the database by oauth2client. Services with invalid credentials are never returned and every service
+    is rebuilt after a timeout, so changed credentials are picked up eventually.
+    """
+    def __init__(self):
+        self.services = OrderedDict()
+        self.lock = threading.Lock()
+
+    def is_valid(self, gmail_service):
+        return (
+            gmail_service.created + settings.GMAIL_SERVICE_CACHE_TIMEOUT >= time.time() and
+            not gmail_service.credentials.invalid
+        )
+
+    def checkout(self, email_account_id):
+        """
+        Take the cached service of the email account out of the cache.
+
+        Args:
+            email_account_id (int): id of the EmailAccount
+
+        Returns:
+            GmailService instance or None if there is no valid service in the cache
+        """
+        with self.lock:
+            gmail_service = self.services.pop(email_account_id, None)
+
+        if gmail_service is None or not self.is_valid(gmail_service):
+            return None
+
+        return gmail_service
+
+    def checkin(self, email_account_id, gmail_service):
+        """
+        Return the service of the email account to the cache, the least recently used services are evicted when the
+        cache is full.
+
+        Args:
+            email_account_id (int): id of the EmailAccount
+            gmail_service (instance): GmailService instance
+        """
+        size = settings.GMAIL_SERVICE_CACHE_SIZE
+        if size <= 0 or not self.is_valid(gmail_service):
+            return
+
+        with self.lock:
+            # A service returned by a concurrent task is replaced, which makes this one the most recently used.
+            self.services.pop(email_account_id, None)
+            self.services[email_account_id] = gmail_service
+
+            while len(self.services) > size:
+                self.services.popitem(last=False)
+
+    def invalidate(self, email_account_id):
+        """
+        Remove the service of the email account from the cache.
+
+        Args:
+            email_account_id (int): id of the EmailAccount
+        """
+        with self.lock:
+            self.services.pop(email_account_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.services.clear()
+
+
+gmail_service_cache = GmailServiceCache()
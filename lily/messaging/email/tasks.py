@@ -1,3 +1,4 @@
+from datetime import timedelta
 import logging
 import traceback
 
@@ -5,10 +6,13 @@ from celery.task import task
 from django.conf import settings
 from django.core.files.base import ContentFile
 from django.core.files.storage import default_storage
+from django.db.models import Q
+from django.utils import timezone
 from oauth2client.client import HttpAccessTokenRefreshError
 
 from lily.messaging.email.utils import determine_message_type
 from lily.utils.functions import post_intercom_event
+from .connector import RateLimitExceededError
 from .manager import GmailManager
 from .models.models import (EmailAccount, EmailMessage, EmailOutboxMessage, EmailTemplateAttachment,
                             EmailOutboxAttachment, EmailAttachment, EmailDraft, EmailDraftAttachment)
@@ -20,8 +24,16 @@ logger = logging.getLogger(__name__)
 def synchronize_email_account_scheduler():
     """
     Start new tasks for every active mailbox to synchronize.
+
+    Email accounts without changes since their last sync are skipped until their next sync is due, unless a push
+    notification marked them as dirty. A full sync which didn't reach its next page in time is resumed.
     """
-    for email_account in EmailAccount.objects.filter(is_authorized=True, is_deleted=False):
+    now = timezone.now()
+    sync_due = Q(next_sync__isnull=True) | Q(next_sync__lte=now) | Q(is_dirty=True)
+    # Email accounts that need a full sync are always due.
+    sync_due |= Q(history_id__isnull=True) | Q(sync_failure_count__gt=0)
+
+    for email_account in EmailAccount.objects.filter(sync_due, is_authorized=True, is_deleted=False):
         logger.debug('Scheduling sync for %s', email_account)
 
         if email_account.full_sync_needed:
@@ -32,7 +44,17 @@ def synchronize_email_account_scheduler():
                 max_retries=1,
                 default_retry_delay=100,
             )
-        elif not email_account.is_syncing:
+        elif email_account.is_syncing:
+            listing_pages = email_account.temp_history_id is not None or not email_account.history_id
+            if listing_pages and (not email_account.next_sync or email_account.next_sync <= now):
+                # The page chain of the full sync stopped, continue from the stored page token.
+                logger.info('Resuming full sync of %s', email_account)
+                full_synchronize_email_account.apply_async(
+                    args=(email_account.pk,),
+                    max_retries=1,
+                    default_retry_delay=100,
+                )
+        else:
             # The email account is done with a full synchroniazation, so initiate an incremental synchronization.
             logger.info('Adding task for incremental sync for: %s', email_account)
             incremental_synchronize_email_account.apply_async(
@@ -53,6 +75,57 @@ def synchronize_labels_scheduler():
         logger.info('Adding task for label sync for: %s', email_account)
 
 
+@task(name='watch_email_accounts_scheduler')
+def watch_email_accounts_scheduler():
+    """
+    Start new tasks to renew the push notifications for every active mailbox before they expire.
+    """
+    if not settings.GMAIL_PUSH_TOPIC:
+        return
+
+    renew_before = timezone.now() + timedelta(days=1)
+    email_accounts = EmailAccount.objects.filter(
+        Q(watch_expiration__isnull=True) | Q(watch_expiration__lte=renew_before),
+        is_authorized=True,
+        is_deleted=False,
+    )
+
+    for email_account in email_accounts:
+        watch_email_account.apply_async(args=(email_account.pk,))
+        logger.info('Adding task for renewing push notifications for: %s', email_account)
+
+
+@task(name='watch_email_account', logger=logger)
+def watch_email_account(account_id):
+    """
+    Start or renew the push notifications for the email account.
+
+    Args:
+        account_id (int): id of the EmailAccount
+    """
+    try:
+        email_account = EmailAccount.objects.get(pk=account_id, is_deleted=False)
+    except EmailAccount.DoesNotExist:
+        logger.warning('EmailAccount no longer exists: %s', account_id)
+    else:
+        if email_account.is_authorized:
+            manager = None
+            try:
+                manager = GmailManager(email_account)
+                manager.watch()
+                logger.debug('Push notifications renewed for: %s', email_account)
+            except HttpAccessTokenRefreshError:
+                logger.warning('Not watching, no authorization for: %s', email_account)
+                pass
+            except Exception:
+                logger.exception('Could not renew push notifications for account %s' % email_account)
+            finally:
+                if manager:
+                    manager.cleanup()
+        else:
+            logger.warning('Not watching, no authorization for: %s', email_account)
+
+
 @task(name='incremental_synchronize_email_account', logger=logger)
 def incremental_synchronize_email_account(account_id):
     """
@@ -76,6 +149,9 @@ def incremental_synchronize_email_account(account_id):
             except HttpAccessTokenRefreshError:
                 logger.warning('Not syncing, no authorization for: %s', email_account)
                 pass
+            except RateLimitExceededError:
+                # The scheduler starts a new incremental sync when the quota of the email account allows it.
+                logger.info('Rate limit exceeded, no sync for: %s', email_account)
             except Exception:
                 logger.exception('No sync for account %s' % email_account)
             finally:
@@ -85,10 +161,13 @@ def incremental_synchronize_email_account(account_id):
             logger.warning('Not syncing, no authorization for: %s', email_account)
 
 
-@task(name='full_synchronize_email_account', logger=logger)
+@task(name='full_synchronize_email_account', logger=logger, acks_late=True)
 def full_synchronize_email_account(account_id):
     """
-    Full synchronize task for the email account.
+    Full synchronize task for the email account, processes one page and queues a new task for the next page.
+
+    Acknowledged late, so a page that is interrupted by a crashing worker is processed again from the stored page
+    token.
 
     Args:
         account_id (int): id of the EmailAccount
@@ -108,6 +187,13 @@ def full_synchronize_email_account(account_id):
             except HttpAccessTokenRefreshError:
                 logger.warning('Not syncing, no authorization for: %s', email_account)
                 pass
+            except RateLimitExceededError as exc:
+                # Continue from the stored page token when the quota of the email account allows it.
+                logger.info('Rate limit exceeded, full sync continues in %s seconds for: %s' % (
+                    exc.countdown,
+                    email_account
+                ))
+                full_synchronize_email_account.apply_async(args=(account_id,), countdown=exc.countdown)
             except Exception:
                 logger.exception('No sync for account %s' % email_account)
             finally:
@@ -202,6 +288,9 @@ def download_email_message(self, account_id, message_id):
             except HttpAccessTokenRefreshError:
                 logger.warning('Not syncing, no authorization for: %s', email_account)
                 pass
+            except RateLimitExceededError as exc:
+                # Try again when the quota of the email account allows it, instead of waiting in the worker.
+                raise self.retry(exc=exc, countdown=exc.countdown)
             except Exception as exc:
                 logger.exception('Fetch message %s for: %s failed' % (message_id, email_account))
                 raise self.retry(exc=exc)
@@ -212,6 +301,43 @@ def download_email_message(self, account_id, message_id):
             logger.warning('Not syncing, no authorization for: %s', email_account)
 
 
+@task(name='download_email_messages', logger=logger, acks_late=True, bind=True)
+def download_email_messages(self, account_id, message_ids):
+    """
+    Download multiple messages with batch requests.
+
+    Args:
+        account_id (int): id of the EmailAccount
+        message_ids (list): google ids of EmailMessages
+    """
+    try:
+        email_account = EmailAccount.objects.get(pk=account_id, is_deleted=False)
+    except EmailAccount.DoesNotExist:
+        logger.warning('EmailAccount no longer exists: %s', account_id)
+    else:
+        if email_account.is_authorized:
+            manager = None
+            try:
+                manager = GmailManager(email_account)
+                logger.debug('Fetch %s messages for: %s' % (len(message_ids), email_account))
+                manager.download_messages(message_ids)
+            except HttpAccessTokenRefreshError:
+                logger.warning('Not syncing, no authorization for: %s', email_account)
+                pass
+            except RateLimitExceededError as exc:
+                # Try again when the quota of the email account allows it, instead of waiting in the worker.
+                raise self.retry(exc=exc, countdown=exc.countdown)
+            except Exception as exc:
+                # Messages that were stored before the failure are skipped when the task is retried.
+                logger.exception('Fetch %s messages for: %s failed' % (len(message_ids), email_account))
+                raise self.retry(exc=exc)
+            finally:
+                if manager:
+                    manager.cleanup()
+        else:
+            logger.warning('Not syncing, no authorization for: %s', email_account)
+
+
 @task(name='update_labels_for_message', logger=logger, bind=True)
 def update_labels_for_message(self, account_id, email_id):
     """
@@ -235,6 +361,9 @@ def update_labels_for_message(self, account_id, email_id):
             except HttpAccessTokenRefreshError:
                 logger.warning('Not syncing, no authorization for: %s', email_account)
                 pass
+            except RateLimitExceededError as exc:
+                # Try again when the quota of the email account allows it, instead of waiting in the worker.
+                raise self.retry(exc=exc, countdown=exc.countdown)
             except Exception as exc:
                 logger.exception('Failed changing labels for %s' % email_id)
                 raise self.retry(exc=exc)
@@ -268,6 +397,9 @@ def toggle_read_email_message(self, email_id, read=True):
             except HttpAccessTokenRefreshError:
                 logger.warning('Not syncing, no authorization for: %s', email_message.account)
                 pass
+            except RateLimitExceededError as exc:
+                # Try again when the quota of the email account allows it, instead of waiting in the worker.
+                raise self.retry(exc=exc, countdown=exc.countdown)
             except Exception as exc:
                 logger.exception('Failed toggle read for: %s' % email_message)
                 raise self.retry(exc=exc)
@@ -307,6 +439,9 @@ def trash_email_message(self, email_id):
             except HttpAccessTokenRefreshError:
                 logger.warning('Not syncing, no authorization for: %s', email_message.account)
                 pass
+            except RateLimitExceededError as exc:
+                # Try again when the quota of the email account allows it, instead of waiting in the worker.
+                raise self.retry(exc=exc, countdown=exc.countdown)
             except Exception as exc:
                 logger.exception('Failed deleting / trashing %s' % email_message)
                 raise self.retry(exc=exc)
@@ -341,6 +476,9 @@ def add_and_remove_labels_for_message(self, email_id, add_labels=[], remove_labe
             except HttpAccessTokenRefreshError:
                 logger.warning('Not syncing, no authorization for: %s', email_message.account)
                 pass
+            except RateLimitExceededError as exc:
+                # Try again when the quota of the email account allows it, instead of waiting in the worker.
+                raise self.retry(exc=exc, countdown=exc.countdown)
             except Exception as exc:
                 logger.exception('Failed changing labels for %s' % email_message)
                 raise self.retry(exc=exc)
@@ -423,6 +561,10 @@ def send_message(email_id, original_message_id=None, draft=False):
             except EmailAttachment.DoesNotExist:
                 pass
             else:
+                if not original_attachment.fetch(wait_for_quota=True):
+                    logger.warning('Original attachment %s could not be downloaded, not forwarding it' % attachment_id)
+                    continue
+
                 outbox_attachment = email_attachment_class()
                 setattr(outbox_attachment, email_attachment_to_email_class_field_name, email)
                 outbox_attachment.tenant_id = original_attachment.message.tenant_id
@@ -454,6 +596,18 @@ def send_message(email_id, original_message_id=None, draft=False):
     except HttpAccessTokenRefreshError:
         logger.warning('EmailAccount not authorized: %s', email_account)
         pass
+    except RateLimitExceededError as exc:
+        # The attachments are added to the email already, so don't add them again when sending is tried again.
+        email.template_attachment_ids = ''
+        email.original_attachment_ids = ''
+        email.save(update_fields=['template_attachment_ids', 'original_attachment_ids'])
+
+        send_logger.info('Rate limit exceeded, sending {}: {} again in {} seconds'.format(
+            email_attachment_to_email_class_field_name,
+            email_id,
+            exc.countdown
+        ))
+        send_message.apply_async(args=(email_id, original_message_id, draft), countdown=exc.countdown)
     except Exception as e:
         logger.error(traceback.format_exc(e))
         raise
@@ -1,14 +1,16 @@
 import json
 
+from django.test import override_settings
 from googleapiclient.discovery import build
 from googleapiclient.http import HttpMock
 from oauth2client.client import HttpAccessTokenRefreshError
 from rest_framework.test import APITestCase
 
-from lily.messaging.email.connector import GmailConnector, FailedServiceCallException
+from lily.messaging.email.connector import GmailConnector, FailedServiceCallException, RateLimitExceededError
 from lily.messaging.email.factories import EmailAccountFactory
 from lily.messaging.email.models.models import EmailAccount
-from lily.messaging.email.services import GmailService
+from lily.messaging.email.quota import GmailQuota
+from lily.messaging.email.services import GmailService, gmail_service_cache
 from lily.tests.utils import UserBasedTest, get_dummy_credentials
 
 from mock import patch
@@ -47,6 +49,7 @@ class GmailConnectorTests(UserBasedTest, APITestCase):
         self.get_credentials_mock_patcher.stop()
         self.authorize_mock_patcher.stop()
         self.build_service_mock_patcher.stop()
+        gmail_service_cache.clear()
 
     @patch.object(GmailService, '_get_http')
     def test_execute_service_call(self, get_http_mock):
@@ -105,6 +108,77 @@ class GmailConnectorTests(UserBasedTest, APITestCase):
             json_obj = json.load(infile)
             self.assertEqual(response, json_obj)
 
+    @override_settings(GMAIL_QUOTA_ENABLED=True)
+    @patch.object(GmailQuota, 'throttle')
+    @patch.object(GmailQuota, 'acquire')
+    @patch.object(GmailService, '_get_http')
+    def test_execute_service_call_rate_limit_exceeded_quota(self, get_http_mock, acquire_mock, throttle_mock):
+        """
+        Test if the execute service call throttles the email account after a rate limit error and tries again.
+        """
+        acquire_mock.return_value = 0
+        throttle_mock.return_value = 1
+
+        mock_api_calls = [
+            # Simulate one rateLimitExceeded error.
+            HttpMock('lily/messaging/email/tests/data/403.json', {'status': '403'}),
+            HttpMock('lily/messaging/email/tests/data/all_message_id_list_single_page.json', {'status': '200'}),
+        ]
+
+        # Mock the http instance with succesive http mock objects.
+        get_http_mock.side_effect = mock_api_calls
+
+        email_account = EmailAccount.objects.first()
+
+        connector = GmailConnector(email_account)
+
+        # Execute service call.
+        response = connector.execute_service_call(
+            connector.gmail_service.service.users().messages().list(
+                userId='me',
+                quotaUser=email_account.id,
+                q='!in:chats',
+            ))
+
+        # Verify that the email account is throttled once and that every attempt drew from the quota.
+        self.assertEqual(throttle_mock.call_count, 1)
+        self.assertEqual(acquire_mock.call_count, 2)
+
+        # Verify that the service call returned the correct json object.
+        with open('lily/messaging/email/tests/data/all_message_id_list_single_page.json') as infile:
+            json_obj = json.load(infile)
+            self.assertEqual(response, json_obj)
+
+    @override_settings(GMAIL_QUOTA_ENABLED=True)
+    @patch.object(GmailQuota, 'acquire')
+    @patch.object(GmailService, '_get_http')
+    def test_execute_service_call_quota_exhausted(self, get_http_mock, acquire_mock):
+        """
+        Test if the execute service call raises an exception with a countdown when the quota isn't available soon.
+        """
+        acquire_mock.return_value = 30.0
+
+        email_account = EmailAccount.objects.first()
+
+        connector = GmailConnector(email_account)
+
+        try:
+            # Execute service call.
+            connector.execute_service_call(
+                connector.gmail_service.service.users().messages().list(
+                    userId='me',
+                    quotaUser=email_account.id,
+                    q='!in:chats',
+                ))
+            self.fail('RateLimitExceededError should have been raised.')
+        except RateLimitExceededError as e:
+            self.assertEqual(e.countdown, 31)
+
+        # Verify that no call was made to Google and that the email account is still authorized.
+        self.assertFalse(get_http_mock.called)
+        email_account.refresh_from_db()
+        self.assertTrue(email_account.is_authorized)
+
     @patch.object(GmailService, '_get_http')
     def test_execute_service_call_failed_service_call_exception(self, get_http_mock):
         """
@@ -165,41 +239,80 @@ class GmailConnectorTests(UserBasedTest, APITestCase):
 
         self.assertFalse(email_account.is_authorized, "Email account shouldn't be authorized.")
 
-    @patch.object(GmailService, '_get_http')
-    def test_get_all_message_id_list(self, get_http_mock):
+    @override_settings(GMAIL_SERVICE_CACHE_SIZE=1)
+    def test_gmail_service_cache(self):
         """
-        Test the GmailConnector in retrieving all message id's without errors on the API call.
+        Test that connectors reuse the Gmail service of an email account and that the cache size is bounded.
         """
-        mock_api_calls = [
-            # Retrieve the history_id.
-            HttpMock('lily/messaging/email/tests/data/get_history_id.json', {'status': '200'}),
-            # Retrieve a list of all the messages in the email box.
-            HttpMock('lily/messaging/email/tests/data/all_message_id_list_single_page.json', {'status': '200'}),
-        ]
+        email_account = EmailAccount.objects.first()
+        other_email_account = EmailAccountFactory.create(owner=self.user_obj, tenant=self.user_obj.tenant)
 
-        # Mock the http instance with succesive http mock objects.
-        get_http_mock.side_effect = mock_api_calls
+        connector = GmailConnector(email_account)
+        gmail_service = connector.gmail_service
+        connector.cleanup()
+
+        connector = GmailConnector(email_account)
+        self.assertIs(connector.gmail_service, gmail_service)
+        connector.cleanup()
+
+        # The service of the other email account evicts the least recently used service.
+        GmailConnector(other_email_account).cleanup()
+        self.assertIsNone(gmail_service_cache.checkout(email_account.pk))
+        self.assertIsNot(GmailConnector(email_account).gmail_service, gmail_service)
+
+        # A service with invalid credentials isn't reused.
+        connector = GmailConnector(email_account)
+        gmail_service = connector.gmail_service
+        connector.cleanup()
+        gmail_service.credentials.invalid = True
+        self.assertIsNone(gmail_service_cache.checkout(email_account.pk))
+
+    @override_settings(GMAIL_SERVICE_CACHE_SIZE=1)
+    def test_gmail_service_cache_checkout(self):
+        """
+        Test that concurrent connectors of an email account never share a Gmail service.
+        """
+        email_account = EmailAccount.objects.first()
+
+        connector = GmailConnector(email_account)
+        GmailConnector(email_account).cleanup()
+
+        # The service in use by the first connector isn't handed out, the one returned by the second connector is.
+        concurrent_connector = GmailConnector(email_account)
+        self.assertIsNot(concurrent_connector.gmail_service, connector.gmail_service)
+        self.assertIsNot(GmailConnector(email_account).gmail_service, concurrent_connector.gmail_service)
+
+        # The service of an account which lost its authorization isn't returned to the cache.
+        email_account.is_authorized = False
+        connector.cleanup()
+        self.assertIsNone(gmail_service_cache.checkout(email_account.pk))
+
+    @patch.object(GmailService, '_get_http')
+    def test_get_message_id_page(self, get_http_mock):
+        """
+        Test the GmailConnector in retrieving a page of message id's without errors on the API call.
+        """
+        # Retrieve a list of all the messages in the email box.
+        get_http_mock.return_value = HttpMock('lily/messaging/email/tests/data/all_message_id_list_single_page.json',
+                                              {'status': '200'})
 
         email_account = EmailAccount.objects.first()
 
         # Retrieve all messages.
         connector = GmailConnector(email_account)
-        messages = connector.get_all_message_id_list()
+        messages, next_page_token = connector.get_message_id_page()
 
-        # Verify that all messages are retrieved and that the history id is set correct,
+        # Verify that all messages are retrieved and that there is no next page.
         self.assertEqual(len(messages), 10, "{0} Messages found, it should be {1}.".format(len(messages), 10))
-        self.assertEqual(connector.history_id, u'8095',
-                         "History id {0} is incorrect, it should be {1}.".format(connector.history_id, u'8095'))
+        self.assertIsNone(next_page_token)
 
     @patch.object(GmailService, '_get_http')
-    def test_get_all_message_id_list_paged(self, get_http_mock):
+    def test_get_message_id_page_paged(self, get_http_mock):
         """
-        Test the GmailConnector in retrieving all message id's without errors on the API call.
+        Test the GmailConnector in retrieving message id's without errors on the API call.
         Messages are paged and need two API calls.
         """
         mock_api_calls = [
-            # Retrieve the history_id.
-            HttpMock('lily/messaging/email/tests/data/get_history_id.json', {'status': '200'}),
             # Retrieve a list of all the messages in the email box.
             HttpMock('lily/messaging/email/tests/data/all_message_id_list_paged_1.json', {'status': '200'}),
             HttpMock('lily/messaging/email/tests/data/all_message_id_list_paged_2.json', {'status': '200'}),
@@ -210,19 +323,23 @@ class GmailConnectorTests(UserBasedTest, APITestCase):
 
         email_account = EmailAccount.objects.first()
 
-        # Retrieve all messages.
+        # Retrieve the first page.
         connector = GmailConnector(email_account)
-        messages = connector.get_all_message_id_list()
+        messages, next_page_token = connector.get_message_id_page()
 
-        # Verify that all messages are retrieved and that the history id is set correct,
-        self.assertEqual(len(messages), 10, "{0} Messages found, it should be {1}.".format(len(messages), 10))
-        self.assertEqual(connector.history_id, u'8095',
-                         "History id {0} is incorrect, it should be {1}.".format(connector.history_id, 8095))
+        self.assertEqual(len(messages), 6, "{0} Messages found, it should be {1}.".format(len(messages), 6))
+        self.assertEqual(next_page_token, '12321651564')
+
+        # Retrieve the second and last page.
+        messages, next_page_token = connector.get_message_id_page(next_page_token)
+
+        self.assertEqual(len(messages), 4, "{0} Messages found, it should be {1}.".format(len(messages), 4))
+        self.assertIsNone(next_page_token)
 
     @patch.object(GmailConnector, 'execute_service_call')
-    def test_get_all_message_id_list_http_access_token_refresh_error(self, execute_service_call_mock):
+    def test_get_message_id_page_http_access_token_refresh_error(self, execute_service_call_mock):
         """
-        Test the GmailConnector in retrieving all message id's with a HttpAccessTokenRefreshError on the API call.
+        Test the GmailConnector in retrieving message id's with a HttpAccessTokenRefreshError on the API call.
         """
         execute_service_call_mock.side_effect = HttpAccessTokenRefreshError()
 
@@ -233,7 +350,7 @@ class GmailConnectorTests(UserBasedTest, APITestCase):
 
         # Retrieve all messages.
         try:
-            messages = connector.get_all_message_id_list()
+            messages = connector.get_message_id_page()
             self.fail('HttpAccessTokenRefreshError should have been raised.')
         except HttpAccessTokenRefreshError:
             pass
@@ -243,9 +360,9 @@ class GmailConnectorTests(UserBasedTest, APITestCase):
         self.assertIsNone(connector.history_id)
 
     @patch.object(GmailConnector, 'execute_service_call')
-    def test_get_all_message_id_list_failed_service_call_error(self, execute_service_call_mock):
+    def test_get_message_id_page_failed_service_call_error(self, execute_service_call_mock):
         """
-        Test the GmailConnector in retrieving all message id's with a FailedServiceCallException on the API call.
+        Test the GmailConnector in retrieving message id's with a FailedServiceCallException on the API call.
         """
         execute_service_call_mock.side_effect = FailedServiceCallException()
 
@@ -256,7 +373,7 @@ class GmailConnectorTests(UserBasedTest, APITestCase):
         # Retrieve all messages.
         messages = None
         try:
-            messages = connector.get_all_message_id_list()
+            messages = connector.get_message_id_page()
             self.fail('FailedServiceCallException should have been raised.')
         except FailedServiceCallException:
             pass
@@ -528,9 +645,7 @@ per inceptos himenaeos. Ut aliquet elit sed augue bibendum malesuada.</body></ht
         """
 
         mock_api_calls = [
-            # Simulate one rateLimitExceeded error.
-            HttpMock('lily/messaging/email/tests/data/get_history_id.json', {'status': '200'}),
-            HttpMock('lily/messaging/email/tests/data/all_message_id_list_single_page.json', {'status': '200'}),
+            HttpMock('lily/messaging/email/tests/data/get_history_page_1_empty.json', {'status': '200'}),
         ]
 
         get_http_mock.side_effect = mock_api_calls
@@ -538,7 +653,7 @@ per inceptos himenaeos. Ut aliquet elit sed augue bibendum malesuada.</body></ht
         # Initialze a connector and retrieve the history id.
         email_account = EmailAccount.objects.first()
         connector = GmailConnector(email_account)
-        connector.get_all_message_id_list()
+        connector.get_history()
 
         # Establish that the cleanup method up to test has actual data to cleanup.
         self.assertIsNotNone(connector.gmail_service)
@@ -1,3 +1,5 @@
+from collections import OrderedDict
+
 import anyjson
 from django.conf import settings
 from googleapiclient.discovery import build
@@ -6,6 +8,7 @@ from oauth2client.client import HttpAccessTokenRefreshError
 from rest_framework.test import APITestCase
 
 from lily.celery import app
+from lily.messaging.email.connector import GmailConnector, NotFoundError
 from lily.messaging.email.factories import EmailAccountFactory
 from lily.messaging.email.models.models import EmailAccount, EmailMessage, EmailOutboxMessage
 from lily.messaging.email.services import GmailService
@@ -19,6 +22,21 @@ def get_mock(filename, status):
     return HttpMock('lily/messaging/email/tests/data/{}'.format(filename), {'status': status})
 
 
+def get_message_info_batch(connector, message_ids):
+    """
+    Replacement for GmailConnector.get_message_info_batch, because a batch request can't be served by successive http
+    mock objects. Fetch the messages one by one in the given order instead.
+    """
+    message_infos = OrderedDict()
+    for message_id in message_ids:
+        try:
+            message_infos[message_id] = connector.get_message_info(message_id)
+        except NotFoundError:
+            pass
+
+    return message_infos
+
+
 class EmailTests(UserBasedTest, APITestCase):
     """
     Class for integrated email testing.
@@ -58,24 +76,25 @@ class EmailTests(UserBasedTest, APITestCase):
         get_mock('get_history_id.json', '200'),
         # Retrieve a list of all the messages in the email box.
         get_mock('all_message_id_list_single_page.json', '200'),
-        # Retrieve all 10 email messages and their labels.
+        # Retrieve all 10 email messages in one batch.
         get_mock('get_message_info_15a6008a4baa65f3.json', '200'),
-        get_mock('get_label_info_UNREAD.json', '200'),
-        get_mock('get_label_info_INBOX.json', '200'),
         get_mock('get_message_info_15a600737124149d.json', '200'),
-        get_mock('get_label_info_DRAFT.json', '200'),
         get_mock('get_message_info_15a600682d97904e.json', '200'),
-        get_mock('get_label_info_Label_2.json', '200'),
         get_mock('get_message_info_15a60067ef5e0bf9.json', '200'),
-        get_mock('get_label_info_STARRED.json', '200'),
         get_mock('get_message_info_15a600543e10c8e4.json', '200'),
         get_mock('get_message_info_15a60053f67f5de4.json', '200'),
-        get_mock('get_label_info_Label_1.json', '200'),
         get_mock('get_message_info_15a60053dea565fa.json', '200'),
         get_mock('get_message_info_15a60044bb3e2a7a.json', '200'),
         get_mock('get_message_info_15a60025b255c626.json', '200'),
-        get_mock('get_label_info_SENT.json', '200'),
         get_mock('get_message_info_15a6001f325c4e9d.json', '200'),
+        # Retrieve the labels of the messages while storing them.
+        get_mock('get_label_info_UNREAD.json', '200'),
+        get_mock('get_label_info_INBOX.json', '200'),
+        get_mock('get_label_info_DRAFT.json', '200'),
+        get_mock('get_label_info_Label_2.json', '200'),
+        get_mock('get_label_info_STARRED.json', '200'),
+        get_mock('get_label_info_Label_1.json', '200'),
+        get_mock('get_label_info_SENT.json', '200'),
     ]
 
     def setUp(self):
@@ -103,6 +122,13 @@ class EmailTests(UserBasedTest, APITestCase):
         build_service_mock = self.build_service_mock_patcher.start()
         build_service_mock.return_value = build('gmail', 'v1', credentials=credentials)
 
+        self.get_message_info_batch_patcher = patch.object(
+            GmailConnector,
+            'get_message_info_batch',
+            get_message_info_batch
+        )
+        self.get_message_info_batch_patcher.start()
+
         # Reset changes made to the email account in a test.
         self.email_account.refresh_from_db()
 
@@ -118,6 +144,7 @@ class EmailTests(UserBasedTest, APITestCase):
         self.get_credentials_mock_patcher.stop()
         self.authorize_mock_patcher.stop()
         self.build_service_mock_patcher.stop()
+        self.get_message_info_batch_patcher.stop()
 
     def test_full_synchronize_single_page_history(self):
         """
@@ -142,27 +169,29 @@ class EmailTests(UserBasedTest, APITestCase):
         mock_api_calls = [
             # Retrieve the history_id.
             get_mock('get_history_id.json', '200'),
-            # Retrieve a list of all the messages in the email box.
+            # Retrieve the first page of the messages in the email box.
             get_mock('all_message_id_list_paged_1.json', '200'),
-            get_mock('all_message_id_list_paged_2.json', '200'),
-            # Retrieve all 10 email messages and their labels.
+            # Retrieve the 6 email messages of the first page in one batch and their labels.
             get_mock('get_message_info_15a6008a4baa65f3.json', '200'),
-            get_mock('get_label_info_UNREAD.json', '200'),
-            get_mock('get_label_info_INBOX.json', '200'),
             get_mock('get_message_info_15a600737124149d.json', '200'),
-            get_mock('get_label_info_DRAFT.json', '200'),
             get_mock('get_message_info_15a600682d97904e.json', '200'),
-            get_mock('get_label_info_Label_2.json', '200'),
             get_mock('get_message_info_15a60067ef5e0bf9.json', '200'),
-            get_mock('get_label_info_STARRED.json', '200'),
             get_mock('get_message_info_15a600543e10c8e4.json', '200'),
             get_mock('get_message_info_15a60053f67f5de4.json', '200'),
+            get_mock('get_label_info_UNREAD.json', '200'),
+            get_mock('get_label_info_INBOX.json', '200'),
+            get_mock('get_label_info_DRAFT.json', '200'),
+            get_mock('get_label_info_Label_2.json', '200'),
+            get_mock('get_label_info_STARRED.json', '200'),
             get_mock('get_label_info_Label_1.json', '200'),
+            # Retrieve the second page of the messages in the email box.
+            get_mock('all_message_id_list_paged_2.json', '200'),
+            # Retrieve the 4 email messages of the second page in one batch and their labels.
             get_mock('get_message_info_15a60053dea565fa.json', '200'),
             get_mock('get_message_info_15a60044bb3e2a7a.json', '200'),
             get_mock('get_message_info_15a60025b255c626.json', '200'),
-            get_mock('get_label_info_SENT.json', '200'),
             get_mock('get_message_info_15a6001f325c4e9d.json', '200'),
+            get_mock('get_label_info_SENT.json', '200'),
         ]
 
         self._test_full_synchronize(mock_api_calls=mock_api_calls, label_data_after=self.verify_label_data_default)
@@ -180,27 +209,28 @@ class EmailTests(UserBasedTest, APITestCase):
             get_mock('get_history_id.json', '200'),
             # Retrieve a list of all the messages in the email box.
             get_mock('all_message_id_list_single_page.json', '200'),
-            # Retrieve all 10 email messages and their labels.
+            # Retrieve all 10 email messages in one batch.
             get_mock('get_message_info_15a6008a4baa65f3.json', '200'),
-            get_mock('get_label_info_UNREAD.json', '200'),
-            get_mock('get_label_info_INBOX.json', '200'),
             # Simulate one rateLimitExceeded error.
             get_mock('403.json', '403'),
             # And continue with syncing after a single error.
             get_mock('get_message_info_15a600737124149d.json', '200'),
-            get_mock('get_label_info_DRAFT.json', '200'),
             get_mock('get_message_info_15a600682d97904e.json', '200'),
-            get_mock('get_label_info_Label_2.json', '200'),
             get_mock('get_message_info_15a60067ef5e0bf9.json', '200'),
-            get_mock('get_label_info_STARRED.json', '200'),
             get_mock('get_message_info_15a600543e10c8e4.json', '200'),
             get_mock('get_message_info_15a60053f67f5de4.json', '200'),
-            get_mock('get_label_info_Label_1.json', '200'),
             get_mock('get_message_info_15a60053dea565fa.json', '200'),
             get_mock('get_message_info_15a60044bb3e2a7a.json', '200'),
             get_mock('get_message_info_15a60025b255c626.json', '200'),
-            get_mock('get_label_info_SENT.json', '200'),
             get_mock('get_message_info_15a6001f325c4e9d.json', '200'),
+            # Retrieve the labels of the messages while storing them.
+            get_mock('get_label_info_UNREAD.json', '200'),
+            get_mock('get_label_info_INBOX.json', '200'),
+            get_mock('get_label_info_DRAFT.json', '200'),
+            get_mock('get_label_info_Label_2.json', '200'),
+            get_mock('get_label_info_STARRED.json', '200'),
+            get_mock('get_label_info_Label_1.json', '200'),
+            get_mock('get_label_info_SENT.json', '200'),
         ]
 
         self._test_full_synchronize(mock_api_calls=mock_api_calls, label_data_after=self.verify_label_data_default)
@@ -333,8 +363,6 @@ class EmailTests(UserBasedTest, APITestCase):
         mock_api_calls = self.mock_api_calls_default + [
             # Retrieve the history updates since the first full synchronisation.
             get_mock('get_history_label_added.json', '200'),
-            # Retrieve the message to which the single label was added.
-            get_mock('get_labels_and_thread_id_for_message_id_{0}_label_added.json'.format(message_id), '200'),
         ]
 
         # Update the label data matching the mutation that was in the history update.
@@ -365,9 +393,6 @@ class EmailTests(UserBasedTest, APITestCase):
         mock_api_calls = self.mock_api_calls_default + [
             # Retrieve the history updates since the first full synchronisation.
             get_mock('get_history_label_added_multiple.json', '200'),
-            # Retrieve the messages to which the label was added.
-            get_mock('get_labels_and_thread_id_for_message_id_{0}_label_added.json'.format(message_id_2), '200'),
-            get_mock('get_labels_and_thread_id_for_message_id_{0}_label_added.json'.format(message_id_1), '200'),
         ]
 
         # Update the label data matching the mutation that was in the history update.
@@ -402,8 +427,6 @@ class EmailTests(UserBasedTest, APITestCase):
         mock_api_calls = self.mock_api_calls_default + [
             # Retrieve the history updates since the first full synchronisation.
             get_mock('get_history_label_removed.json', '200'),
-            # Retrieve the message to which the single label was removed.
-            get_mock('get_labels_and_thread_id_for_message_id_{0}_label_removed.json'.format(message_id), '200'),
         ]
 
         self._test_incremental_synchronize(mock_api_calls=mock_api_calls,
@@ -429,9 +452,6 @@ class EmailTests(UserBasedTest, APITestCase):
         mock_api_calls = self.mock_api_calls_default + [
             # Retrieve the history updates since the first full synchronisation.
             get_mock('get_history_label_removed_multiple.json', '200'),
-            # Retrieve the messages to which the single label was removed.
-            get_mock('get_labels_and_thread_id_for_message_id_{0}_label_removed.json'.format(message_id_1), '200'),
-            get_mock('get_labels_and_thread_id_for_message_id_{0}_label_removed.json'.format(message_id_2), '200'),
         ]
 
         # Update the label data matching the mutation that was in the history update.
@@ -461,9 +481,6 @@ class EmailTests(UserBasedTest, APITestCase):
         mock_api_calls = self.mock_api_calls_default + [
             # Retrieve the history updates since the first full synchronisation.
             get_mock('get_history_archived.json', '200'),
-            # Retrieve the archived messages.
-            get_mock('get_labels_and_thread_id_for_message_id_{0}_archived.json'.format(message_id_1), '200'),
-            get_mock('get_labels_and_thread_id_for_message_id_{0}_archived.json'.format(message_id_2), '200'),
         ]
 
         # Update the label data matching the mutation that was in the history update.
@@ -496,9 +513,6 @@ class EmailTests(UserBasedTest, APITestCase):
         mock_api_calls = self.mock_api_calls_default + [
             # Retrieve the history updates since the first full synchronisation.
             get_mock('get_history_starred.json', '200'),
-            # Retrieve the starred messages.
-            get_mock('get_labels_and_thread_id_for_message_id_{0}_starred.json'.format(message_id_1), '200'),
-            get_mock('get_labels_and_thread_id_for_message_id_{0}_starred.json'.format(message_id_2), '200'),
         ]
 
         # Update the label data matching the mutation that was in the history update.
@@ -531,9 +545,6 @@ class EmailTests(UserBasedTest, APITestCase):
         mock_api_calls = self.mock_api_calls_default + [
             # Retrieve the history updates since the first full synchronisation.
             get_mock('get_history_read.json', '200'),
-            # Retrieve the messages which were read.
-            get_mock('get_labels_and_thread_id_for_message_id_{0}_read.json'.format(message_id_1), '200'),
-            get_mock('get_labels_and_thread_id_for_message_id_{0}_read.json'.format(message_id_2), '200'),
         ]
 
         # Update the label data matching the mutation that was in the history update.
@@ -568,8 +579,6 @@ class EmailTests(UserBasedTest, APITestCase):
         mock_api_calls = self.mock_api_calls_default + [
             # Retrieve the history updates since the first full synchronisation.
             get_mock('get_history_unread.json', '200'),
-            # Retrieve the message which were marked unread.
-            get_mock('get_labels_and_thread_id_for_message_id_{0}_unread.json'.format(message_id), '200'),
         ]
 
         # Update the label data matching the mutation that was in the history update.
@@ -603,8 +612,6 @@ class EmailTests(UserBasedTest, APITestCase):
         mock_api_calls = self.mock_api_calls_default + [
             # Retrieve the history updates since the first full synchronisation.
             get_mock('get_history_spam.json', '200'),
-            # Retrieve the message which were marked spam.
-            get_mock('get_labels_and_thread_id_for_message_id_{0}_spam.json'.format(message_id), '200'),
             # Retrieve the corresponding spam label.
             get_mock('get_label_info_SPAM.json', '200'),
         ]
@@ -640,8 +647,6 @@ class EmailTests(UserBasedTest, APITestCase):
         mock_api_calls = self.mock_api_calls_default + [
             # Retrieve the history updates since the first full synchronisation.
             get_mock('get_history_unspam.json', '200'),
-            # Retrieve the message which were unmarked as spam.
-            get_mock('get_labels_and_thread_id_for_message_id_{0}_unspam.json'.format(message_id), '200'),
         ]
 
         # Update the label data matching the mutation that was in the history update.
@@ -668,8 +673,6 @@ class EmailTests(UserBasedTest, APITestCase):
         mock_api_calls = self.mock_api_calls_default + [
             # Retrieve the history updates since the first full synchronisation.
             get_mock('get_history_trashed.json', '200'),
-            # Retrieve the trashed message.
-            get_mock('get_labels_and_thread_id_for_message_id_{0}_trashed.json'.format(message_id), '200'),
             # Retrieve the corresponding trash label.
             get_mock('get_label_info_TRASH.json', '200'),
         ]
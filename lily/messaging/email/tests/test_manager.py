@@ -1,14 +1,18 @@
 # -*- coding: utf-8 -*-
+from datetime import timedelta
 import json
 
 import anyjson
+from django.test import override_settings
+from django.utils import timezone
 from googleapiclient.discovery import build
 from rest_framework.test import APITestCase
 
-from lily.messaging.email.connector import GmailConnector
+from lily.messaging.email.connector import GmailConnector, InvalidPageTokenError
 from lily.messaging.email.factories import EmailAccountFactory, EmailMessageFactory, EmailLabelFactory
 from lily.messaging.email.manager import GmailManager
-from lily.messaging.email.models.models import EmailAccount, EmailMessage, EmailLabel, EmailOutboxMessage
+from lily.messaging.email.models.models import (EmailAccount, EmailMessage, EmailLabel, EmailOutboxMessage,
+                                                EmailThread)
 from lily.messaging.email.services import GmailService
 from lily.settings import settings
 from lily.tests.utils import UserBasedTest, get_dummy_credentials
@@ -49,34 +53,150 @@ class GmailManagerTests(UserBasedTest, APITestCase):
         self.authorize_mock_patcher.stop()
         self.build_service_mock_patcher.stop()
 
-    @patch.object(GmailConnector, 'get_all_message_id_list')
+    @patch.object(GmailConnector, 'get_history_id')
+    @patch.object(GmailConnector, 'get_message_id_page')
     @patch('lily.messaging.email.manager.app.send_task')
-    def test_full_synchronize(self, send_task_mock, get_all_message_id_list_mock):
+    def test_full_synchronize(self, send_task_mock, get_message_id_page_mock, get_history_id_mock):
         """
         Test the GmailManager full synchronize. Verify that the message id's are processed correct by lookng at the
         correct number of calls on the http mock object.
         """
         send_task_mock.return_value = True
+        get_history_id_mock.return_value = {'historyId': '8095'}
 
         with open('lily/messaging/email/tests/data/all_message_id_list_single_page.json') as infile:
             json_obj = json.load(infile)
             messages = json_obj['messages']
-            get_all_message_id_list_mock.return_value = messages
+            get_message_id_page_mock.return_value = (messages, None)
 
         email_account = EmailAccount.objects.first()
         manager = GmailManager(email_account)
         manager.full_synchronize()
 
-        # Count the number of times the send_task mock was called to download a new message or to administer the
-        # synchronization finished.
-        call_download_email_message_count = sum(
-            call[0][0] == 'download_email_message' for call in send_task_mock.call_args_list)
+        # Collect the message ids the send_task mock was called with to download new messages and count the number
+        # of times it was called to administer the synchronization finished.
+        downloaded_message_ids = []
+        for call in send_task_mock.call_args_list:
+            if call[0][0] == 'download_email_messages':
+                downloaded_message_ids.extend(call[1]['args'][1])
         call_full_sync_finished_count = sum(
             call[0][0] == 'full_sync_finished' for call in send_task_mock.call_args_list)
 
-        self.assertEqual(call_download_email_message_count, len(messages))
+        self.assertEqual(set(downloaded_message_ids), set(message['id'] for message in messages))
         self.assertEqual(call_full_sync_finished_count, 1)
 
+        # Verify that the history id from the start of the full sync is stored and the checkpoint is cleared.
+        email_account.refresh_from_db()
+        self.assertEqual(email_account.history_id, 8095)
+        self.assertEqual(email_account.full_sync_page_token, '')
+        self.assertIsNone(email_account.temp_history_id)
+
+    @patch.object(GmailConnector, 'get_history_id')
+    @patch.object(GmailConnector, 'get_message_id_page')
+    @patch('lily.messaging.email.manager.app.send_task')
+    def test_full_synchronize_paged(self, send_task_mock, get_message_id_page_mock, get_history_id_mock):
+        """
+        Test the GmailManager full synchronize on multiple pages. Verify that a page token is stored after every page
+        and that a full sync resumes from the stored page token.
+        """
+        send_task_mock.return_value = True
+        get_history_id_mock.return_value = {'historyId': '8095'}
+
+        with open('lily/messaging/email/tests/data/all_message_id_list_paged_1.json') as infile:
+            page_1 = json.load(infile)
+        with open('lily/messaging/email/tests/data/all_message_id_list_paged_2.json') as infile:
+            page_2 = json.load(infile)
+
+        get_message_id_page_mock.side_effect = [
+            (page_1['messages'], page_1['nextPageToken']),
+            (page_2['messages'], None),
+        ]
+
+        email_account = EmailAccount.objects.first()
+        manager = GmailManager(email_account)
+        manager.full_synchronize()
+
+        # Verify that the page token is stored and a task for the next page is created.
+        email_account.refresh_from_db()
+        self.assertEqual(email_account.full_sync_page_token, page_1['nextPageToken'])
+        self.assertEqual(email_account.temp_history_id, 8095)
+        self.assertIsNone(email_account.history_id)
+        send_task_mock.assert_any_call('full_synchronize_email_account', args=[email_account.id])
+
+        # Continue with a new manager, like the task for the next page would do.
+        manager = GmailManager(email_account)
+        manager.full_synchronize()
+
+        # Verify that the second page is fetched with the stored token without starting over.
+        get_message_id_page_mock.assert_called_with(page_1['nextPageToken'])
+        self.assertEqual(get_history_id_mock.call_count, 1)
+
+        email_account.refresh_from_db()
+        self.assertEqual(email_account.history_id, 8095)
+        self.assertEqual(email_account.full_sync_page_token, '')
+
+    @patch.object(GmailConnector, 'get_history_id')
+    @patch.object(GmailConnector, 'get_message_id_page')
+    @patch('lily.messaging.email.manager.app.send_task')
+    def test_full_synchronize_invalid_page_token(self, send_task_mock, get_message_id_page_mock,
+                                                 get_history_id_mock):
+        """
+        Test that a full sync starts over when Gmail rejects the stored page token.
+        """
+        send_task_mock.return_value = True
+        get_history_id_mock.return_value = {'historyId': '8095'}
+
+        with open('lily/messaging/email/tests/data/all_message_id_list_single_page.json') as infile:
+            messages = json.load(infile)['messages']
+
+        get_message_id_page_mock.side_effect = [InvalidPageTokenError, (messages, None)]
+
+        email_account = EmailAccount.objects.first()
+        email_account.full_sync_page_token = 'expired'
+        email_account.temp_history_id = 1
+        email_account.save()
+
+        manager = GmailManager(email_account)
+        manager.full_synchronize()
+
+        # Verify that the first page is fetched with a new history id after the stored page token was rejected.
+        get_message_id_page_mock.assert_called_with(None)
+        self.assertEqual(get_history_id_mock.call_count, 1)
+
+        email_account.refresh_from_db()
+        self.assertEqual(email_account.history_id, 8095)
+        self.assertEqual(email_account.full_sync_page_token, '')
+        self.assertIsNone(email_account.temp_history_id)
+
+    @patch.object(GmailConnector, 'get_history_id')
+    @patch.object(GmailConnector, 'get_message_id_page')
+    @patch('lily.messaging.email.manager.app.send_task')
+    def test_full_synchronize_page_processed_twice(self, send_task_mock, get_message_id_page_mock,
+                                                   get_history_id_mock):
+        """
+        Test that only one task continues with the next page when a page is processed twice, like when the scheduler
+        resumed a full sync which was only slow.
+        """
+        send_task_mock.return_value = True
+        get_message_id_page_mock.return_value = ([], 'next')
+
+        email_account = EmailAccount.objects.first()
+        email_account.full_sync_page_token = 'current'
+        email_account.temp_history_id = 1
+        email_account.save()
+
+        GmailManager(EmailAccount.objects.get(pk=email_account.pk)).full_synchronize()
+        GmailManager(email_account).full_synchronize()
+
+        next_page_calls = [
+            call for call in send_task_mock.call_args_list if call[0][0] == 'full_synchronize_email_account'
+        ]
+        self.assertEqual(len(next_page_calls), 1)
+
+        email_account.refresh_from_db()
+        self.assertEqual(email_account.full_sync_page_token, 'next')
+        self.assertGreater(email_account.next_sync, timezone.now())
+
     @patch.object(GmailConnector, 'get_message_info')
     def test_download_message(self, get_message_info_mock):
         """
@@ -106,6 +226,156 @@ class GmailManagerTests(UserBasedTest, APITestCase):
         email_message_labels = set(email_message.labels.all().values_list('label_id', flat=True))
         self.assertEqual(email_message_labels, set([settings.GMAIL_LABEL_UNREAD, settings.GMAIL_LABEL_INBOX]))
 
+    @patch.object(GmailConnector, 'get_message_info_batch')
+    def test_download_messages(self, get_message_info_batch_mock):
+        """
+        Test the GmailManager on downloading multiple messages with a batch request.
+        """
+        message_ids = ['15a6008a4baa65f3', '15a600543e10c8e4']
+
+        message_infos = {}
+        for message_id in message_ids:
+            with open('lily/messaging/email/tests/data/get_message_info_{0}.json'.format(message_id)) as infile:
+                message_infos[message_id] = json.load(infile)
+        get_message_info_batch_mock.return_value = message_infos
+
+        email_account = EmailAccount.objects.first()
+
+        labels = [settings.GMAIL_LABEL_UNREAD, settings.GMAIL_LABEL_INBOX]
+        for label in labels:
+            EmailLabelFactory.create(account=email_account, label_id=label)
+
+        manager = GmailManager(email_account)
+        manager.download_messages(message_ids)
+
+        # Verify that all messages are fetched with a single batch request.
+        self.assertEqual(get_message_info_batch_mock.call_count, 1)
+
+        # Verify that the email messages are stored in the db.
+        self.assertEqual(
+            EmailMessage.objects.filter(account=email_account, message_id__in=message_ids).count(),
+            len(message_ids)
+        )
+
+        # Verify that the bulk inserted email messages have the correct labels and recipients.
+        for email_message in EmailMessage.objects.filter(account=email_account, message_id__in=message_ids):
+            email_message_labels = set(email_message.labels.all().values_list('label_id', flat=True))
+            expected_labels = set(labels) & set(message_infos[email_message.message_id]['labelIds'])
+            self.assertEqual(email_message_labels, expected_labels)
+            self.assertIsNotNone(email_message.sender_id)
+            self.assertTrue(email_message.received_by.exists())
+
+        # Verify that a summary is stored for the threads of the messages.
+        for message_id in message_ids:
+            email_thread = EmailThread.objects.get(account=email_account, thread_id=message_id)
+            self.assertEqual(email_thread.message_count, 1)
+            self.assertEqual(email_thread.unread_count, 1)
+            self.assertEqual(email_thread.last_message.message_id, message_id)
+            is_inbox = settings.GMAIL_LABEL_INBOX in message_infos[message_id]['labelIds']
+            self.assertEqual(email_thread.is_inbox, is_inbox)
+
+    @patch.object(GmailConnector, 'get_labels_and_thread_id_for_message_id')
+    @patch.object(GmailConnector, 'get_history')
+    @patch.object(GmailConnector, 'get_message_info_batch')
+    @patch('lily.messaging.email.manager.app.send_task')
+    def test_sync_by_history(self, send_task_mock, get_message_info_batch_mock, get_history_mock,
+                             get_labels_and_thread_id_for_message_id_mock):
+        """
+        Test the GmailManager on storing the label changes of a history update without fetching every message.
+        """
+        message_id_archived = '15a6008a4baa65f3'
+        message_id_deleted = '15a600543e10c8e4'
+        message_id_unknown = '15af6279f554fd15'
+
+        message_infos = {}
+        for message_id in [message_id_archived, message_id_deleted]:
+            with open('lily/messaging/email/tests/data/get_message_info_{0}.json'.format(message_id)) as infile:
+                message_infos[message_id] = json.load(infile)
+        get_message_info_batch_mock.return_value = message_infos
+
+        email_account = EmailAccount.objects.first()
+        for label in [settings.GMAIL_LABEL_UNREAD, settings.GMAIL_LABEL_INBOX, settings.GMAIL_LABEL_STAR]:
+            EmailLabelFactory.create(account=email_account, label_id=label)
+
+        manager = GmailManager(email_account)
+        manager.download_messages(message_infos.keys())
+
+        # The second label change of the archived message is the final state that should be stored.
+        get_history_mock.return_value = [
+            {'labelsAdded': [{'message': {
+                'id': message_id_archived,
+                'threadId': message_id_archived,
+                'labelIds': [settings.GMAIL_LABEL_UNREAD, settings.GMAIL_LABEL_INBOX, settings.GMAIL_LABEL_STAR],
+            }}]},
+            {'labelsRemoved': [{'message': {
+                'id': message_id_archived,
+                'threadId': message_id_archived,
+                'labelIds': [settings.GMAIL_LABEL_UNREAD, settings.GMAIL_LABEL_STAR],
+            }}]},
+            {'labelsAdded': [{'message': {
+                'id': message_id_unknown,
+                'threadId': message_id_unknown,
+                'labelIds': [settings.GMAIL_LABEL_INBOX],
+            }}]},
+            {'messagesDeleted': [{'message': {
+                'id': message_id_deleted,
+                'threadId': message_id_deleted,
+                'labelIds': [settings.GMAIL_LABEL_TRASH],
+            }}]},
+        ]
+
+        manager.sync_by_history()
+
+        # Verify that the labels weren't fetched per message.
+        self.assertFalse(get_labels_and_thread_id_for_message_id_mock.called)
+
+        # Verify that the final label state and the boolean identifiers are stored for the archived message.
+        email_message = EmailMessage.objects.get(account=email_account, message_id=message_id_archived)
+        email_message_labels = set(email_message.labels.all().values_list('label_id', flat=True))
+        self.assertEqual(email_message_labels, set([settings.GMAIL_LABEL_UNREAD]))
+        self.assertFalse(email_message.is_inbox_message)
+        self.assertTrue(email_message.is_starred_message)
+        self.assertFalse(email_message.read)
+
+        # Verify that the deleted message is removed.
+        self.assertFalse(EmailMessage.objects.filter(account=email_account, message_id=message_id_deleted).exists())
+
+        # Verify that only the message that isn't in the database is downloaded, by a single task.
+        send_task_mock.assert_called_once_with(
+            'download_email_messages', args=[email_account.id, [message_id_unknown]])
+
+    @override_settings(GMAIL_IDLE_SYNC_INTERVAL=60, GMAIL_IDLE_SYNC_MAX_INTERVAL=180)
+    @patch.object(GmailConnector, 'get_history')
+    def test_sync_by_history_idle(self, get_history_mock):
+        """
+        Test the GmailManager on backing off the incremental sync for an idle email account.
+        """
+        get_history_mock.return_value = []
+
+        email_account = EmailAccount.objects.first()
+        email_account.is_dirty = True
+        email_account.save()
+
+        manager = GmailManager(email_account)
+
+        # Every sync without changes doubles the interval until the next sync, up to the max interval.
+        for expected_interval in [60, 120, 180]:
+            before = timezone.now()
+            manager.sync_by_history()
+
+            email_account.refresh_from_db()
+            self.assertFalse(email_account.is_dirty)
+            self.assertGreaterEqual(email_account.next_sync, before + timedelta(seconds=expected_interval))
+            self.assertLessEqual(email_account.next_sync, timezone.now() + timedelta(seconds=expected_interval))
+
+        # A sync with changes makes the email account due on the next run of the scheduler.
+        manager.administer_sync_activity(True)
+
+        email_account.refresh_from_db()
+        self.assertEqual(email_account.idle_sync_count, 0)
+        self.assertIsNotNone(email_account.last_activity)
+        self.assertLessEqual(email_account.next_sync, timezone.now())
+
     @patch.object(GmailConnector, 'get_labels_and_thread_id_for_message_id')
     @patch.object(GmailConnector, 'get_message_info')
     def test_download_message_exists(self, get_message_info_mock, get_labels_and_thread_id_for_message_id_mock):
@@ -3,9 +3,11 @@ import anyjson
 from rest_framework.test import APITestCase
 
 from lily.messaging.email.factories import EmailAccountFactory, EmailMessageFactory
-from lily.messaging.email.models.models import EmailLabel, EmailHeader, EmailAccount, EmailOutboxMessage, EmailDraft
+from lily.messaging.email.models.models import (EmailLabel, EmailHeader, EmailAccount, EmailOutboxMessage, EmailDraft,
+                                                EmailMessage)
 
 from lily.messaging.email.utils import get_filtered_message
+from lily.search.scan_search import ModelMappings
 from lily.settings import settings
 from lily.tenant.factories import TenantFactory
 from lily.tests.utils import UserBasedTest, EmailBasedTest
@@ -128,6 +130,35 @@ class EmailMessageTests(UserBasedTest, EmailBasedTest, APITestCase):
         # Verify that the email is not archived.
         self.assertFalse(self.email_message.is_archived)
 
+    def test_extract_documents(self):
+        """
+        Test if the documents extracted in bulk are equal to the document extracted from the email message instance.
+        """
+        self._add_label(settings.GMAIL_LABEL_INBOX)
+        self._add_label(settings.GMAIL_LABEL_STAR)
+
+        mapping = ModelMappings.model_to_mappings[EmailMessage]
+        documents = mapping.extract_documents(EmailMessage.objects.filter(pk=self.email_message.pk))
+
+        self.assertEqual(documents, [mapping.extract_document(self.email_message.pk, self.email_message)])
+
+    def test_extract_document_pending_flags(self):
+        """
+        Test if the document of an email message uses the flags set by an action before the labels are synced.
+        """
+        self._add_label(settings.GMAIL_LABEL_INBOX)
+
+        self.email_message._is_archived = True
+        self.email_message._is_trashed = True
+
+        mapping = ModelMappings.model_to_mappings[EmailMessage]
+        document = mapping.extract_document(self.email_message.pk, self.email_message)
+
+        self.assertTrue(document['is_archived'])
+        self.assertTrue(document['is_trashed'])
+        self.assertFalse(document['is_starred'])
+        self.assertFalse(document['is_spam'])
+
     def _add_label(self, label):
         # Add the provided label to the email message.
         label = EmailLabel.objects.create(
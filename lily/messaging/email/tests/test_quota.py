@@ -0,0 +1,49 @@
+from django.test import TestCase, override_settings
+
+from lily.messaging.email.quota import GmailQuota, get_redis_client
+
+
+@override_settings(GMAIL_QUOTA_USER_RATE=10, GMAIL_QUOTA_PROJECT_RATE=100, GMAIL_QUOTA_MAX_PENALTY=300)
+class GmailQuotaTests(TestCase):
+    """
+    Class for testing the Gmail quota against Redis.
+    """
+
+    def setUp(self):
+        self.quota = GmailQuota('test')
+        self.other_quota = GmailQuota('test_other')
+
+        # Start every test with full buckets and without penalties.
+        get_redis_client().delete(
+            self.quota.account_key, self.quota.project_key, self.quota.penalty_key, self.quota.strikes_key,
+            self.other_quota.account_key, self.other_quota.penalty_key, self.other_quota.strikes_key,
+        )
+
+    def test_acquire(self):
+        """
+        Test that units are taken from the bucket until it's empty.
+        """
+        self.assertEqual(self.quota.acquire(5), 0)
+        self.assertEqual(self.quota.acquire(5), 0)
+
+        # The bucket of the email account is empty, so the next call has to wait for the refill.
+        wait = self.quota.acquire(5)
+        self.assertGreater(wait, 0)
+        self.assertLessEqual(wait, 0.5)
+
+        # The bucket of another email account isn't affected.
+        self.assertEqual(self.other_quota.acquire(5), 0)
+
+    def test_throttle(self):
+        """
+        Test that a rate limit error blocks the email account with a growing penalty.
+        """
+        first_penalty = self.quota.throttle()
+        second_penalty = self.quota.throttle()
+
+        self.assertGreaterEqual(first_penalty, 1)
+        self.assertGreaterEqual(second_penalty, 2)
+
+        # The email account has to wait for the penalty, other email accounts don't.
+        self.assertGreater(self.quota.acquire(1), 1)
+        self.assertEqual(self.other_quota.acquire(1), 0)
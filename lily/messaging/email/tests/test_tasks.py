@@ -0,0 +1,39 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+from mock import patch
+
+from lily.messaging.email.factories import EmailAccountFactory
+from lily.messaging.email.tasks import synchronize_email_account_scheduler
+from lily.tests.utils import UserBasedTest
+
+
+class SynchronizeEmailAccountSchedulerTests(UserBasedTest, TestCase):
+    @patch('lily.messaging.email.tasks.incremental_synchronize_email_account.apply_async')
+    @patch('lily.messaging.email.tasks.full_synchronize_email_account.apply_async')
+    def test_resume_stalled_full_sync(self, full_sync_mock, incremental_sync_mock):
+        """
+        Test that a full sync which didn't reach its next page in time is resumed and a running one is left alone.
+        """
+        stalled = EmailAccountFactory.create(
+            owner=self.user_obj,
+            tenant=self.user_obj.tenant,
+            is_syncing=True,
+            temp_history_id=1,
+            full_sync_page_token='token',
+            next_sync=timezone.now() - timedelta(minutes=1),
+        )
+        EmailAccountFactory.create(
+            owner=self.user_obj,
+            tenant=self.user_obj.tenant,
+            is_syncing=True,
+            temp_history_id=1,
+            full_sync_page_token='token',
+            next_sync=timezone.now() + timedelta(minutes=10),
+        )
+
+        synchronize_email_account_scheduler()
+
+        full_sync_mock.assert_called_once_with(args=(stalled.pk, ), max_retries=1, default_retry_delay=100)
+        self.assertFalse(incremental_sync_mock.called)
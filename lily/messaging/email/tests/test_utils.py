@@ -1,13 +1,14 @@
 import json
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
 from googleapiclient.discovery import build
 from lily.tests.utils import UserBasedTest, EmailBasedTest, get_dummy_credentials
 from lily.messaging.email.services import GmailService
-from lily.messaging.email.connector import GmailConnector
+from lily.messaging.email.connector import FailedServiceCallException, GmailConnector, RateLimitExceededError
 from lily.messaging.email.utils import get_formatted_email_body, get_formatted_reply_email_subject
 from lily.messaging.email.builders.utils import get_attachments_from_payload, get_body_html_from_payload
-from mock import patch
+from mock import Mock, patch
+from oauth2client.client import HttpAccessTokenRefreshError
 
 
 class EmailUtilsTestCase(UserBasedTest, EmailBasedTest, TestCase):
@@ -45,6 +46,7 @@ class EmailUtilsTestCase(UserBasedTest, EmailBasedTest, TestCase):
         with open('lily/messaging/email/tests/data/get_attachment_{0}.json'.format(message_id)) as infile:
             to_mock.return_value = json.load(infile)
 
+    @override_settings(GMAIL_LAZY_ATTACHMENTS=False)
     @patch.object(GmailConnector, 'get_attachment')
     @patch.object(GmailConnector, 'get_message_info')
     def test_extracting_attachment(self, get_message_info_mock, get_attachment_mock):
@@ -66,6 +68,77 @@ class EmailUtilsTestCase(UserBasedTest, EmailBasedTest, TestCase):
 
         self.assertEqual(len(attachments), 1)
 
+    @override_settings(GMAIL_LAZY_ATTACHMENTS=True)
+    @patch.object(GmailConnector, 'get_attachment')
+    @patch.object(GmailConnector, 'get_message_info')
+    def test_extracting_attachment_lazy(self, get_message_info_mock, get_attachment_mock):
+        message_id = '16740205f39700d1'
+        self.mock_get_message_info(get_message_info_mock, message_id)
+        self.mock_get_attachment(get_attachment_mock, message_id)
+
+        connector = GmailConnector(self.email_account)
+        message_info = connector.get_message_info(message_id)
+
+        payload = message_info['payload']
+
+        body_html = get_body_html_from_payload(payload, message_id)
+        attachments = get_attachments_from_payload(payload, body_html, message_id, connector)
+        self.email_message.attachments.add(bulk=False, *attachments)
+
+        # Only the metadata of the attachment is stored during the sync.
+        self.assertEqual(len(attachments), 1)
+        self.assertFalse(get_attachment_mock.called)
+        self.assertFalse(attachments[0].is_downloaded)
+        self.assertTrue(attachments[0].gmail_attachment_id)
+        self.assertTrue(attachments[0].name)
+
+        # The file is downloaded when the attachment is accessed for the first time.
+        self.assertTrue(attachments[0].fetch())
+        self.assertTrue(attachments[0].fetch())
+
+        get_attachment_mock.assert_called_once()
+
+        attachments[0].refresh_from_db()
+        self.assertTrue(attachments[0].is_downloaded)
+
+    @override_settings(GMAIL_LAZY_ATTACHMENTS=True)
+    @patch.object(GmailConnector, 'get_attachment')
+    @patch.object(GmailConnector, 'get_message_info')
+    def test_fetch_attachment_failure(self, get_message_info_mock, get_attachment_mock):
+        """
+        Test that a lazy attachment which can't be downloaded because of the connector isn't an error.
+        """
+        message_id = '16740205f39700d1'
+        self.mock_get_message_info(get_message_info_mock, message_id)
+
+        connector = GmailConnector(self.email_account)
+        payload = connector.get_message_info(message_id)['payload']
+        body_html = get_body_html_from_payload(payload, message_id)
+        attachments = get_attachments_from_payload(payload, body_html, message_id, connector)
+        self.email_message.attachments.add(bulk=False, *attachments)
+
+        for error in [RateLimitExceededError(10), FailedServiceCallException(), HttpAccessTokenRefreshError()]:
+            get_attachment_mock.side_effect = error
+            self.assertFalse(attachments[0].fetch())
+
+        attachments[0].refresh_from_db()
+        self.assertFalse(attachments[0].is_downloaded)
+
+    @override_settings(GMAIL_QUOTA_MAX_WAIT=10)
+    def test_max_quota_wait(self):
+        """
+        Test that a connector of a request doesn't sleep for the quota.
+        """
+        connector = GmailConnector(self.email_account, max_quota_wait=0)
+        connector.quota = Mock()
+        connector.quota.acquire.return_value = 1
+
+        with patch('lily.messaging.email.connector.time.sleep') as sleep_mock:
+            with self.assertRaises(RateLimitExceededError):
+                connector.draw_quota(1)
+
+        self.assertFalse(sleep_mock.called)
+
     @patch.object(GmailConnector, 'get_attachment')
     @patch.object(GmailConnector, 'get_message_info')
     def test_extracting_inline_attachment(self, get_message_info_mock, get_attachment_mock):
@@ -11,6 +11,9 @@ import html2text
 from urllib import unquote
 
 from django.apps import apps
+from django.contrib.postgres.aggregates import ArrayAgg, BoolOr
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, Max, When
 from django.db.models.query_utils import Q
 from django.conf import settings
 from django.core.files.storage import default_storage
@@ -27,9 +30,10 @@ from jinja2 import TemplateSyntaxError
 from lily.accounts.models import Account
 from lily.contacts.models import Contact
 from lily.search.scan_search import ModelMappings
-from lily.search.indexing import update_in_index
+from lily.search.connections_utils import get_index_name
+from lily.search.indexing import es, main_index, update_in_index
 
-from .models.models import EmailAttachment, EmailMessage, EmailAccount, SharedEmailConfig
+from .models.models import EmailAttachment, EmailMessage, EmailAccount, EmailThread, SharedEmailConfig
 from .sanitize import sanitize_html_email
 
 _EMAIL_PARAMETER_DICT = {}
@@ -344,6 +348,10 @@ def replace_cid_and_change_headers(html, pk):
 
             for file in attachments:
                 if (file.cid[1:-1] == image_cid or file.cid == image_cid) and file.cid not in cid_done:
+                    if not file.fetch():
+                        logger.warning('Inline attachment %s could not be downloaded, not adding it' % file.pk)
+                        continue
+
                     image['src'] = "cid:%s" % image_cid
 
                     storage_file = default_storage._open(file.attachment.name)
@@ -552,6 +560,24 @@ def reindex_email_message(instance):
         update_in_index(instance, mapping)
 
 
+def reindex_email_messages(message_ids):
+    """
+    Re-index the email messages with the given ids with bulk requests instead of one request per message.
+
+    Like reindex_email_message, failures are only logged so they don't interfere with storing the messages.
+    """
+    if settings.ES_OLD_DISABLED:
+        return
+    mapping = ModelMappings.model_to_mappings.get(EmailMessage)
+    if mapping:
+        try:
+            documents = mapping.extract_documents(EmailMessage.objects.filter(pk__in=message_ids))
+            if documents:
+                mapping.bulk_index(documents, id_field='id', index=get_index_name(main_index, mapping), es=es)
+        except Exception:
+            logger.exception('Unable to index email messages %s' % message_ids)
+
+
 def fullpath(filename):
     return os.path.join(DATA_DIR, "{:%H%M%S%f}".format(datetime.now()) + '-' + filename)
 
@@ -709,11 +735,17 @@ def restore_email_account_settings(tenant):
         email_account.save()
 
 
-def determine_message_type(thread_id, sent_date, email_address):
+def determine_message_type(thread_id, sent_date, email_address, email_thread=None):
     """
     Determine if the message is a reply, reply-all, forward, forward-multi or just a normal email.
     Return the message type and the message id it's a reply to, or forward of.
+
+    When the summary of the thread shows that the email account didn't send a message after this one, the message is
+    a normal email without looking at the thread.
     """
+    if email_thread and (not email_thread.last_outgoing_date or email_thread.last_outgoing_date <= sent_date):
+        return EmailMessage.NORMAL, None
+
     # Get the whole thread this message belongs to.
     thread = EmailMessage.objects.filter(thread_id=thread_id)
 
@@ -747,6 +779,78 @@ def determine_message_type(thread_id, sent_date, email_address):
     return EmailMessage.NORMAL, None
 
 
+def update_email_threads(email_account, thread_ids):
+    """
+    Recalculate the summary of the given threads from their messages. Threads without messages are removed.
+
+    Args:
+        email_account (instance): EmailAccount instance
+        thread_ids (iterable): ids of the threads with changed messages
+    """
+    thread_ids = set(thread_id for thread_id in thread_ids if thread_id)
+    if not thread_ids:
+        return
+
+    messages = EmailMessage.objects.filter(account=email_account, thread_id__in=thread_ids).order_by()
+
+    summaries = messages.values('thread_id').annotate(
+        last_sent_date=Max('sent_date'),
+        last_outgoing_date=Max(Case(When(sender__email_address=email_account.email_address, then='sent_date'))),
+        participants=ArrayAgg('sender__email_address'),
+        message_count=Count('pk'),
+        unread_count=Count(Case(When(read=False, then=1))),
+        is_inbox=BoolOr('is_inbox_message'),
+        is_trashed=BoolOr('is_trashed_message'),
+        is_spam=BoolOr('is_spam_message'),
+        is_sent=BoolOr('is_sent_message'),
+        is_draft=BoolOr('is_draft_message'),
+        is_starred=BoolOr('is_starred_message'),
+    )
+    # The most recent message of every thread.
+    last_message_ids = dict(
+        messages.order_by('thread_id', '-sent_date').distinct('thread_id').values_list('thread_id', 'pk')
+    )
+
+    threads = {
+        thread.thread_id: thread for thread in EmailThread.objects.filter(
+            account=email_account,
+            thread_id__in=thread_ids
+        )
+    }
+    new_threads = []
+
+    for summary in summaries:
+        thread_id = summary.pop('thread_id')
+        summary['participants'] = sorted(set(summary['participants']))
+        summary['last_message_id'] = last_message_ids.get(thread_id)
+        for field in ('is_inbox', 'is_trashed', 'is_spam', 'is_sent', 'is_draft', 'is_starred'):
+            # The boolean identifiers of the messages are null until their labels are stored.
+            summary[field] = bool(summary[field])
+
+        thread = threads.pop(thread_id, None)
+        if thread is None:
+            new_threads.append(EmailThread(account=email_account, thread_id=thread_id, **summary))
+        elif any(getattr(thread, name) != value for name, value in summary.items()):
+            EmailThread.objects.filter(pk=thread.pk).update(**summary)
+
+    if threads:
+        EmailThread.objects.filter(pk__in=[stale_thread.pk for stale_thread in threads.values()]).delete()
+
+    try:
+        with transaction.atomic():
+            EmailThread.objects.bulk_create(new_threads)
+    except IntegrityError:
+        # Another worker created some of the threads in the meantime.
+        fields = ('last_message_id', 'last_sent_date', 'last_outgoing_date', 'participants', 'message_count',
+                  'unread_count', 'is_inbox', 'is_trashed', 'is_spam', 'is_sent', 'is_draft', 'is_starred')
+        for thread in new_threads:
+            EmailThread.objects.update_or_create(
+                account=email_account,
+                thread_id=thread.thread_id,
+                defaults={name: getattr(thread, name) for name in fields},
+            )
+
+
 def get_formatted_reply_email_subject(subject, prefix='Re: '):
     while True:
         if subject.lower().startswith('re:') or subject.lower().startswith('fw:'):
@@ -178,6 +178,9 @@ class EmailAttachmentProxy(View):
         except:
             raise Http404()
 
+        if not attachment.fetch():
+            raise Http404()
+
         s3_file = default_storage._open(attachment.attachment.name)
 
         wrapper = FileWrapper(s3_file)
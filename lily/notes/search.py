@@ -4,6 +4,14 @@ from .models import Note
 
 
 class NoteMapping(BaseMapping):
+    batch_select_related = (
+        'author',
+        'gfk_content_type',
+    )
+    batch_prefetch_related = (
+        'subject',
+    )
+
     @classmethod
     def get_model(cls):
         return Note
@@ -67,13 +75,6 @@ class NoteMapping(BaseMapping):
         return {
         }
 
-    @classmethod
-    def prepare_batch(cls, queryset):
-        """
-        Optimize a queryset for batch indexing.
-        """
-        return queryset
-
     @classmethod
     def obj_to_doc(cls, obj):
         """
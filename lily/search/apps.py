@@ -2,7 +2,7 @@ from django.utils.module_loading import autodiscover_modules
 from django_elasticsearch_dsl.apps import DEDConfig
 from elasticsearch_dsl.connections import connections
 
-from lily.settings import settings
+from .connections_utils import get_es_dsl_connections
 
 
 class SearchConfig(DEDConfig):
@@ -11,4 +11,4 @@ class SearchConfig(DEDConfig):
 
     def ready(self):
         autodiscover_modules('documents')
-        connections.configure(**settings.ELASTICSEARCH_DSL)
+        connections.configure(**get_es_dsl_connections())
@@ -7,6 +7,9 @@ from lily.search.indexing import prepare_dict
 class BaseMapping(MappingType, Indexable):
     has_deleted_mixin = None
     model = None
+    # Prefetch profile: the relations obj_to_doc uses, loaded for a whole batch of objects by prepare_batch.
+    batch_select_related = ()
+    batch_prefetch_related = ()
 
     @classmethod
     def get_model(cls):
@@ -82,6 +85,15 @@ class BaseMapping(MappingType, Indexable):
             except FieldDoesNotExist:
                 return False
 
+    @classmethod
+    def get_indexed_fields(cls):
+        """
+        Method stump for the fields of the model used in the documents.
+
+        Saves of instances which change none of these fields aren't indexed. None means every save is indexed.
+        """
+        return None
+
     @classmethod
     def get_related_models(cls):
         """
@@ -89,9 +101,23 @@ class BaseMapping(MappingType, Indexable):
         """
         return {}
 
+    @classmethod
+    def get_related_fields(cls):
+        """
+        Method stump for the fields of related models used in the documents.
+
+        Saves of a related model with update_fields which contain none of these fields don't reindex the related
+        objects. Saves of related models which aren't listed always reindex the related objects.
+        """
+        return {}
+
     @classmethod
     def prepare_batch(cls, queryset):
         """
-        Method stump for batch query opimalizations.
+        Optimize a queryset for batch indexing with the prefetch profile of the mapping.
         """
+        if cls.batch_select_related:
+            queryset = queryset.select_related(*cls.batch_select_related)
+        if cls.batch_prefetch_related:
+            queryset = queryset.prefetch_related(*cls.batch_prefetch_related)
         return queryset
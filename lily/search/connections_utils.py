@@ -1,13 +1,22 @@
+import threading
+import time
+
 import urllib3
 
 import certifi
 from django.conf import settings
+from elasticsearch import exceptions as es_exceptions
+from elasticsearch.connection import Urllib3HttpConnection as DslUrllib3HttpConnection
+from elasticsearch_old import exceptions as es_old_exceptions
 from elasticsearch_old.connection.http_urllib3 import Urllib3HttpConnection
 from elasticsearch_old.exceptions import ImproperlyConfigured
 from elasticutils.contrib.django import get_es
 
 
 def get_es_client(**kwargs_overrides):
+    """
+    Returns the ES client of this process, clients with the same kwargs share their connection pool.
+    """
     return get_es(**get_es_client_kwargs(**kwargs_overrides))
 
 
@@ -21,14 +30,132 @@ def get_es_client_kwargs(**kwargs_overrides):
         'urls': settings.ES_OLD_URLS,
         'timeout': settings.ES_OLD_TIMEOUT,
         'maxsize': settings.ES_OLD_MAXSIZE,
+        'max_retries': settings.ES_OLD_MAX_RETRIES,
         'retry_on_status': (503, 504, 429),  # We add 429 for concurrent requests.
         'connection_class': Urllib3HttpBlockingConnection,
-        'block': settings.ES_OLD_BLOCK
+        'block': settings.ES_OLD_BLOCK,
+        'sniff_on_start': settings.ES_OLD_SNIFF,
+        'sniff_on_connection_fail': settings.ES_OLD_SNIFF,
     }
     client_kwargs.update(kwargs_overrides)
     return client_kwargs
 
 
+def get_es_dsl_connections():
+    """
+    Returns the connections of the ES6 cluster for elasticsearch_dsl, configured from settings.
+    """
+    es_connections = {}
+    for alias, connection_kwargs in settings.ELASTICSEARCH_DSL.items():
+        es_connections[alias] = dict({
+            'timeout': settings.ES_TIMEOUT,
+            'maxsize': settings.ES_MAXSIZE,
+            'max_retries': settings.ES_MAX_RETRIES,
+            'retry_on_timeout': False,
+            'connection_class': DslUrllib3HttpCircuitBreakerConnection,
+            'sniff_on_start': settings.ES_SNIFF,
+            'sniff_on_connection_fail': settings.ES_SNIFF,
+        }, **connection_kwargs)
+    return es_connections
+
+
+class CircuitBreaker(object):
+    """
+    Fail requests to an Elasticsearch node right away for a while after successive connection errors and timeouts.
+
+    A slow node then degrades search, instead of keeping every worker waiting on the timeout. After the reset timeout
+    the circuit is half open: a single trial request is let through while the others keep failing. The circuit closes
+    when the trial succeeds and opens again when it fails.
+    """
+    def __init__(self, threshold, reset_timeout):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_started_at = None
+        self.lock = threading.Lock()
+
+    def allow_request(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+
+            now = time.time()
+            if now - self.opened_at < self.reset_timeout:
+                return False
+
+            # Another trial is let through when the running one never reports back.
+            if self.trial_started_at is not None and now - self.trial_started_at < self.reset_timeout:
+                return False
+
+            self.trial_started_at = now
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_started_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_started_at = None
+            # A failing trial opens the circuit again right away.
+            if self.failures >= self.threshold or self.opened_at is not None:
+                self.opened_at = time.time()
+
+
+_circuit_breakers = {}
+_circuit_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(host):
+    """
+    Returns the circuit breaker of the node, shared by all clients of this process.
+    """
+    with _circuit_breakers_lock:
+        if host not in _circuit_breakers:
+            _circuit_breakers[host] = CircuitBreaker(
+                settings.ES_CIRCUIT_BREAKER_THRESHOLD,
+                settings.ES_CIRCUIT_BREAKER_TIMEOUT,
+            )
+        return _circuit_breakers[host]
+
+
+class CircuitBreakerMixin(object):
+    """
+    Connection mixin which guards the requests to the node with its circuit breaker.
+    """
+    connection_error_class = None
+
+    def perform_request(self, *args, **kwargs):
+        circuit_breaker = get_circuit_breaker(self.host)
+        if not circuit_breaker.allow_request():
+            raise self.connection_error_class('N/A', 'Circuit breaker open for %s' % self.host, None)
+
+        try:
+            response = super(CircuitBreakerMixin, self).perform_request(*args, **kwargs)
+        except self.connection_error_class:
+            # Connection errors include timeouts.
+            circuit_breaker.record_failure()
+            raise
+        except Exception:
+            # Error responses like a missing document still show the node is reachable, which ends a trial too.
+            circuit_breaker.record_success()
+            raise
+
+        circuit_breaker.record_success()
+        return response
+
+
+class DslUrllib3HttpCircuitBreakerConnection(CircuitBreakerMixin, DslUrllib3HttpConnection):
+    """
+    Connection to the ES6 cluster with a circuit breaker.
+    """
+    connection_error_class = es_exceptions.ConnectionError
+
+
 def get_index_name(base_index_name, mapping):
     """
     Returns the full index name, based on the base index name and mapping or type.
@@ -38,9 +165,9 @@ def get_index_name(base_index_name, mapping):
     return '%s.%s' % (base_index_name, mapping)
 
 
-class Urllib3HttpBlockingConnection(Urllib3HttpConnection):
+class Urllib3HttpBlockingConnection(CircuitBreakerMixin, Urllib3HttpConnection):
     """
-    Default connection class using the `urllib3`, with blocking option.
+    Default connection class using the `urllib3`, with blocking option and a circuit breaker.
 
     Note that the code is mostly copy paste from `Urllib3HttpConnection`.
     The only difference is the addition of the `block` kwarg.
@@ -57,6 +184,8 @@ class Urllib3HttpBlockingConnection(Urllib3HttpConnection):
     :arg maxsize: the maximum number of connections which will be kept open to
         this host.
     """
+    connection_error_class = es_old_exceptions.ConnectionError
+
     def __init__(self, host='localhost', port=9200, http_auth=None,
                  use_ssl=False, verify_certs=False, ca_certs=None, client_cert=None,
                  maxsize=10, block=False, **kwargs):
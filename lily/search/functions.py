@@ -1,24 +1,119 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
 from lily.accounts.models import Account
 from lily.contacts.models import Contact
 from lily.utils.functions import parse_phone_number
+from lily.utils.models.models import PhoneNumber, PhoneNumberLookup
+
+
+def get_phone_number_lookup_cache_key(tenant_id, number):
+    return 'phone_number_lookup:%s:%s' % (tenant_id, number)
+
+
+def lookup_phone_number(tenant_id, number):
+    """
+    Return the ids of the accounts and contacts with the phone number, read through the cache.
+
+    Args:
+        tenant_id (int): id of the Tenant
+        number (str): phone number parsed by parse_phone_number
+
+    Returns:
+        tuple: list of account ids and list of contact ids
+    """
+    timeout = settings.PHONE_NUMBER_LOOKUP_CACHE_TIMEOUT
+    cache_key = get_phone_number_lookup_cache_key(tenant_id, number)
+
+    result = cache.get(cache_key) if timeout > 0 else None
+    if result is None:
+        rows = PhoneNumberLookup.objects.filter(
+            tenant_id=tenant_id,
+            number=number
+        ).values_list('account_id', 'contact_id')
+
+        result = (
+            [account_id for account_id, contact_id in rows if account_id],
+            [contact_id for account_id, contact_id in rows if contact_id],
+        )
+
+        if timeout > 0:
+            cache.set(cache_key, result, timeout)
+
+    return result
+
+
+def update_phone_number_lookup(phone_number_ids):
+    """
+    Rebuild the lookup rows of the phone numbers from their links with accounts and contacts.
+
+    Args:
+        phone_number_ids (list): ids of the PhoneNumbers
+    """
+    phone_number_ids = list(phone_number_ids)
+    if not phone_number_ids:
+        return
+
+    lookups = PhoneNumberLookup.objects.filter(phone_number_id__in=phone_number_ids)
+    cache_keys = set(
+        get_phone_number_lookup_cache_key(tenant_id, number)
+        for tenant_id, number in lookups.values_list('tenant_id', 'number')
+    )
+    lookups.delete()
+
+    phone_numbers = {
+        phone_number_id: (tenant_id, parse_phone_number(number))
+        for phone_number_id, tenant_id, number in PhoneNumber.objects.filter(
+            pk__in=phone_number_ids
+        ).values_list('id', 'tenant_id', 'number')
+    }
+
+    new_lookups = []
+    for model, field_name in ((Account, 'account_id'), (Contact, 'contact_id')):
+        links = model.phone_numbers.through.objects.filter(
+            phonenumber_id__in=phone_numbers.keys()
+        ).values_list(field_name, 'phonenumber_id')
+
+        for object_id, phone_number_id in links:
+            tenant_id, number = phone_numbers[phone_number_id]
+            if not number:
+                continue
+
+            new_lookups.append(PhoneNumberLookup(
+                tenant_id=tenant_id,
+                number=number,
+                phone_number_id=phone_number_id,
+                **{field_name: object_id}
+            ))
+            cache_keys.add(get_phone_number_lookup_cache_key(tenant_id, number))
+
+    PhoneNumberLookup.objects.bulk_create(new_lookups)
+
+    # Clear the cache after the commit, so other requests can't cache the old rows in the meantime.
+    transaction.on_commit(lambda: cache.delete_many(list(cache_keys)))
 
 
 def search_number(tenant_id, number):
     """
     Return the first account the number belongs to, otherwise if there is, return the first contact with that number.
     """
+    account = None
     contact = None
     phone_number = parse_phone_number(number)
 
-    account = Account.objects.filter(
-        phone_numbers__number=phone_number,
-        tenant=tenant_id,
-        is_deleted=False
-    ).only('id', 'name').first()
+    account_ids, contact_ids = lookup_phone_number(tenant_id, phone_number)
+
+    if account_ids:
+        account = Account.objects.filter(
+            pk__in=account_ids,
+            tenant=tenant_id,
+            is_deleted=False
+        ).only('id', 'name').first()
 
-    if not account:
+    if not account and contact_ids:
         contact = Contact.objects.filter(
-            phone_numbers__number=phone_number,
+            pk__in=contact_ids,
             tenant=tenant_id,
             is_deleted=False
         ).only('id', 'first_name', 'last_name').first()
@@ -1,18 +1,30 @@
+from collections import defaultdict
 from datetime import date
 import logging
+import multiprocessing
 import traceback
 
 from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.db.models import Max, Min
 from elasticsearch_old.exceptions import NotFoundError
 from elasticutils.contrib.django import tasks
+from redis.exceptions import ResponseError
 
 from lily.search.connections_utils import get_es_client, get_index_name
 from lily.utils import logutil
+from lily.utils.functions import get_redis_client
 
 
 logger = logging.getLogger('search')
 main_index = settings.ES_OLD_INDEXES['default']
-es = get_es_client(maxsize=1)
+es = get_es_client()
+
+INDEX_QUEUE_KEY = 'search_index_queue'
+INDEX_QUEUE_SCHEDULED_KEY = 'search_index_queue:scheduled'
+REBUILD_KEY = 'search_index_rebuild:%s'
+REBUILD_DELETED_KEY = 'search_index_rebuild:%s:deleted'
 
 
 def update_in_index(instance, mapping):
@@ -63,6 +75,205 @@ def remove_from_index(instance, mapping):
         logger.error(traceback.format_exc(e))
 
 
+class IndexQueueFlush(object):
+    """
+    Callback run after a commit, which pushes the objects changed in the transaction to the index queue.
+    """
+    def __init__(self):
+        self.items = set()
+
+    def __call__(self):
+        push_to_index_queue(self.items)
+
+
+def queue_index_update(instance, mapping):
+    """
+    Queue the instance to be (re)indexed or removed from the index by the update_search_index task.
+    """
+    queue_index_updates(mapping, [instance.pk])
+
+
+def queue_index_updates(mapping, pks):
+    """
+    Queue the objects of the mapping type to be (re)indexed or removed from the index by the update_search_index task.
+
+    Changes within a transaction are collected and pushed to the queue once the transaction is committed, so every
+    object is indexed at most once per transaction and rolled back changes are never indexed.
+    """
+    if settings.ES_OLD_DISABLED or not pks:
+        return
+
+    items = set('%s:%s' % (mapping.get_mapping_type_name(), pk) for pk in pks)
+
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        push_to_index_queue(items)
+        return
+
+    for sids, func in connection.run_on_commit:
+        if isinstance(func, IndexQueueFlush):
+            func.items.update(items)
+            return
+
+    flush = IndexQueueFlush()
+    flush.items.update(items)
+    transaction.on_commit(flush)
+
+
+def push_to_index_queue(items):
+    """
+    Add the items to the index queue in Redis and schedule a task to process the queue if there's none yet.
+    """
+    # Import here to prevent a circular import with the tasks module.
+    from .tasks import update_search_index
+
+    try:
+        client = get_redis_client()
+        client.sadd(INDEX_QUEUE_KEY, *items)
+
+        if client.set(INDEX_QUEUE_SCHEDULED_KEY, 1, nx=True, ex=settings.ES_OLD_INDEX_QUEUE_TIMEOUT):
+            update_search_index.apply_async(countdown=settings.ES_OLD_INDEX_QUEUE_DELAY)
+    except Exception, e:
+        # Failures shouldn't interfere with the regular model updates.
+        logger.error(traceback.format_exc(e))
+
+
+def process_index_queue():
+    """
+    Index the objects in the index queue with a bulk request per mapping type, until the queue is empty.
+
+    The objects being processed stay in Redis until they're all indexed, so they aren't lost when the task fails or
+    the worker dies halfway.
+
+    Returns:
+        int: number of processed objects
+    """
+    # Import here to prevent a circular import, the mappings import this module.
+    from .scan_search import ModelMappings
+
+    client = get_redis_client()
+    processing_key = '%s:processing' % INDEX_QUEUE_KEY
+    mappings = {mapping.get_mapping_type_name(): mapping for mapping in ModelMappings.mappings}
+
+    # Objects queued from now on need a new task.
+    client.delete(INDEX_QUEUE_SCHEDULED_KEY)
+
+    processed = 0
+    while True:
+        # Objects left by a task which failed halfway are processed first, renaming the queue would overwrite them.
+        if not client.exists(processing_key):
+            # Take the whole queue at once, so objects queued in the meantime end up in a fresh queue.
+            try:
+                client.rename(INDEX_QUEUE_KEY, processing_key)
+            except ResponseError:
+                # The queue doesn't exist, so it's empty.
+                break
+
+        items = list(client.smembers(processing_key))
+
+        pks_per_mapping = defaultdict(set)
+        for item in items:
+            mapping_type_name, pk = item.rsplit(':', 1)
+            if mapping_type_name in mappings:
+                pks_per_mapping[mapping_type_name].add(int(pk))
+
+        batches = []
+        for mapping_type_name, pks in pks_per_mapping.items():
+            pks = sorted(pks)
+            for i in range(0, len(pks), settings.ES_OLD_INDEX_QUEUE_BATCH_SIZE):
+                batches.append((mapping_type_name, pks[i:i + settings.ES_OLD_INDEX_QUEUE_BATCH_SIZE]))
+
+        for i, (mapping_type_name, batch) in enumerate(batches):
+            try:
+                index_batch(mappings[mapping_type_name], batch)
+            except Exception:
+                # Put the objects which aren't indexed yet back in the queue, so they're indexed by the retry of the
+                # task.
+                client.sadd(INDEX_QUEUE_KEY, *[
+                    '%s:%s' % (remaining_type_name, remaining_pk)
+                    for remaining_type_name, remaining_batch in batches[i:] for remaining_pk in remaining_batch
+                ])
+                client.delete(processing_key)
+                raise
+
+        # Only forget the objects once they're all indexed.
+        client.delete(processing_key)
+        processed += len(items)
+
+    return processed
+
+
+def start_rebuild(mapping, timeout):
+    """
+    Mark the mapping type as being rebuilt, so objects deleted in the meantime are recorded for the new index.
+    """
+    get_redis_client().set(REBUILD_KEY % mapping.get_mapping_type_name(), 1, ex=timeout)
+
+
+def finish_rebuild(mapping):
+    client = get_redis_client()
+    client.delete(REBUILD_KEY % mapping.get_mapping_type_name())
+    client.delete(REBUILD_DELETED_KEY % mapping.get_mapping_type_name())
+
+
+def record_rebuild_deletion(instance, mapping):
+    """
+    Record the deleted instance when its mapping type is being rebuilt, the signals only remove it from the old index.
+    """
+    try:
+        client = get_redis_client()
+        if client.exists(REBUILD_KEY % mapping.get_mapping_type_name()):
+            client.sadd(REBUILD_DELETED_KEY % mapping.get_mapping_type_name(), instance.pk)
+    except Exception, e:
+        # Failures shouldn't interfere with the regular model updates.
+        logger.error(traceback.format_exc(e))
+
+
+def pop_rebuild_deletions(mapping):
+    """
+    Return the primary keys of the objects deleted since the last call and forget them.
+    """
+    client = get_redis_client()
+    key = REBUILD_DELETED_KEY % mapping.get_mapping_type_name()
+
+    pks = list(client.smembers(key))
+    if pks:
+        client.srem(key, *pks)
+
+    return [int(pk) for pk in pks]
+
+
+def index_batch(mapping, pks, index_base=main_index):
+    """
+    Index the objects of the mapping type with a single bulk request, deleted objects are removed from the index.
+
+    Args:
+        mapping (class): mapping type of the objects
+        pks (list): primary keys of the objects
+        index_base (string, optional): base name of the index, defaults to the main index
+    """
+    index = get_index_name(index_base, mapping)
+    queryset = mapping.get_model().objects.filter(pk__in=pks)
+
+    if hasattr(mapping, 'extract_documents'):
+        documents = mapping.extract_documents(queryset)
+    else:
+        documents = []
+        for instance in mapping.prepare_batch(queryset):
+            if not getattr(instance, 'is_deleted', False):
+                documents.append(mapping.extract_document(instance.pk, instance))
+
+    if documents:
+        mapping.bulk_index(documents, id_field='id', index=index, es=es)
+
+    indexed_pks = set(document['id'] for document in documents)
+    removed_pks = [pk for pk in pks if pk not in indexed_pks]
+    if removed_pks:
+        es.bulk(body=[
+            {'delete': {'_index': index, '_type': mapping.get_mapping_type_name(), '_id': pk}} for pk in removed_pks
+        ])
+
+
 def index_objects(mapping, queryset, index, print_progress=False):
     """
     Index synchronously model specified mapping type with an optimized query.
@@ -79,6 +290,133 @@ def index_objects(mapping, queryset, index, print_progress=False):
     documents = []
 
 
+def parallel_index_objects(mapping, index, filters=None, workers=1, chunk_size=500, start_id=None, checkpoint_key=None,
+                           max_chunk_bytes=None, print_progress=False):
+    """
+    Index the objects of the mapping type in bulk, sharded by ranges of primary keys over a pool of processes.
+
+    Mappings which implement extract_documents convert a range to documents without model instances, other mappings
+    extract the documents of the instances of the prepared batch. The documents of a range are indexed with bulk
+    requests of at most max_chunk_bytes.
+
+    Every process builds the queryset of its range from the filters, sending a queryset to a process would pickle
+    all of its objects.
+
+    Args:
+        mapping (class): mapping type
+        index (string): base name of the index
+        filters (dict, optional): lookups to filter the objects to index
+        workers (int): number of processes indexing ranges at the same time
+        chunk_size (int): number of primary keys per range
+        start_id (int, optional): only index objects with a primary key from this id
+        checkpoint_key (string, optional): cache key to store the id up to which all objects are indexed
+        max_chunk_bytes (int, optional): maximum size of a bulk request, defaults to ES_OLD_BULK_MAX_BYTES
+
+    Returns:
+        int: number of indexed documents
+    """
+    filters = filters or {}
+
+    queryset = mapping.get_model().objects.filter(**filters)
+    if start_id:
+        queryset = queryset.filter(pk__gte=start_id)
+
+    bounds = queryset.aggregate(min_pk=Min('pk'), max_pk=Max('pk'))
+    if bounds['min_pk'] is None:
+        return 0
+
+    max_chunk_bytes = max_chunk_bytes or settings.ES_OLD_BULK_MAX_BYTES
+    ranges = [
+        (mapping, filters, index, min_pk, min_pk + chunk_size, max_chunk_bytes)
+        for min_pk in range(bounds['min_pk'], bounds['max_pk'] + 1, chunk_size)
+    ]
+
+    pool = None
+    if workers > 1:
+        # Forked processes can't share the database connections, every process opens its own connection.
+        connections.close_all()
+        pool = multiprocessing.Pool(workers, initializer=_init_index_worker)
+        results = pool.imap(_index_range, ranges)
+    else:
+        results = (_index_range(args) for args in ranges)
+
+    indexed = 0
+    try:
+        # Results are returned in order of the ranges, so every object before the end of a range is indexed.
+        for progress, (max_pk, count) in enumerate(results, 1):
+            indexed += count
+            if checkpoint_key:
+                cache.set(checkpoint_key, max_pk, None)
+            if print_progress:
+                logutil.print_progress(progress, len(ranges))
+    finally:
+        if pool:
+            pool.terminate()
+            pool.join()
+
+    return indexed
+
+
+def _init_index_worker():
+    """
+    Give every indexing process its own connection to Elasticsearch.
+    """
+    global es
+    es = get_es_client(maxsize=1, force_new=True)
+
+
+def _index_range(args):
+    """
+    Index the objects matching the filters with a primary key in the range.
+    """
+    mapping, filters, index, min_pk, max_pk, max_chunk_bytes = args
+
+    queryset = mapping.get_model().objects.filter(pk__gte=min_pk, pk__lt=max_pk, **filters)
+    if hasattr(mapping, 'extract_documents'):
+        documents = mapping.extract_documents(queryset)
+    else:
+        documents = [
+            mapping.extract_document(instance.pk, instance)
+            for instance in mapping.prepare_batch(queryset).order_by('pk')
+        ]
+
+    bulk_index_documents(mapping, documents, get_index_name(index, mapping), max_chunk_bytes)
+
+    return max_pk, len(documents)
+
+
+def bulk_index_documents(mapping, documents, index, max_chunk_bytes):
+    """
+    Index the documents with as few bulk requests as possible, without exceeding max_chunk_bytes per request.
+
+    Args:
+        mapping (class): mapping type of the documents
+        documents (list): documents with an id
+        index (string): name of the index
+        max_chunk_bytes (int): maximum size of the body of a bulk request
+    """
+    serializer = es.transport.serializer
+    mapping_type_name = mapping.get_mapping_type_name()
+
+    lines = []
+    size = 0
+    for document in documents:
+        action = serializer.dumps({'index': {'_index': index, '_type': mapping_type_name, '_id': document['id']}})
+        source = serializer.dumps(document)
+        document_size = len(action) + len(source) + 2
+
+        if lines and size + document_size > max_chunk_bytes:
+            es.bulk(body='\n'.join(lines) + '\n')
+            lines = []
+            size = 0
+
+        lines.extend([action, source])
+        size += document_size
+
+    if lines:
+        es.bulk(body='\n'.join(lines) + '\n')
+
+
 def unindex_objects(mapping, queryset, index, print_progress=False):
     """
     Remove synchronously model specified mapping type with an optimized query.
@@ -1,7 +1,7 @@
 import logging
 
 from django.conf import settings
-from elasticsearch_old.exceptions import RequestError
+from elasticsearch_old.exceptions import ConnectionError, RequestError
 from elasticutils import S
 
 from lily.accounts.models import Account
@@ -15,6 +15,44 @@ logger = logging.getLogger(__name__)
 main_index = settings.ES_OLD_INDEXES['default']
 
 
+class SourceS(S):
+    """
+    Search which can limit the fields of the documents Elasticsearch returns and add raw aggregations.
+    """
+    source_fields = None
+    aggregations = None
+
+    def source(self, fields):
+        """
+        Return a new search which only returns the given fields of the documents.
+        """
+        new = self._clone()
+        new.source_fields = list(fields)
+        return new
+
+    def aggregate_raw(self, **aggregations):
+        """
+        Return a new search with the given aggregations, their results are in the aggregations of the response.
+        """
+        new = self._clone()
+        new.aggregations = dict(self.aggregations or {}, **aggregations)
+        return new
+
+    def _clone(self, next_step=None):
+        new = super(SourceS, self)._clone(next_step=next_step)
+        new.source_fields = self.source_fields
+        new.aggregations = self.aggregations
+        return new
+
+    def build_search(self):
+        search = super(SourceS, self).build_search()
+        if self.source_fields is not None:
+            search['_source'] = self.source_fields
+        if self.aggregations:
+            search['aggs'] = self.aggregations
+        return search
+
+
 class LilySearch(object):
     """
     Search API for Elastic search backend.
@@ -31,7 +69,8 @@ class LilySearch(object):
             page (int): page number of pagination
             size (int): max number of returned results
         """
-        search_request = S().es(**get_es_client_kwargs()).indexes(settings.ES_OLD_INDEXES['default'])
+        # The kwargs are the same for every search, so every search of the process uses the same pooled client.
+        search_request = SourceS().es(**get_es_client_kwargs()).indexes(settings.ES_OLD_INDEXES['default'])
         self.search = search_request.all()
 
         # Always filter on Tenant.
@@ -81,6 +120,10 @@ class LilySearch(object):
             index_name = get_index_name(main_index, self.model_type)
             self.search = self.search.indexes(index_name)
 
+        if return_fields:
+            # Only fetch the requested fields from Elasticsearch, the id is always returned.
+            self.search = self.search.source(set(return_fields) | {'id'})
+
         if self.facet:
             facet_raw = {
                 'terms': {
@@ -111,9 +154,26 @@ class LilySearch(object):
                         }
                     )
 
-            facet_raw['facet_filter'] = facet_filter_dict
+            if self.model_type == 'tags_tag':
+                # Let Elasticsearch determine the latest usage of every tag name, instead of merging it from the hits.
+                facet_raw['aggs'] = {
+                    'last_used': {
+                        'max': {
+                            'field': 'last_used',
+                        },
+                    },
+                }
+
+                self.search = self.search.aggregate_raw(items={
+                    'filter': facet_filter_dict,
+                    'aggs': {
+                        'terms': facet_raw,
+                    },
+                })
+            else:
+                facet_raw['facet_filter'] = facet_filter_dict
 
-            self.search = self.search.facet_raw(items=facet_raw)
+                self.search = self.search.facet_raw(items=facet_raw)
 
         # Fire off search.
         try:
@@ -127,27 +187,28 @@ class LilySearch(object):
                     # We will add type if not specifically searched on it.
                     hit['type'] = result.es_meta.type
                 for field in result:
-                    # Add specified fields, or all fields when not specified.
-                    if return_fields:
-                        if field in return_fields:
-                            hit[field] = result[field]
-                    else:
+                    # The document only contains the specified fields, or all fields when not specified.
+                    if not return_fields or field in return_fields:
                         hit[field] = result[field]
                 hits.append(hit)
 
-            if execute.facets:
-                facets = execute.facets['items']['terms']
+            aggregations = execute.response.get('aggregations')
+            if aggregations:
+                facets = []
+                # Return the buckets in the same format as the terms facet.
+                for bucket in aggregations['items']['terms']['buckets']:
+                    facet = {
+                        'term': bucket['key'],
+                        'count': bucket['doc_count'],
+                    }
+                    if bucket['last_used'].get('value_as_string'):
+                        facet['last_used'] = bucket['last_used']['value_as_string']
+                    facets.append(facet)
 
-                if self.model_type == 'tags_tag':
-                    for hit in hits:
-                        # Get the object with the given name.
-                        facet = next((x for x in facets if x.get('term') == hit.get('name_flat')), None)
+                return hits, facets, execute.count, execute.took
 
-                        if facet and (not facet.get('last_used') or hit.get('last_used') > facet.get('last_used')):
-                            # Set the latest usage date.
-                            facet.update({
-                                'last_used': hit.get('last_used')
-                            })
+            if execute.facets:
+                facets = execute.facets['items']['terms']
 
                 return hits, facets, execute.count, execute.took
 
@@ -161,6 +222,10 @@ class LilySearch(object):
             # catch the exception here to prevent server errors.
             logger.error('request error %s' % e)
             return [], None, 0, 0
+        except ConnectionError as e:
+            # Elasticsearch is unreachable, too slow or its circuit breaker is open, degrade to no results.
+            logger.warning('connection error %s' % e)
+            return [], None, 0, 0
 
     def query_common_fields(self, query):
         """
@@ -10,6 +10,7 @@ class ModelMappings(object):
     mappings = []
     model_to_mappings = {}
     app_to_mappings = {}
+    related_to_mappings = {}
 
     @classmethod
     def scan(cls, apps_to_scan=settings.INSTALLED_APPS):
@@ -33,3 +34,10 @@ class ModelMappings(object):
                         cls.app_to_mappings[app] = member
             except Exception:
                 pass
+
+        cls.related_to_mappings = {}
+        for mapping in cls.mappings:
+            for model in mapping.get_related_models():
+                related_mappings = cls.related_to_mappings.setdefault(model, [])
+                if mapping not in related_mappings:
+                    related_mappings.append(mapping)
@@ -1,13 +1,25 @@
+from django.db.models import QuerySet
 from django.db.models.signals import post_save, post_delete, m2m_changed
 from django.dispatch.dispatcher import receiver
 
-from .indexing import update_in_index, remove_from_index
+from .indexing import (queue_index_update, queue_index_updates, record_rebuild_deletion, update_in_index,
+                       remove_from_index)
 from .scan_search import ModelMappings
 from django.conf import settings
 
 from functools import wraps
 
 
+def index_instance(instance, mapping):
+    """
+    Queue the instance for the update_search_index task, or index it right away when the queue is disabled.
+    """
+    if settings.ES_OLD_INDEX_QUEUE_ENABLED:
+        queue_index_update(instance, mapping)
+    else:
+        update_in_index(instance, mapping)
+
+
 def skip_signal():
     def _skip_signal(signal_func):
         @wraps(signal_func)
@@ -19,15 +31,32 @@ def skip_signal():
     return _skip_signal
 
 
+def get_changed_fields(instance, created=False, update_fields=None):
+    """
+    Return the names of the fields changed by a save, or None when they're unknown.
+    """
+    if created:
+        return None
+    if update_fields:
+        return set(update_fields)
+    if hasattr(instance, 'get_changed_fields'):
+        return instance.get_changed_fields()
+    return None
+
+
 @receiver(post_save)
 @skip_signal()
 def post_save_generic(sender, instance, **kwargs):
     if settings.ES_OLD_DISABLED:
         return
+    changed_fields = get_changed_fields(instance, kwargs.get('created'), kwargs.get('update_fields'))
     mapping = ModelMappings.model_to_mappings.get(sender)
     if mapping:
-        update_in_index(instance, mapping)
-    check_related(sender, instance)
+        indexed_fields = mapping.get_indexed_fields()
+        # Skip saves which only changed fields that aren't in the documents, like the modified date.
+        if indexed_fields is None or changed_fields is None or indexed_fields.intersection(changed_fields):
+            index_instance(instance, mapping)
+    check_related(sender, instance, changed_fields)
 
 
 @receiver(m2m_changed)
@@ -38,7 +67,7 @@ def m2m_changed_generic(sender, instance, action, **kwargs):
     if action.startswith('post_'):
         mapping = ModelMappings.model_to_mappings.get(type(instance))
         if mapping:
-            update_in_index(instance, mapping)
+            index_instance(instance, mapping)
         check_related(sender, instance)
 
 
@@ -48,24 +77,46 @@ def post_delete_generic(sender, instance, **kwargs):
         return
     mapping = ModelMappings.model_to_mappings.get(sender)
     if mapping:
-        remove_from_index(instance, mapping)
+        record_rebuild_deletion(instance, mapping)
+        if settings.ES_OLD_INDEX_QUEUE_ENABLED:
+            # The task removes objects from the index which no longer exist.
+            queue_index_update(instance, mapping)
+        else:
+            remove_from_index(instance, mapping)
     # Remember: We UPDATE our related object, not DELETE it
     # (So we can use the check_related also used in the post_save method).
     check_related(sender, instance)
 
 
-def check_related(sender, instance):
+def check_related(sender, instance, changed_fields=None):
     """
-    Check related models by checking if the sender is in the relations of the
-    mappings.
+    Reindex the objects of other mappings which contain data of the instance.
+
+    The mappings which depend on the model of the instance are looked up in the dependency graph built by the scan
+    of the mappings. A save which changed none of the fields a mapping uses is skipped. With the index queue enabled,
+    the ids of all related objects are queued at once without loading the objects.
     """
-    for mapping in ModelMappings.mappings:
-        # Use type(instance) because of sender, because m2m sender differs
-        # from type(instance).
-        related = mapping.get_related_models().get(type(instance))
-        if related:
-            for obj in related(instance):
-                # Some related objects are not specific to one model, such as
-                # 'subject' of Tag, so we do a double check to match the model.
-                if type(obj) is mapping.get_model():
-                    update_in_index(obj, mapping)
+    # Use type(instance) because of sender, because m2m sender differs
+    # from type(instance).
+    model = type(instance)
+
+    for mapping in ModelMappings.related_to_mappings.get(model, []):
+        related_fields = mapping.get_related_fields().get(model)
+        if changed_fields is not None and related_fields and not related_fields.intersection(changed_fields):
+            continue
+
+        related = mapping.get_related_models()[model](instance)
+
+        if isinstance(related, QuerySet):
+            if related.model is not mapping.get_model():
+                continue
+
+            if settings.ES_OLD_INDEX_QUEUE_ENABLED:
+                queue_index_updates(mapping, list(related.values_list('pk', flat=True)))
+                continue
+
+        for obj in related:
+            # Some related objects are not specific to one model, such as
+            # 'subject' of Tag, so we do a double check to match the model.
+            if type(obj) is mapping.get_model():
+                index_instance(obj, mapping)
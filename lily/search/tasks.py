@@ -0,0 +1,22 @@
+import logging
+
+from celery.task import task
+
+from .indexing import process_index_queue
+
+
+logger = logging.getLogger(__name__)
+
+
+@task(name='update_search_index', logger=logger, bind=True, max_retries=3, default_retry_delay=30)
+def update_search_index(self):
+    """
+    Index the objects queued by the signals, in bulk per mapping type.
+    """
+    try:
+        processed = process_index_queue()
+    except Exception as exc:
+        logger.exception('Updating the search index failed')
+        raise self.retry(exc=exc)
+
+    logger.info('Updated %s objects in the search index' % processed)
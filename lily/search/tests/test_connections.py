@@ -0,0 +1,55 @@
+from django.test import SimpleTestCase
+from mock import patch
+
+from lily.search.connections_utils import CircuitBreaker
+
+
+class CircuitBreakerTestCase(SimpleTestCase):
+    @patch('lily.search.connections_utils.time')
+    def test_circuit_breaker(self, time_mock):
+        """
+        Test that requests are refused after successive failures, until the reset timeout has passed.
+        """
+        time_mock.time.return_value = 1000
+        circuit_breaker = CircuitBreaker(threshold=2, reset_timeout=30)
+
+        circuit_breaker.record_failure()
+        self.assertTrue(circuit_breaker.allow_request())
+
+        circuit_breaker.record_failure()
+        self.assertFalse(circuit_breaker.allow_request())
+
+        # The circuit is half open after the timeout, a failing trial request opens it again.
+        time_mock.time.return_value = 1030
+        self.assertTrue(circuit_breaker.allow_request())
+        circuit_breaker.record_failure()
+        self.assertFalse(circuit_breaker.allow_request())
+
+        time_mock.time.return_value = 1060
+        self.assertTrue(circuit_breaker.allow_request())
+        circuit_breaker.record_success()
+        circuit_breaker.record_failure()
+        self.assertTrue(circuit_breaker.allow_request())
+
+    @patch('lily.search.connections_utils.time')
+    def test_circuit_breaker_half_open(self, time_mock):
+        """
+        Test that a half open circuit lets a single trial request through, concurrent requests are refused.
+        """
+        time_mock.time.return_value = 1000
+        circuit_breaker = CircuitBreaker(threshold=1, reset_timeout=30)
+        circuit_breaker.record_failure()
+
+        time_mock.time.return_value = 1030
+        self.assertTrue(circuit_breaker.allow_request())
+        self.assertFalse(circuit_breaker.allow_request())
+
+        # A trial which never reports back is replaced after the timeout.
+        time_mock.time.return_value = 1060
+        self.assertTrue(circuit_breaker.allow_request())
+        self.assertFalse(circuit_breaker.allow_request())
+
+        # The circuit closes when the trial succeeds.
+        circuit_breaker.record_success()
+        self.assertTrue(circuit_breaker.allow_request())
+        self.assertTrue(circuit_breaker.allow_request())
@@ -0,0 +1,130 @@
+from django.db import transaction
+from django.test import TransactionTestCase, override_settings
+from mock import patch
+
+from lily.accounts.search import AccountMapping
+from lily.contacts.search import ContactMapping
+from lily.search.indexing import (INDEX_QUEUE_KEY, INDEX_QUEUE_SCHEDULED_KEY, process_index_queue,
+                                  queue_index_updates)
+from lily.tests.utils import FakeRedis
+
+
+@override_settings(ES_OLD_DISABLED=False, ES_OLD_INDEX_QUEUE_ENABLED=True, ES_OLD_INDEX_QUEUE_BATCH_SIZE=2)
+class IndexQueueTestCase(TransactionTestCase):
+    def setUp(self):
+        self.redis = FakeRedis()
+
+        patchers = [
+            patch('lily.search.indexing.get_redis_client', return_value=self.redis),
+            patch('lily.search.tasks.update_search_index.apply_async'),
+            patch('lily.search.indexing.index_batch'),
+        ]
+        self.mocks = [patcher.start() for patcher in patchers]
+        for patcher in patchers:
+            self.addCleanup(patcher.stop)
+
+        self.apply_async_mock = self.mocks[1]
+        self.index_batch_mock = self.mocks[2]
+
+        self.contact_type = ContactMapping.get_mapping_type_name()
+        self.account_type = AccountMapping.get_mapping_type_name()
+
+    def queued(self):
+        return self.redis.smembers(INDEX_QUEUE_KEY)
+
+    def test_queue_outside_transaction(self):
+        """
+        Test that objects changed outside a transaction are queued right away and that a single task is scheduled.
+        """
+        queue_index_updates(ContactMapping, [1, 2])
+        queue_index_updates(ContactMapping, [3])
+
+        self.assertEqual(self.queued(), {'%s:1' % self.contact_type, '%s:2' % self.contact_type,
+                                         '%s:3' % self.contact_type})
+        self.assertTrue(self.redis.exists(INDEX_QUEUE_SCHEDULED_KEY))
+        self.assertEqual(self.apply_async_mock.call_count, 1)
+
+    def test_queue_on_commit(self):
+        """
+        Test that objects changed in a transaction are queued once it's committed.
+        """
+        with transaction.atomic():
+            queue_index_updates(ContactMapping, [1])
+            queue_index_updates(ContactMapping, [1, 2])
+            queue_index_updates(AccountMapping, [1])
+
+            self.assertEqual(self.queued(), set())
+
+        self.assertEqual(self.queued(), {'%s:1' % self.contact_type, '%s:2' % self.contact_type,
+                                         '%s:1' % self.account_type})
+        self.assertEqual(self.apply_async_mock.call_count, 1)
+
+    def test_queue_rollback(self):
+        """
+        Test that objects changed in a transaction which is rolled back are never queued.
+        """
+        try:
+            with transaction.atomic():
+                queue_index_updates(ContactMapping, [1])
+                raise ValueError
+        except ValueError:
+            pass
+
+        self.assertEqual(self.queued(), set())
+        self.assertFalse(self.apply_async_mock.called)
+
+    def test_process_index_queue(self):
+        """
+        Test that the queued objects are indexed in batches per mapping type and removed from Redis.
+        """
+        queue_index_updates(ContactMapping, [3, 1, 2])
+        queue_index_updates(AccountMapping, [1])
+
+        self.assertEqual(process_index_queue(), 4)
+
+        batches = sorted((call[0][0], call[0][1]) for call in self.index_batch_mock.call_args_list)
+        self.assertEqual(batches, sorted([
+            (ContactMapping, [1, 2]),
+            (ContactMapping, [3]),
+            (AccountMapping, [1]),
+        ]))
+        self.assertEqual(self.redis.data, {})
+
+    def test_process_index_queue_failure(self):
+        """
+        Test that the objects which aren't indexed yet are queued again when a batch fails.
+        """
+        queue_index_updates(ContactMapping, [1, 2, 3])
+        queue_index_updates(AccountMapping, [1, 2, 3])
+
+        # Fail the second batch, the first one is indexed.
+        self.index_batch_mock.side_effect = [None, Exception('Elasticsearch is down')]
+
+        with self.assertRaises(Exception):
+            process_index_queue()
+
+        first_mapping, first_batch = self.index_batch_mock.call_args_list[0][0]
+        indexed = set('%s:%s' % (first_mapping.get_mapping_type_name(), pk) for pk in first_batch)
+        mapping_type_names = [self.contact_type, self.account_type]
+        all_items = set('%s:%s' % (name, pk) for name in mapping_type_names for pk in [1, 2, 3])
+
+        self.assertEqual(self.queued(), all_items - indexed)
+        self.assertFalse(self.redis.exists('%s:processing' % INDEX_QUEUE_KEY))
+
+        # The retry indexes the remaining objects.
+        self.index_batch_mock.side_effect = None
+        self.assertEqual(process_index_queue(), len(all_items - indexed))
+
+    def test_process_index_queue_after_crash(self):
+        """
+        Test that the objects left by a worker which died while processing them are processed first.
+        """
+        processing_key = '%s:processing' % INDEX_QUEUE_KEY
+        self.redis.sadd(processing_key, '%s:1' % self.contact_type)
+        queue_index_updates(ContactMapping, [5])
+
+        self.assertEqual(process_index_queue(), 2)
+
+        batches = [call[0][1] for call in self.index_batch_mock.call_args_list]
+        self.assertEqual(batches, [[1], [5]])
+        self.assertEqual(self.redis.data, {})
@@ -0,0 +1,59 @@
+from django.test import SimpleTestCase, override_settings
+from mock import MagicMock, patch
+
+from lily.search.lily_search import LilySearch
+
+
+@override_settings(ES_OLD_DISABLED=False)
+class LilySearchTestCase(SimpleTestCase):
+    @patch('lily.search.lily_search.SourceS.execute')
+    def test_tag_facets_last_used(self, execute_mock):
+        """
+        Test that the latest usage of the tag facets is aggregated by Elasticsearch and returned with the facets.
+        """
+        # The search doesn't return any hits, the facets are aggregated for all matching tags.
+        execute_mock.return_value = MagicMock(
+            response={
+                'aggregations': {
+                    'items': {
+                        'doc_count': 3,
+                        'terms': {
+                            'buckets': [
+                                {
+                                    'key': 'Lily',
+                                    'doc_count': 2,
+                                    'last_used': {
+                                        'value': 1514764800000,
+                                        'value_as_string': '2018-01-01T00:00:00.000Z',
+                                    },
+                                },
+                                {
+                                    'key': 'Unused',
+                                    'doc_count': 1,
+                                    'last_used': {'value': None},
+                                },
+                            ],
+                        },
+                    },
+                },
+            },
+            count=0,
+            took=1,
+        )
+
+        search = LilySearch(tenant_id=1, model_type='tags_tag', facet={
+            'field': 'name_flat',
+            'filters': ['name:Lily'],
+            'size': 60,
+        })
+        hits, facets, total, took = search.do_search()
+
+        self.assertEqual(facets, [
+            {'term': 'Lily', 'count': 2, 'last_used': '2018-01-01T00:00:00.000Z'},
+            {'term': 'Unused', 'count': 1},
+        ])
+
+        aggregation = search.search.build_search()['aggs']['items']
+        self.assertEqual(aggregation['aggs']['terms']['terms'], {'field': 'name_flat', 'size': 60})
+        self.assertEqual(aggregation['aggs']['terms']['aggs'], {'last_used': {'max': {'field': 'last_used'}}})
+        self.assertEqual(aggregation['filter']['and'][0], {'term': {'tenant': 1}})
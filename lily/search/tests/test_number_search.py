@@ -1,6 +1,7 @@
 import json
 from datetime import datetime, timedelta
 
+from django.test import TestCase
 from django.urls import reverse
 from pytz import utc
 from rest_framework import status
@@ -15,6 +16,8 @@ from lily.deals.factories import DealFactory, DealStatusFactory
 from lily.deals.models import Deal
 from lily.notes.factories import NoteFactory
 from lily.notes.models import Note
+from lily.search.functions import lookup_phone_number
+from lily.tenant.factories import TenantFactory
 from lily.tests.utils import UserBasedTest
 from lily.users.factories import LilyUserFactory
 from lily.utils.models.factories import PhoneNumberFactory
@@ -349,3 +352,24 @@ class InternalNumberSearchAPITestCase(UserBasedTest, APITestCase):
         content = json.loads(response.content)
         self.assertEqual(content.get('internal_number'), user.internal_number)
         self.assertEqual(content.get('user'), user.id)
+
+
+class PhoneNumberLookupTestCase(TestCase):
+    def test_lookup_follows_phone_numbers(self):
+        """
+        Test that the lookup is updated when phone numbers are linked, changed and unlinked.
+        """
+        tenant = TenantFactory.create()
+        account = AccountFactory.create(tenant=tenant)
+        phone_number = PhoneNumberFactory.create(tenant=tenant, number='0611223344')
+
+        account.phone_numbers.add(phone_number)
+        self.assertEqual(lookup_phone_number(tenant.id, '+31611223344'), ([account.id], []))
+
+        phone_number.number = '0655667788'
+        phone_number.save()
+        self.assertEqual(lookup_phone_number(tenant.id, '+31611223344'), ([], []))
+        self.assertEqual(lookup_phone_number(tenant.id, '+31655667788'), ([account.id], []))
+
+        account.phone_numbers.remove(phone_number)
+        self.assertEqual(lookup_phone_number(tenant.id, '+31655667788'), ([], []))
@@ -0,0 +1,46 @@
+from django.test import TestCase
+
+from lily.accounts.factories import AccountFactory
+from lily.accounts.search import AccountMapping
+from lily.cases.factories import CaseFactory
+from lily.cases.search import CaseMapping
+from lily.contacts.factories import ContactWithAccountFactory
+from lily.contacts.search import ContactMapping
+from lily.deals.factories import DealFactory
+from lily.deals.search import DealMapping
+from lily.tenant.factories import TenantFactory
+from lily.tests.utils import ConstantQueriesMixin
+
+
+class PrepareBatchTestCase(ConstantQueriesMixin, TestCase):
+    """
+    The prefetch profile of a mapping should make extracting a batch of documents cost a fixed number of queries.
+    """
+    def extract_documents(self, mapping, tenant):
+        """
+        Extract the documents of all objects of the tenant.
+        """
+        queryset = mapping.get_model().objects.filter(tenant=tenant)
+
+        for instance in mapping.prepare_batch(queryset):
+            mapping.extract_document(instance.pk, instance)
+
+    def assert_constant_queries(self, mapping, factory):
+        tenant = TenantFactory.create()
+
+        self.assertConstantQueries(
+            lambda: self.extract_documents(mapping, tenant),
+            lambda size: factory.create_batch(size, tenant=tenant),
+        )
+
+    def test_account_mapping(self):
+        self.assert_constant_queries(AccountMapping, AccountFactory)
+
+    def test_contact_mapping(self):
+        self.assert_constant_queries(ContactMapping, ContactWithAccountFactory)
+
+    def test_deal_mapping(self):
+        self.assert_constant_queries(DealMapping, DealFactory)
+
+    def test_case_mapping(self):
+        self.assert_constant_queries(CaseMapping, CaseFactory)
@@ -17,8 +17,7 @@ from lily.contacts.models import Contact
 from lily.deals.models import Deal
 from lily.messaging.email.models.models import EmailAccount
 from lily.utils.functions import parse_phone_number
-from lily.search.functions import search_number
-from lily.utils.models.models import PhoneNumber
+from lily.search.functions import lookup_phone_number, search_number
 
 from .lily_search import LilySearch
 
@@ -315,10 +314,6 @@ class PhoneNumberSearchView(LoginRequiredMixin, View):
             },
         }
 
-        # TODO LILY-2786: Optimize number fetching queries.
-        # This function gets all accounts and contacts from the db, only
-        # returns the first one and then only gets the PK of the object here.
-        # These queries can be much faster and more simple.
         account, contact = search_number(self.request.user.tenant_id, number)
 
         if account:
@@ -429,27 +424,28 @@ class InternalNumberSearchView(LoginRequiredMixin, View):
 
         user = None
         assignee = None
+        contact = None
+        account = None
 
-        phone_numbers = PhoneNumber.objects.filter(
-            tenant=tenant,
-            number=phone_number
-        )
+        account_ids, contact_ids = lookup_phone_number(tenant.id, phone_number)
 
-        # Try to find a contact with the given phone number.
-        contact = Contact.objects.filter(
-            tenant=tenant,
-            phone_numbers__in=phone_numbers,
-        ).order_by(
-            '-modified'
-        ).first()
-
-        # Try to find an account with the given phone number.
-        account = Account.objects.filter(
-            tenant=tenant,
-            phone_numbers__in=phone_numbers,
-        ).order_by(
-            '-modified'
-        ).first()
+        if contact_ids:
+            # Try to find a contact with the given phone number.
+            contact = Contact.objects.filter(
+                tenant=tenant,
+                pk__in=contact_ids,
+            ).order_by(
+                '-modified'
+            ).first()
+
+        if account_ids:
+            # Try to find an account with the given phone number.
+            account = Account.objects.filter(
+                tenant=tenant,
+                pk__in=account_ids,
+            ).order_by(
+                '-modified'
+            ).first()
 
         if not contact:
             contact, assignee = self._get_contact_assignee_by_account(account)
@@ -60,20 +60,43 @@ CELERY_ROUTES = (
         # When task is created in first sync, this task will be routed to email_first_sync.
         'queue': 'email_scheduled_tasks'
     }},
+    {'download_email_messages': {
+        # When task is created in first sync, this task will be routed to email_first_sync.
+        'queue': 'email_scheduled_tasks'
+    }},
     {'update_labels_for_message': {
         # When task is created in first sync, this task will be routed to email_first_sync.
         'queue': 'email_scheduled_tasks'
     }},
+    {'watch_email_accounts_scheduler': {
+        'queue': 'email_scheduled_tasks'
+    }},
+    {'watch_email_account': {
+        'queue': 'email_scheduled_tasks'
+    }},
     {'migrate_email_messages': {
         # Temporary main task to migrate all the email messages in batches.
         'queue': 'other_tasks'
     }},
+    {'update_search_index': {
+        'queue': 'other_tasks'
+    }},
+    {'deliver_webhook_events': {
+        'queue': 'other_tasks'
+    }},
+    {'deliver_webhook_events_scheduler': {
+        'queue': 'other_tasks'
+    }},
 )
 CELERYBEAT_SCHEDULE = {
     'synchronize_email_account_scheduler': {
         'task': 'synchronize_email_account_scheduler',
         'schedule': timedelta(seconds=int(os.environ.get('EMAIL_SYNC_INTERVAL', 60))),
     },
+    'watch_email_accounts_scheduler': {
+        'task': 'watch_email_accounts_scheduler',
+        'schedule': timedelta(seconds=3600),  # Once every hour.
+    },
     'check_subscriptions_scheduler': {
         'task': 'check_subscriptions',
         'schedule': timedelta(seconds=int(os.environ.get('CHECK_SUBSCRIPTION_INTERVAL', 60 * 60 * 24))),
@@ -90,4 +113,8 @@ CELERYBEAT_SCHEDULE = {
         'task': 'cleanup_deleted_email_accounts',
         'schedule': crontab(hour=1, minute=0),  # Every night at one o'clock.
     },
+    'deliver_webhook_events_scheduler': {
+        'task': 'deliver_webhook_events_scheduler',
+        'schedule': timedelta(seconds=60),  # Retries the failed deliveries.
+    },
 }
@@ -580,6 +580,33 @@ else:
         },
     }
 
+# Caller ID lookups of phone numbers are cached for this number of seconds, 0 disables the cache.
+PHONE_NUMBER_LOOKUP_CACHE_TIMEOUT = int(os.environ.get('PHONE_NUMBER_LOOKUP_CACHE_TIMEOUT', 3600))
+
+#######################################################################################################################
+# WEBHOOKS                                                                                                            #
+#######################################################################################################################
+# Seconds the delivery task waits after an event, so events in quick succession are delivered by the same task.
+WEBHOOK_DELIVERY_DELAY = int(os.environ.get('WEBHOOK_DELIVERY_DELAY', 1))
+# Seconds after which events claimed by a delivery that never finished are delivered again.
+WEBHOOK_DELIVERY_TIMEOUT = int(os.environ.get('WEBHOOK_DELIVERY_TIMEOUT', 300))
+# Number of deliveries that may post to the same webhook at the same time.
+WEBHOOK_CONCURRENCY = int(os.environ.get('WEBHOOK_CONCURRENCY', 2))
+# Number of events posted per request, more than one posts a list of events instead of a single event.
+WEBHOOK_BATCH_SIZE = int(os.environ.get('WEBHOOK_BATCH_SIZE', 1))
+# Number of requests a delivery task does before leaving the remaining events to the next task.
+WEBHOOK_MAX_BATCHES = int(os.environ.get('WEBHOOK_MAX_BATCHES', 100))
+# Seconds to wait for the endpoint of a webhook.
+WEBHOOK_TIMEOUT = int(os.environ.get('WEBHOOK_TIMEOUT', 10))
+# Failed events are retried after this number of seconds, doubled for every attempt, up to the maximum attempts.
+WEBHOOK_RETRY_DELAY = int(os.environ.get('WEBHOOK_RETRY_DELAY', 60))
+WEBHOOK_MAX_ATTEMPTS = int(os.environ.get('WEBHOOK_MAX_ATTEMPTS', 8))
+# Days delivered events are kept.
+WEBHOOK_EVENT_RETENTION_DAYS = int(os.environ.get('WEBHOOK_EVENT_RETENTION_DAYS', 7))
+# Number of endpoints and connections per endpoint kept alive by every worker process.
+WEBHOOK_POOL_CONNECTIONS = int(os.environ.get('WEBHOOK_POOL_CONNECTIONS', 10))
+WEBHOOK_POOL_MAXSIZE = int(os.environ.get('WEBHOOK_POOL_MAXSIZE', 10))
+
 #######################################################################################################################
 # SUBSCRIPTION LIMITS                                                                                                 #
 #######################################################################################################################
@@ -626,6 +653,17 @@ ELASTICSEARCH_DSL = {
     'default': es_url_to_connection(os.environ.get(ES_PROVIDER_ENV, 'http://es:9200')),
 }
 
+# Every process keeps a pool of connections to the cluster, search requests fail instead of waiting for the timeout.
+ES_TIMEOUT = int(os.environ.get('ES_TIMEOUT', 10))
+ES_MAXSIZE = int(os.environ.get('ES_MAXSIZE', 10))
+ES_MAX_RETRIES = int(os.environ.get('ES_MAX_RETRIES', 1))
+ES_SNIFF = boolean(os.environ.get('ES_SNIFF', 0))
+
+# Requests to a node fail right away for ES_CIRCUIT_BREAKER_TIMEOUT seconds after this number of successive
+# connection errors or timeouts. Used for the connections to both clusters.
+ES_CIRCUIT_BREAKER_THRESHOLD = int(os.environ.get('ES_CIRCUIT_BREAKER_THRESHOLD', 5))
+ES_CIRCUIT_BREAKER_TIMEOUT = int(os.environ.get('ES_CIRCUIT_BREAKER_TIMEOUT', 30))
+
 # We use our own Elasticsearch synchronization, so we don't want to use the
 # builtin auto sync functionality.
 ELASTICSEARCH_DSL_AUTOSYNC = boolean(os.environ.get('ELASTICSEARCH_DSL_AUTOSYNC', 0))
@@ -659,18 +697,58 @@ ES_OLD_URLS = [es_old_url_to_connection(os.environ.get(ES_OLD_PROVIDER_ENV, 'htt
 ES_OLD_INDEXES = {'default': 'main_index'}
 
 # Default timeout of elasticsearch is to short for bulk updating, so we extend the timeout
-ES_OLD_TIMEOUT = os.environ.get('ES_OLD_TIMEOUT', 20)  # Default is 5
-ES_OLD_MAXSIZE = os.environ.get('ES_OLD_MAXSIZE', 2)  # Default is 10
-ES_OLD_BLOCK = os.environ.get('ES_OLD_BLOCK', True)  # Default is False
+ES_OLD_TIMEOUT = int(os.environ.get('ES_OLD_TIMEOUT', 20))  # Default is 5
+ES_OLD_MAXSIZE = int(os.environ.get('ES_OLD_MAXSIZE', 10))  # Default is 10
+ES_OLD_BLOCK = boolean(os.environ.get('ES_OLD_BLOCK', 1))  # Default is False
+ES_OLD_MAX_RETRIES = int(os.environ.get('ES_OLD_MAX_RETRIES', 3))  # Default is 3
+ES_OLD_SNIFF = boolean(os.environ.get('ES_OLD_SNIFF', 0))
+# Maximum size in bytes of the body of a bulk request when rebuilding an index.
+ES_OLD_BULK_MAX_BYTES = int(os.environ.get('ES_OLD_BULK_MAX_BYTES', 10 * 1024 * 1024))
+
+# Changed objects are queued in Redis and indexed in bulk by a task after the commit, instead of during the request.
+ES_OLD_INDEX_QUEUE_ENABLED = boolean(os.environ.get('ES_OLD_INDEX_QUEUE_ENABLED', 1))
+# Seconds the task waits before processing the queue, so more changes are indexed with the same bulk request.
+ES_OLD_INDEX_QUEUE_DELAY = int(os.environ.get('ES_OLD_INDEX_QUEUE_DELAY', 1))
+# Seconds after which a new task is scheduled when the previous one never started.
+ES_OLD_INDEX_QUEUE_TIMEOUT = int(os.environ.get('ES_OLD_INDEX_QUEUE_TIMEOUT', 300))
+ES_OLD_INDEX_QUEUE_BATCH_SIZE = int(os.environ.get('ES_OLD_INDEX_QUEUE_BATCH_SIZE', 500))
 
 #######################################################################################################################
 # Gmail settings                                                                                                      #
 #######################################################################################################################
 GOOGLE_OAUTH2_CLIENT_ID = os.environ.get('GOOGLE_OAUTH2_CLIENT_ID', '')
 GOOGLE_OAUTH2_CLIENT_SECRET = os.environ.get('GOOGLE_OAUTH2_CLIENT_SECRET', '')
-GMAIL_FULL_MESSAGE_BATCH_SIZE = os.environ.get('GMAIL_FULL_MESSAGE_BATCH_SIZE', 300)
-GMAIL_LABEL_UPDATE_BATCH_SIZE = os.environ.get('GMAIL_LABEL_UPDATE_BATCH_SIZE', 500)
+# Number of messages listed per page during a full sync, the new messages of a page are downloaded by a single task.
+GMAIL_FULL_MESSAGE_BATCH_SIZE = int(os.environ.get('GMAIL_FULL_MESSAGE_BATCH_SIZE', 300))
+# The scheduler resumes a full sync from its stored page token when no page was processed for this number of seconds.
+GMAIL_FULL_SYNC_PAGE_TIMEOUT = int(os.environ.get('GMAIL_FULL_SYNC_PAGE_TIMEOUT', 1800))
+# Number of requests combined into one batch request. Gmail allows at most 100, but larger batches trigger rate limits.
+GMAIL_BATCH_REQUEST_SIZE = int(os.environ.get('GMAIL_BATCH_REQUEST_SIZE', 50))
+# Number of messages of which the label changes of a history sync are written to the database at once.
+GMAIL_LABEL_UPDATE_BATCH_SIZE = int(os.environ.get('GMAIL_LABEL_UPDATE_BATCH_SIZE', 500))
+# Gmail api quota per email account and for the whole project in quota units per second, shared through Redis.
+GMAIL_QUOTA_ENABLED = boolean(os.environ.get('GMAIL_QUOTA_ENABLED', 1))
+GMAIL_QUOTA_USER_RATE = int(os.environ.get('GMAIL_QUOTA_USER_RATE', 250))
+GMAIL_QUOTA_PROJECT_RATE = int(os.environ.get('GMAIL_QUOTA_PROJECT_RATE', 20000))
+# Waits for the quota up to this number of seconds are slept in the worker, longer waits reschedule the task.
+GMAIL_QUOTA_MAX_WAIT = int(os.environ.get('GMAIL_QUOTA_MAX_WAIT', 2))
+GMAIL_QUOTA_MAX_PENALTY = int(os.environ.get('GMAIL_QUOTA_MAX_PENALTY', 300))
+# Number of authorized Gmail services kept per worker process and the seconds before a service is rebuilt.
+GMAIL_SERVICE_CACHE_SIZE = int(os.environ.get('GMAIL_SERVICE_CACHE_SIZE', 100))
+GMAIL_SERVICE_CACHE_TIMEOUT = int(os.environ.get('GMAIL_SERVICE_CACHE_TIMEOUT', 3600))
+# Attachments are downloaded from Gmail when they're opened for the first time, inline images optionally during sync.
+GMAIL_LAZY_ATTACHMENTS = boolean(os.environ.get('GMAIL_LAZY_ATTACHMENTS', 1))
+GMAIL_EAGER_INLINE_ATTACHMENTS = boolean(os.environ.get('GMAIL_EAGER_INLINE_ATTACHMENTS', 1))
 GMAIL_PARTIAL_SYNC_LIMIT = os.environ.get('GMAIL_PARTIAL_SYNC_LIMIT', 899)
+# Idle email accounts are synchronized with an interval that doubles with every sync without changes.
+GMAIL_IDLE_SYNC_INTERVAL = int(os.environ.get('GMAIL_IDLE_SYNC_INTERVAL', 60))
+GMAIL_IDLE_SYNC_MAX_INTERVAL = int(os.environ.get('GMAIL_IDLE_SYNC_MAX_INTERVAL', 900))
+# Cloud Pub/Sub topic for Gmail push notifications, push notifications are disabled without a topic.
+GMAIL_PUSH_TOPIC = os.environ.get('GMAIL_PUSH_TOPIC', '')
+# Token in the url of the push subscription, to verify that notifications are sent by Google.
+GMAIL_PUSH_TOKEN = os.environ.get('GMAIL_PUSH_TOKEN', '')
+# Interval between syncs of email accounts with push notifications, in case a notification gets lost.
+GMAIL_PUSH_SYNC_INTERVAL = int(os.environ.get('GMAIL_PUSH_SYNC_INTERVAL', 3600))
 GMAIL_CALLBACK_URL = os.environ.get('GMAIL_CALLBACK_URL', 'http://localhost:8080/messaging/email/callback/')
 GMAIL_SYNC_DELAY_INTERVAL = 1
 GMAIL_SYNC_LOCK_LIFETIME = 300
@@ -4,6 +4,10 @@ from .models import Tag
 
 
 class TagMapping(BaseMapping):
+    batch_select_related = (
+        'content_type',
+    )
+
     model = Tag
     has_deleted_mixin = False
 
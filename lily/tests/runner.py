@@ -24,6 +24,10 @@ class LilyNoseTestSuiteRunner(DiscoverRunner):
     Customize settings to run the test suite without problems.
     Settings it changes:
         * TESTING=True, useful to check if we are running tests.
+        * GMAIL_QUOTA_ENABLED=False, tests shouldn't share the Gmail quota in Redis.
+        * GMAIL_SERVICE_CACHE_SIZE=0, tests mock the Gmail service and shouldn't share it.
+        * ES_OLD_INDEX_QUEUE_ENABLED=False, tests search for objects right after saving them.
+        * PHONE_NUMBER_LOOKUP_CACHE_TIMEOUT=0, the cache isn't rolled back with the database between tests.
     """
     def __init__(self, *args, **kwargs):
         super(LilyNoseTestSuiteRunner, self).__init__(*args, **kwargs)
@@ -34,6 +38,16 @@ class LilyNoseTestSuiteRunner(DiscoverRunner):
 
         settings.TESTING = True
 
+        # Tests mock the Gmail api and shouldn't wait for each other in Redis.
+        settings.GMAIL_QUOTA_ENABLED = False
+        settings.GMAIL_SERVICE_CACHE_SIZE = 0
+
+        # Tests search right after saving, so index the objects directly instead of through the queue.
+        settings.ES_OLD_INDEX_QUEUE_ENABLED = False
+
+        # Cached phone number lookups would outlive the rollback of the objects of a test.
+        settings.PHONE_NUMBER_LOOKUP_CACHE_TIMEOUT = 0
+
         # manage.py test already does this, but not when providing a path, like
         # manage.py test lily/contacts/tests.
         settings.DEBUG = False
@@ -4,12 +4,15 @@ import json
 from urllib import urlencode
 
 from django.contrib.auth.models import AnonymousUser, Group
+from django.db import connection
 from django.db.models import Manager, Model
+from django.test.utils import CaptureQueriesContext
 from django_elasticsearch_dsl import Index
 from django_elasticsearch_dsl.registries import registry
 from elasticsearch import NotFoundError
 from oauth2client import GOOGLE_TOKEN_URI
 from oauth2client.client import OAuth2Credentials
+from redis.exceptions import ResponseError
 from django.utils import timezone
 from rest_framework import status
 from rest_framework.reverse import reverse
@@ -593,6 +596,93 @@ class ElasticsearchApiTestCase(object):
             self.assertIsNotNone(self.es_doc_type.get(id=db_obj.pk))
 
 
+class ConstantQueriesMixin(object):
+    """
+    Mixin for tests which check that the number of queries doesn't grow with the number of objects.
+    """
+
+    def count_queries(self, func):
+        with CaptureQueriesContext(connection) as context:
+            func()
+
+        return len(context.captured_queries)
+
+    def assertConstantQueries(self, func, create_objects):
+        """
+        Assert that calling func takes the same number of queries for a few objects as for more objects.
+
+        Args:
+            func (callable): code to count the queries of
+            create_objects (callable): creates the given number of objects
+        """
+        create_objects(2)
+        # Warm up caches like the content types, which are only queried once per process.
+        func()
+        small_queries = self.count_queries(func)
+
+        create_objects(8)
+        large_queries = self.count_queries(func)
+
+        self.assertEqual(small_queries, large_queries)
+
+
+class EagerLoadingApiTestCase(ConstantQueriesMixin):
+    """
+    Mixin for API tests of endpoints which load the relations of their serializer together with the list.
+    """
+
+    def get_list(self):
+        request = self.user.get(self.get_url(self.list_url))
+        self.assertStatus(request, status.HTTP_200_OK)
+
+    def test_get_list_query_count(self):
+        """
+        Test that the number of queries for the list doesn't grow with the number of objects.
+        """
+        set_current_user(self.user_obj)
+        self.assertConstantQueries(
+            self.get_list,
+            lambda size: self._create_object(with_relations=True, size=size),
+        )
+
+
+class FakeRedis(object):
+    """
+    The Redis commands used by the search index, on sets and strings kept in memory.
+    """
+    def __init__(self):
+        self.data = {}
+
+    def sadd(self, key, *values):
+        self.data.setdefault(key, set()).update(values)
+
+    def srem(self, key, *values):
+        members = self.data.get(key, set())
+        members.difference_update(values)
+        if not members:
+            self.data.pop(key, None)
+
+    def smembers(self, key):
+        return set(self.data.get(key, set()))
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    def exists(self, key):
+        return key in self.data
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def rename(self, src, dst):
+        if src not in self.data:
+            raise ResponseError('no such key')
+        self.data[dst] = self.data.pop(src)
+
+
 def get_url_with_query(name, params={}, *args, **kwargs):
     return '%s?%s' % (reverse(name, *args, **kwargs), urlencode(params))
 
@@ -4,6 +4,11 @@ from .models import LilyUser, Team
 
 
 class LilyUserMapping(BaseMapping):
+    batch_prefetch_related = (
+        'groups',
+        'teams',
+    )
+
     @classmethod
     def get_model(cls):
         return LilyUser
@@ -72,7 +77,8 @@ class LilyUserMapping(BaseMapping):
             'profile_picture': obj.profile_picture,
             'email': obj.email,
             'is_active': obj.is_active,
-            'is_admin': obj.is_admin,
+            # Same as LilyUser.is_admin, but with the prefetched groups.
+            'is_admin': obj.is_superuser or any(group.name == 'account_admin' for group in obj.groups.all()),
             'phone_number': obj.phone_number,
             'internal_number': obj.internal_number,
             'teams': [{
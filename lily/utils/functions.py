@@ -11,9 +11,12 @@ from django import forms
 from django.conf import settings
 from phonenumbers import geocoder
 import pycountry
+import redis
 from requests_futures.sessions import FuturesSession
 from lily.tenant.middleware import get_current_user
 
+_redis_client = None
+
 
 def autostrip(cls):
     """
@@ -410,3 +413,15 @@ def get_phone_number_without_country_code(phone_number):
         else:
             number_in_national_format = phone_number
     return number_in_national_format
+
+
+def get_redis_client():
+    """
+    Return the Redis client shared by everything in this process that keeps state in Redis.
+    """
+    global _redis_client
+
+    if _redis_client is None:
+        _redis_client = redis.StrictRedis.from_url(settings.REDIS_URL)
+
+    return _redis_client
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tenant', '0008_auto_20180822_1308'),
+        ('accounts', '0021_auto_20180822_1303'),
+        ('contacts', '0016_auto_20171121_1549'),
+        ('utils', '0020_auto_20180822_1308'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PhoneNumberLookup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.CharField(max_length=40)),
+                ('account', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='accounts.Account')),
+                ('contact', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='contacts.Contact')),
+                ('phone_number', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='utils.PhoneNumber')),
+                ('tenant', models.ForeignKey(blank=True, on_delete=django.db.models.deletion.CASCADE, to='tenant.Tenant')),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='phonenumberlookup',
+            index_together=set([('tenant', 'number')]),
+        ),
+    ]
@@ -24,7 +24,52 @@ class TimeStampedModel(models.Model):
         abstract = True
 
 
-class DeletedMixin(TimeStampedModel):
+class ChangeTrackingMixin(models.Model):
+    """
+    Keeps the values of the fields as loaded from the database, so it's known which fields a save changes.
+    """
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(ChangeTrackingMixin, cls).from_db(db, field_names, values)
+        instance._loaded_values = {
+            field_name: value for field_name, value in zip(field_names, values) if value is not models.DEFERRED
+        }
+        return instance
+
+    def get_changed_fields(self):
+        """
+        Return the names of the fields which differ from the values loaded from the database.
+
+        Returns:
+            set of field names or None for instances which weren't loaded from the database
+        """
+        loaded_values = getattr(self, '_loaded_values', None)
+        if loaded_values is None:
+            return None
+
+        return set(
+            field.name for field in self._meta.concrete_fields
+            if field.attname in loaded_values and getattr(self, field.attname) != loaded_values[field.attname]
+        )
+
+    def save(self, **kwargs):
+        super(ChangeTrackingMixin, self).save(**kwargs)
+
+        # The saved values are the values in the database from now on.
+        update_fields = kwargs.get('update_fields')
+        deferred_fields = self.get_deferred_fields()
+        loaded_values = getattr(self, '_loaded_values', {})
+        for field in self._meta.concrete_fields:
+            if field.attname in deferred_fields or (update_fields and field.name not in update_fields):
+                continue
+            loaded_values[field.attname] = getattr(self, field.attname)
+        self._loaded_values = loaded_values
+
+    class Meta:
+        abstract = True
+
+
+class DeletedMixin(ChangeTrackingMixin, TimeStampedModel):
     """
     Deleted model, flags when an instance is deleted.
     """
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
 from lily.tenant.models import TenantMixin
@@ -51,6 +52,25 @@ class PhoneNumber(TenantMixin):
         verbose_name_plural = _('phone numbers')
 
 
+class PhoneNumberLookup(TenantMixin):
+    """
+    Normalized phone numbers of accounts and contacts, to find the caller of a phone number with a single query.
+
+    The rows of a phone number are rebuilt by update_phone_number_lookup when the number or its links change.
+    """
+    number = models.CharField(max_length=40)
+    phone_number = models.ForeignKey(PhoneNumber, on_delete=models.CASCADE, related_name='+')
+    account = models.ForeignKey('accounts.Account', null=True, on_delete=models.CASCADE, related_name='+')
+    contact = models.ForeignKey('contacts.Contact', null=True, on_delete=models.CASCADE, related_name='+')
+
+    def __unicode__(self):
+        return self.number
+
+    class Meta:
+        app_label = 'utils'
+        index_together = ('tenant', 'number')
+
+
 class Address(TenantMixin):
     """
     Address model, has most default fields for an address and fixed preset values for type. In
@@ -155,3 +175,33 @@ class Webhook(TenantMixin):
 
     class Meta:
         app_label = 'utils'
+
+
+class WebhookEvent(TenantMixin):
+    """
+    An event waiting to be delivered to a webhook.
+
+    Events are stored in the same transaction as the change that caused them and delivered by a task afterwards,
+    so a request never waits for the endpoint of the webhook.
+    """
+    PENDING_STATUS, DELIVERED_STATUS, FAILED_STATUS = range(3)
+    STATUS_CHOICES = (
+        (PENDING_STATUS, _('Pending')),
+        (DELIVERED_STATUS, _('Delivered')),
+        (FAILED_STATUS, _('Failed')),
+    )
+
+    webhook = models.ForeignKey(Webhook, on_delete=models.CASCADE, related_name='events')
+    data = models.TextField()
+    status = models.PositiveSmallIntegerField(choices=STATUS_CHOICES, default=PENDING_STATUS)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __unicode__(self):
+        return u'%s (%s)' % (self.webhook, self.get_status_display())
+
+    class Meta:
+        app_label = 'utils'
+        index_together = ('status', 'next_attempt')
@@ -0,0 +1,34 @@
+from django.db.models.signals import m2m_changed, post_save
+from django.dispatch import receiver
+
+from lily.accounts.models import Account
+from lily.contacts.models import Contact
+from lily.search.functions import update_phone_number_lookup
+from lily.utils.models.models import PhoneNumber
+
+
+@receiver(post_save, sender=PhoneNumber)
+def post_save_phone_number(sender, instance, **kwargs):
+    """
+    Keep the lookup of the phone number up to date with its (changed) number.
+    """
+    update_phone_number_lookup([instance.pk])
+
+
+@receiver(m2m_changed, sender=Account.phone_numbers.through)
+@receiver(m2m_changed, sender=Contact.phone_numbers.through)
+def m2m_changed_phone_numbers(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Keep the lookup of phone numbers up to date with the accounts and contacts they're linked to.
+    """
+    if reverse:
+        # The phone number itself is the instance.
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            update_phone_number_lookup([instance.pk])
+    elif action == 'pre_clear':
+        # The cleared phone numbers are unknown after the clear, so remember them.
+        instance._cleared_phone_number_ids = list(instance.phone_numbers.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        update_phone_number_lookup(getattr(instance, '_cleared_phone_number_ids', []))
+    elif action in ('post_add', 'post_remove'):
+        update_phone_number_lookup(pk_set)
@@ -3,6 +3,8 @@ import logging
 from celery.task import task
 from django.core.management import call_command
 
+from .webhooks import delete_delivered_webhook_events, process_webhook_events, schedule_due_webhook_deliveries
+
 
 logger = logging.getLogger(__name__)
 
@@ -25,3 +27,24 @@ def clear_sessions_scheduler():
     Call the Django provided management command to clear expired sessions.
     """
     call_command('clearsessions', interactive=False)
+
+
+@task(name='deliver_webhook_events', logger=logger)
+def deliver_webhook_events(webhook_id):
+    """
+    Deliver the events stored for the webhook.
+    """
+    delivered = process_webhook_events(webhook_id)
+
+    logger.info('Delivered %s events to webhook %s' % (delivered, webhook_id))
+
+
+@task(name='deliver_webhook_events_scheduler', logger=logger)
+def deliver_webhook_events_scheduler():
+    """
+    Schedule the deliveries of events which are due and delete the old delivered events.
+    """
+    scheduled = schedule_due_webhook_deliveries()
+    delete_delivered_webhook_events()
+
+    logger.info('Scheduled the delivery of %s webhooks' % scheduled)
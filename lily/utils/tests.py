@@ -1,6 +1,17 @@
-from django.test import TestCase
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.test import TestCase, override_settings
 from django.http.request import HttpRequest
+from django.utils import timezone
+from mock import patch
+
+from lily.tenant.factories import TenantFactory
+from lily.utils.models.factories import WebhookFactory
+from lily.utils.models.models import WebhookEvent
 from lily.utils.request import is_external_referer
+from lily.utils.webhooks import send_webhook_events
 
 
 class UtilTests(TestCase):
@@ -15,3 +26,41 @@ class UtilTests(TestCase):
         request.META['HTTP_REFERER'] = 'app.notlily.com/some-url/'
 
         self.assertTrue(is_external_referer(request))
+
+
+class WebhookEventTests(TestCase):
+    def setUp(self):
+        tenant = TenantFactory.create()
+        self.webhook = WebhookFactory.create(tenant=tenant)
+        self.event = WebhookEvent.objects.create(webhook=self.webhook, tenant=tenant, data='{}')
+
+    @patch('lily.utils.webhooks.get_webhook_session')
+    def test_delivered_event(self, session_mock):
+        self.assertTrue(send_webhook_events(self.webhook, [self.event]))
+
+        session_mock.return_value.post.assert_called_once_with(
+            self.webhook.url, data='{}', timeout=settings.WEBHOOK_TIMEOUT
+        )
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.status, WebhookEvent.DELIVERED_STATUS)
+        self.assertEqual(self.event.attempts, 1)
+
+    @override_settings(WEBHOOK_RETRY_DELAY=60, WEBHOOK_MAX_ATTEMPTS=3)
+    @patch('lily.utils.webhooks.get_webhook_session')
+    def test_failed_event_is_retried_with_backoff(self, session_mock):
+        session_mock.return_value.post.side_effect = requests.ConnectionError('Connection refused')
+
+        for attempt, delay in [(1, 60), (2, 120)]:
+            before = timezone.now()
+            self.assertFalse(send_webhook_events(self.webhook, [self.event]))
+
+            self.event.refresh_from_db()
+            self.assertEqual(self.event.status, WebhookEvent.PENDING_STATUS)
+            self.assertEqual(self.event.attempts, attempt)
+            self.assertGreaterEqual(self.event.next_attempt, before + timedelta(seconds=delay))
+
+        self.assertFalse(send_webhook_events(self.webhook, [self.event]))
+
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.status, WebhookEvent.FAILED_STATUS)
+        self.assertEqual(self.event.last_error, 'Connection refused')
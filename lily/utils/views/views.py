@@ -154,6 +154,10 @@ class DownloadRedirectView(LoginRequiredMixin, RedirectView):
     }
 
     def get_redirect_url(self, *args, **kwargs):
+        if isinstance(self.instance, EmailAttachment) and not self.instance.fetch():
+            # The attachment isn't downloaded from Gmail yet and couldn't be downloaded now.
+            raise Http404()
+
         field = getattr(self.instance, self.field_name)
         return field.url  # Let the storage backend generate an url for us.
 
@@ -0,0 +1,207 @@
+import logging
+import traceback
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+
+from lily.utils.functions import get_redis_client
+from lily.utils.models.models import Webhook, WebhookEvent
+
+
+logger = logging.getLogger(__name__)
+
+DELIVERY_SCHEDULED_KEY = 'webhook_delivery_scheduled:%s'
+DELIVERY_CONCURRENCY_KEY = 'webhook_delivery_concurrency:%s'
+
+_session = None
+
+
+def get_webhook_session():
+    """
+    Return the session of this process, which keeps the connections to the webhook endpoints alive.
+    """
+    global _session
+
+    if _session is None:
+        adapter = HTTPAdapter(
+            pool_connections=settings.WEBHOOK_POOL_CONNECTIONS,
+            pool_maxsize=settings.WEBHOOK_POOL_MAXSIZE,
+        )
+        _session = requests.Session()
+        _session.mount('http://', adapter)
+        _session.mount('https://', adapter)
+        _session.headers['Content-Type'] = 'application/json'
+
+    return _session
+
+
+def queue_webhook_event(webhook, data):
+    """
+    Store the event for the webhook and schedule its delivery once the current transaction is committed.
+
+    Args:
+        webhook (Webhook): the webhook to deliver the event to.
+        data (str): the JSON encoded event.
+    """
+    WebhookEvent.objects.create(webhook=webhook, tenant_id=webhook.tenant_id, data=data)
+
+    webhook_id = webhook.pk
+    transaction.on_commit(lambda: schedule_webhook_delivery(webhook_id))
+
+
+def schedule_webhook_delivery(webhook_id):
+    """
+    Schedule a task to deliver the events of the webhook if there's none waiting yet.
+    """
+    # Import here to prevent a circular import with the tasks module.
+    from .tasks import deliver_webhook_events
+
+    try:
+        client = get_redis_client()
+
+        if client.set(DELIVERY_SCHEDULED_KEY % webhook_id, 1, nx=True, ex=settings.WEBHOOK_DELIVERY_TIMEOUT):
+            deliver_webhook_events.apply_async(args=[webhook_id], countdown=settings.WEBHOOK_DELIVERY_DELAY)
+    except Exception, e:
+        # The event is stored, so the scheduler delivers it when no task could be scheduled.
+        logger.error(traceback.format_exc(e))
+
+
+def schedule_due_webhook_deliveries():
+    """
+    Schedule the delivery of all webhooks with events which are due, like the retries of failed deliveries.
+
+    Returns:
+        int: number of webhooks with events which are due
+    """
+    webhook_ids = WebhookEvent.objects.filter(
+        status=WebhookEvent.PENDING_STATUS,
+        next_attempt__lte=timezone.now(),
+    ).order_by().values_list('webhook_id', flat=True).distinct()
+
+    webhook_ids = list(webhook_ids)
+    for webhook_id in webhook_ids:
+        schedule_webhook_delivery(webhook_id)
+
+    return len(webhook_ids)
+
+
+def delete_delivered_webhook_events():
+    """
+    Delete the delivered events which are older than the retention period.
+    """
+    WebhookEvent.objects.filter(
+        status=WebhookEvent.DELIVERED_STATUS,
+        created__lt=timezone.now() - timedelta(days=settings.WEBHOOK_EVENT_RETENTION_DAYS),
+    ).delete()
+
+
+def process_webhook_events(webhook_id):
+    """
+    Deliver the events of the webhook which are due, until none are left or the endpoint fails.
+
+    Every webhook has a limited number of deliveries at the same time, so a slow endpoint only slows down its own
+    events.
+
+    Returns:
+        int: number of delivered events
+    """
+    client = get_redis_client()
+    # Events stored from now on schedule a new task.
+    client.delete(DELIVERY_SCHEDULED_KEY % webhook_id)
+
+    concurrency_key = DELIVERY_CONCURRENCY_KEY % webhook_id
+    if client.incr(concurrency_key) > settings.WEBHOOK_CONCURRENCY:
+        # The running deliveries continue until no events are left.
+        client.decr(concurrency_key)
+        return 0
+    client.expire(concurrency_key, settings.WEBHOOK_DELIVERY_TIMEOUT)
+
+    try:
+        webhook = Webhook.objects.filter(pk=webhook_id).first()
+        if not webhook:
+            return 0
+
+        delivered = 0
+        for __ in range(settings.WEBHOOK_MAX_BATCHES):
+            events = claim_webhook_events(webhook)
+            if not events:
+                break
+
+            if not send_webhook_events(webhook, events):
+                # Leave the other events to the scheduler instead of waiting for an endpoint which is down.
+                break
+
+            delivered += len(events)
+
+        return delivered
+    finally:
+        client.decr(concurrency_key)
+
+
+def claim_webhook_events(webhook):
+    """
+    Return the next events of the webhook which are due, claimed so concurrent deliveries don't send them too.
+    """
+    now = timezone.now()
+
+    with transaction.atomic():
+        events = list(WebhookEvent.objects.select_for_update(skip_locked=True).filter(
+            webhook=webhook,
+            status=WebhookEvent.PENDING_STATUS,
+            next_attempt__lte=now,
+        ).order_by('pk')[:settings.WEBHOOK_BATCH_SIZE])
+
+        if events:
+            # Deliver the events again when this delivery never finishes.
+            WebhookEvent.objects.filter(pk__in=[event.pk for event in events]).update(
+                next_attempt=now + timedelta(seconds=settings.WEBHOOK_DELIVERY_TIMEOUT),
+            )
+
+    return events
+
+
+def send_webhook_events(webhook, events):
+    """
+    Post the events to the webhook, a single event as is and multiple events as a list.
+
+    Returns:
+        bool: True if the events were delivered, False if they will be retried or have failed
+    """
+    if len(events) == 1:
+        body = events[0].data
+    else:
+        body = '[%s]' % ','.join(event.data for event in events)
+
+    try:
+        response = get_webhook_session().post(webhook.url, data=body, timeout=settings.WEBHOOK_TIMEOUT)
+        response.raise_for_status()
+    except requests.RequestException, e:
+        logger.warning('Delivering %s events to webhook %s failed: %s' % (len(events), webhook.pk, e))
+
+        now = timezone.now()
+        for event in events:
+            event.attempts += 1
+            event.last_error = str(e)
+
+            if event.attempts >= settings.WEBHOOK_MAX_ATTEMPTS:
+                event.status = WebhookEvent.FAILED_STATUS
+            else:
+                delay = settings.WEBHOOK_RETRY_DELAY * 2 ** (event.attempts - 1)
+                event.next_attempt = now + timedelta(seconds=delay)
+
+            event.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt'])
+
+        return False
+
+    WebhookEvent.objects.filter(pk__in=[event.pk for event in events]).update(
+        status=WebhookEvent.DELIVERED_STATUS,
+        attempts=F('attempts') + 1,
+        last_error='',
+    )
+
+    return True